@@ -1,19 +1,24 @@
-import os
 import re
 from datetime import datetime, timedelta, timezone
 
 from api_alpha.utils.logging_mixin import RNBLoggingMixin
 from api_alpha.utils.rnb_doc import rnb_doc
 from batid.models import City
+from batid.services.bdg_diff import write_diff
+from batid.utils.copy_stream import ConcurrencyLimit, CopyStream
 from dateutil.relativedelta import relativedelta  # type: ignore
 from django.conf import settings
 from django.db import connection
+from django.db.models import BooleanField, ExpressionWrapper, Q
 from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
 from django.utils.dateparse import parse_datetime
 from django.utils.html import escape
 from psycopg2 import sql
 from rest_framework.views import APIView
 
+# diff exports running in this process, see settings.DIFF_VIEW_MAX_CONCURRENT_EXPORTS
+diff_exports_limit = ConcurrencyLimit("DIFF_VIEW_MAX_CONCURRENT_EXPORTS")
+
 
 def get_datetime_months_ago(months: int) -> datetime:
     return datetime.now(timezone.utc) - relativedelta(days=months * 30)
@@ -104,26 +109,32 @@ class DiffView(RNBLoggingMixin, APIView):
 
         # Optional insee_code filter
         insee_code = request.GET.get("insee_code", None)
-        city_shape_wkt = None
 
         if insee_code:
             escaped_insee_code = escape(insee_code)
             try:
-                city = City.objects.get(code_insee=insee_code)
+                # the city is filtered on its subdivided shape, its shape is not loaded
+                city = (
+                    City.objects.only("code_insee")
+                    .annotate(
+                        has_shape=ExpressionWrapper(
+                            Q(shape__isnull=False), output_field=BooleanField()
+                        )
+                    )
+                    .get(code_insee=insee_code)
+                )
             except City.DoesNotExist:
                 return HttpResponse(
                     f"Le code INSEE '{escaped_insee_code}' n'a pas été trouvé",
                     status=404,
                 )
 
-            if city.shape is None:
+            if not city.has_shape:
                 return HttpResponse(
                     f"Erreur interne : la géométrie de la commune '{escaped_insee_code}' est absente",
                     status=500,
                 )
 
-            city_shape_wkt = city.shape.wkt
-
         local_statement_timeout = settings.DIFF_VIEW_POSTGRES_STATEMENT_TIMEOUT
         with connection.cursor() as cursor:
             cursor.execute(
@@ -136,138 +147,39 @@ class DiffView(RNBLoggingMixin, APIView):
             cursor.execute(most_recent_modification_query)
             most_recent_modification = cursor.fetchone()[0]
 
-        # file descriptors r, w for reading and writing
-        rfd, wfd = os.pipe()
-        # the process is forked
-        # would it be possible to avoid creating a new process
-        # and keep the streaming feature?
-        # https://stackoverflow.com/questions/78998534/stream-data-from-postgres-to-http-request-using-django-streaminghttpresponse?noredirect=1#comment139290268_78998534
-        processid = os.fork()
-
-        if processid:
-            # This is the parent process
-            # the parent will only read data coming from the child process, we can close w
-            os.close(wfd)
-            # data coming from the child process arrives here
-            r = os.fdopen(rfd)
-            if insee_code:
-                filename = f"diff_{insee_code}_{since.isoformat()}_{most_recent_modification.isoformat()}.csv"
-            else:
-                filename = f"diff_{since.isoformat()}_{most_recent_modification.isoformat()}.csv"
-            return StreamingHttpResponse(
-                r,
-                content_type="text/csv",
-                headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        if not diff_exports_limit.acquire():
+            return HttpResponse(
+                "Too many diff exports are in progress, please retry in a few minutes",
+                status=429,
             )
-        else:
-            # This is the child process
-            # the child will only write data, we can close r
-            os.close(rfd)
-            w = os.fdopen(wfd, "w")
-
-            # Abandon the inherited database connection without closing it
-            # (the parent process still needs it). Setting connection to None
-            # forces Django to create a new connection for this child process.
-            connection.connection = None
-
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "SET statement_timeout = %(statement_timeout)s;",
-                    {"statement_timeout": local_statement_timeout},
-                )
-                start_ts = since
-                first_query = True
-
-                while start_ts < most_recent_modification:
-                    end_ts = start_ts + timedelta(days=1)
-
-                    spatial_filter = ""
-                    if city_shape_wkt:
-                        spatial_filter = " AND ST_Intersects(bb.shape, ST_GeomFromText({city_shape}, 4326))"
 
-                    raw_sql = (
-                        """
-                        COPY (
-                            select
-                            CASE
-                                WHEN event_type = 'delete' THEN 'deactivate'
-                                WHEN event_type = 'deactivation' THEN 'deactivate'
-                                WHEN event_type = 'update' THEN 'update'
-                                WHEN event_type = 'split' and not bb.is_active THEN 'deactivate'
-                                WHEN event_type = 'split' and bb.is_active THEN 'create'
-                                WHEN event_type = 'merge' and not bb.is_active THEN 'deactivate'
-                                WHEN event_type = 'merge' and bb.is_active THEN 'create'
-                                WHEN event_type = 'reactivation' THEN 'reactivate'
-                                WHEN event_type = 'creation' THEN 'create'
-                                WHEN event_type = 'revert_creation' THEN 'deactivate'
-                                WHEN event_type = 'revert_update' THEN 'update'
-                                WHEN event_type = 'revert_merge' and not bb.is_active THEN 'deactivate'
-                                WHEN event_type = 'revert_merge' and bb.is_active THEN 'reactivate'
-                                WHEN event_type = 'revert_split' and not bb.is_active THEN 'deactivate'
-                                WHEN event_type = 'revert_split' and bb.is_active THEN 'reactivate'
-                                ELSE CONCAT('unhandled_event_type_', event_type)
-                            END as action,
-                            rnb_id,
-                            status,
-                            bb.is_active::int,
-                            sys_period,
-                            ST_AsEWKT(point) as point,
-                            ST_AsEWKT(shape) as shape,
-                            to_json(addresses_id) as addresses_id,
-                            COALESCE(ext_ids, '[]'::jsonb) as ext_ids,
-                            parent_buildings,
-                            event_id,
-                            event_type,
-                            COALESCE(u.username, 'RNB') as username,
-                            (
-                                SELECT COALESCE(json_agg(
-                                    json_build_object(
-                                        'id', mu.id,
-                                        'username', mu.username,
-                                        'organization_name', mu_org.name,
-                                        'organization_short_name', mu_org.short_name
-                                    ) ORDER BY mu.id
-                                ), '[]'::json)
-                                FROM auth_user mu
-                                LEFT JOIN LATERAL (
-                                    SELECT org.name, org.short_name
-                                    FROM batid_userprofile up
-                                    JOIN batid_organization org ON up.organization_id = org.id
-                                    WHERE up.user_id = mu.id
-                                    LIMIT 1
-                                ) AS mu_org ON TRUE
-                                WHERE mu.id = ANY(bb.validated_by)
-                            ) as validated_by
-                            FROM batid_building_with_history bb
-                            LEFT JOIN auth_user u on u.id = bb.event_user_id
-                            where lower(sys_period) > {start}::timestamp with time zone and lower(sys_period) <= {end}::timestamp with time zone"""
-                        + spatial_filter  # nosec B608: spatial_filter comes from database (City.shape.wkt), not user input, and is escaped via sql.Literal() below
-                        + """
-                            order by lower(sys_period), is_active, rnb_id
-                        ) TO STDOUT WITH CSV
-                        """
-                    )
-
-                    if first_query:
-                        raw_sql = raw_sql + " HEADER"
-                        first_query = False
-
-                    start_literal = start_ts.isoformat()
-                    end_literal = end_ts.isoformat()
+        def copy_diff(cursor, w):
+            cursor.execute(
+                "SET statement_timeout = %(statement_timeout)s;",
+                {"statement_timeout": local_statement_timeout},
+            )
+            # the closed days come from their precomputed segments,
+            # the others are queried one day at a time
+            write_diff(
+                cursor,
+                w,
+                since,
+                most_recent_modification,
+                insee_code=insee_code,
+            )
 
-                    format_args = {
-                        "start": sql.Literal(start_literal),
-                        "end": sql.Literal(end_literal),
-                    }
-                    if city_shape_wkt:
-                        format_args["city_shape"] = sql.Literal(city_shape_wkt)
+        # the queries run in a thread with its own database connection,
+        # they are paused while the client is slow to read the response
+        stream = CopyStream(copy_diff, on_close=diff_exports_limit.release)
 
-                    sql_query = sql.SQL(raw_sql).format(**format_args)
-                    # the data coming from the query is streamed to the file descriptor w
-                    # and will be received by the parent process as a stream
-                    cursor.copy_expert(sql_query, w)
-                    start_ts = end_ts
-            connection.close()
-            w.close()
-            # the child process is terminated
-            os._exit(0)
+        if insee_code:
+            filename = f"diff_{insee_code}_{since.isoformat()}_{most_recent_modification.isoformat()}.csv"
+        else:
+            filename = (
+                f"diff_{since.isoformat()}_{most_recent_modification.isoformat()}.csv"
+            )
+        return StreamingHttpResponse(
+            stream,
+            content_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
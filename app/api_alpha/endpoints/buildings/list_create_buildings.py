@@ -3,13 +3,18 @@ from typing import Any, cast
 from api_alpha.exceptions import BadRequest, ServiceUnavailable
 from api_alpha.pagination import BuildingListingCursorPagination, OGCApiPagination
 from api_alpha.permissions import ReadOnly, RNBContributorPermission
+from api_alpha.serializers.building_list import (
+    buildings_data,
+    buildings_feature_collection,
+)
 from api_alpha.serializers.serializers import (
     BuildingCreateSerializer,
-    BuildingGeoJSONSerializer,
     BuildingSerializer,
     ListBuildingQuerySerializer,
 )
+from api_alpha.services import add_contribution_addresses
 from api_alpha.utils.logging_mixin import RNBLoggingMixin
+from api_alpha.utils.renderers import ORJSONRenderer
 from api_alpha.utils.rnb_doc import get_status_html_list, get_status_list, rnb_doc
 from batid.exceptions import (
     BANAPIDown,
@@ -18,7 +23,8 @@ from batid.exceptions import (
     InvalidOperation,
 )
 from batid.list_bdg import list_bdgs
-from batid.models import Building, Contribution, Trophy
+from batid.models import Building, Contribution
+from batid.tasks import award_trophies
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import GEOSGeometry
@@ -32,6 +38,7 @@ from rest_framework.views import APIView
 
 class ListCreateBuildings(RNBLoggingMixin, APIView):
     permission_classes = [ReadOnly | RNBContributorPermission]
+    renderer_classes = [ORJSONRenderer]
 
     @rnb_doc(
         {
@@ -183,33 +190,32 @@ class ListCreateBuildings(RNBLoggingMixin, APIView):
         with_plots = True if with_plots_param == "1" else False
         query_params["with_plots"] = with_plots
 
+        # get the "format" query parameter
+        format_param = request.query_params.get("format", "json").lower()
+
         # add user to query params
         query_params["user"] = request.user
-        buildings = list_bdgs(query_params)
+        buildings = list_bdgs(
+            query_params,
+            projection="geojson" if format_param == "geojson" else "building",
+        )
 
         # paginate
 
-        # get the "format" query parameter
-        format_param = request.query_params.get("format", "json").lower()
-
         # Mypy annotations
         paginator: OGCApiPagination | BuildingListingCursorPagination
-        serializer: BuildingGeoJSONSerializer | BuildingSerializer
 
+        # the pages are serialized without the DRF serializers machinery (same output)
         if format_param == "geojson":
             paginator = OGCApiPagination()
             paginated_buildings = paginator.paginate_queryset(buildings, request)
-            serializer = BuildingGeoJSONSerializer(
-                paginated_buildings, with_plots=with_plots, many=True
-            )
+            data = buildings_feature_collection(paginated_buildings, with_plots)
         else:
             paginator = BuildingListingCursorPagination()
             paginated_buildings = paginator.paginate_queryset(buildings, request)
-            serializer = BuildingSerializer(
-                paginated_buildings, with_plots=with_plots, many=True
-            )
+            data = buildings_data(paginated_buildings, with_plots)
 
-        return paginator.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(data)
 
     @rnb_doc(
         {
@@ -298,6 +304,8 @@ class ListCreateBuildings(RNBLoggingMixin, APIView):
         # POST requires RNBContributorPermission, so the user is always authenticated
         user = cast(User, request.user)
 
+        add_contribution_addresses(data["addresses_cle_interop"])
+
         with transaction.atomic():
             # create a contribution
             contribution = Contribution(
@@ -345,8 +353,8 @@ class ListCreateBuildings(RNBLoggingMixin, APIView):
 
         output_serializer = BuildingSerializer(created_building, with_plots=True)
         response_data = dict(output_serializer.data)
-        # a validation may unlock new trophies; they are awarded in the database but
+        # a validation may unlock new trophies; they are awarded asynchronously and
         # not returned here. The user retrieves them via the user trophies endpoint.
         if data.get("is_valid"):
-            Trophy.check_and_award_all(user)
+            transaction.on_commit(lambda: award_trophies.delay(user.id))
         return Response(response_data, status=http_status.HTTP_201_CREATED)
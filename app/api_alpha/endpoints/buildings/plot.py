@@ -76,7 +76,7 @@ class BuildingPlotView(RNBLoggingMixin, APIView):
         except PlotUnknown:
             raise NotFound("Plot unknown")
 
-        paginator = BuildingCursorPagination()
+        paginator = BuildingCursorPagination(ordering=("-bdg_cover_ratio", "rnb_id"))
         paginated_bdgs = paginator.paginate_queryset(bdgs, request)
         serializer = BuildingPlotSerializer(paginated_bdgs, many=True)
 
@@ -4,12 +4,11 @@ from api_alpha.apps import LiteralStr
 from api_alpha.exceptions import BadRequest, ServiceUnavailable
 from api_alpha.permissions import ReadOnly, RNBContributorPermission
 from api_alpha.serializers.building_history import BuildingHistorySerializer
-from api_alpha.serializers.serializers import (
-    BuildingGeoJSONSerializer,
-    BuildingSerializer,
-    BuildingUpdateSerializer,
-)
+from api_alpha.serializers.building_list import building_data, building_feature
+from api_alpha.serializers.serializers import BuildingUpdateSerializer
+from api_alpha.services import add_contribution_addresses
 from api_alpha.utils.logging_mixin import RNBLoggingMixin
+from api_alpha.utils.renderers import ORJSONRenderer
 from api_alpha.utils.rnb_doc import get_status_list, rnb_doc
 from batid.exceptions import (
     BANAPIDown,
@@ -18,9 +17,10 @@ from batid.exceptions import (
     InvalidOperation,
 )
 from batid.list_bdg import list_bdgs
-from batid.models import Building, Contribution, EventAnnotation, Trophy
+from batid.models import Building, Contribution, EventAnnotation
 from batid.services.bdg_history import get_bdg_history
 from batid.services.rnb_id import clean_rnb_id
+from batid.tasks import award_trophies
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import transaction
 from django.shortcuts import get_object_or_404
@@ -72,6 +72,7 @@ class SingleBuildingHistory(RNBLoggingMixin, APIView):
 
 class SingleBuilding(RNBLoggingMixin, APIView):
     permission_classes = [ReadOnly | RNBContributorPermission]
+    renderer_classes = [ORJSONRenderer]
 
     @rnb_doc(
         {
@@ -129,21 +130,20 @@ class SingleBuilding(RNBLoggingMixin, APIView):
         with_plots_param = request.query_params.get("withPlots", False)
         with_plots = with_plots_param == "1"
 
+        # get the "format" query parameter
+        format_param = request.query_params.get("format", "json").lower()
+
         qs = list_bdgs(
             {"user": request.user, "status": "all", "with_plots": with_plots},
             only_active=False,
+            projection="geojson" if format_param == "geojson" else "building",
         )
         building = get_object_or_404(qs, rnb_id=clean_rnb_id(rnb_id))
 
-        # get the "format" query parameter
-        format_param = request.query_params.get("format", "json").lower()
-
         if format_param == "geojson":
-            serializer = BuildingGeoJSONSerializer(building, with_plots=with_plots)
-        else:
-            serializer = BuildingSerializer(building, with_plots=with_plots)
+            return Response(building_feature(building, with_plots))
 
-        return Response(serializer.data)
+        return Response(building_data(building, with_plots))
 
     @rnb_doc(
         {
@@ -269,6 +269,9 @@ Permet à l'utilisateur de valider l'état actuel du bâtiment (`True`) ou de re
         data = serializer.data
         user = request.user
 
+        if isinstance(data.get("addresses_cle_interop"), list):
+            add_contribution_addresses(data["addresses_cle_interop"])
+
         with transaction.atomic():
             contribution = Contribution(
                 rnb_id=rnb_id,
@@ -321,10 +324,10 @@ Permet à l'utilisateur de valider l'état actuel du bâtiment (`True`) ou de re
             except InvalidOperation as e:
                 raise BadRequest(detail=e.api_message_with_details())
 
-        # a validation may unlock new trophies; they are awarded in the database but
+        # a validation may unlock new trophies; they are awarded asynchronously and
         # not returned here. The user retrieves them via the user trophies endpoint.
         if data.get("is_valid"):
-            Trophy.check_and_award_all(user)
+            transaction.on_commit(lambda: award_trophies.delay(user.id))
 
         # request is successful, no content to send back
         return Response(status=http_status.HTTP_204_NO_CONTENT)
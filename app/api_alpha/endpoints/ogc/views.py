@@ -1,11 +1,13 @@
 from typing import Any
 
 from api_alpha.pagination import OGCApiPagination
-from api_alpha.serializers.serializers import (
-    BuildingGeoJSONSerializer,
-    OgcBuildingQuerySerializer,
+from api_alpha.serializers.building_list import (
+    building_feature,
+    buildings_feature_collection,
 )
+from api_alpha.serializers.serializers import OgcBuildingQuerySerializer
 from api_alpha.utils.logging_mixin import RNBLoggingMixin
+from api_alpha.utils.renderers import ORJSONRenderer
 from api_alpha.utils.rnb_doc import build_schema_ogc_endpoints, rnb_doc
 from batid.list_bdg import list_bdgs
 from batid.services.rnb_id import clean_rnb_id
@@ -21,7 +23,7 @@ class OpenAPIRenderer(JSONRenderer):
     media_type = "application/vnd.oai.openapi+json;version=3.0"
 
 
-class GeoJSONRenderer(JSONRenderer):
+class GeoJSONRenderer(ORJSONRenderer):
     media_type = "application/geo+json"
 
 
@@ -246,7 +248,7 @@ class OGCBuildingsCollectionView(OGCAPIBaseView):
 
 class OGCBuildingItemsView(OGCAPIBaseView):
 
-    renderer_classes = [GeoJSONRenderer, JSONRenderer]
+    renderer_classes = [GeoJSONRenderer, ORJSONRenderer]
 
     @rnb_doc(
         {
@@ -342,20 +344,18 @@ class OGCBuildingItemsView(OGCAPIBaseView):
         query_params["with_plots"] = with_plots
 
         query_params["user"] = request.user
-        buildings = list_bdgs(query_params)
+        buildings = list_bdgs(query_params, projection="geojson")
 
         paginator = OGCApiPagination()
         paginated_buildings = paginator.paginate_queryset(buildings, request)
-        serializer = BuildingGeoJSONSerializer(
-            paginated_buildings, with_plots=with_plots, many=True
-        )
+        data = buildings_feature_collection(paginated_buildings, with_plots)
 
-        return paginator.get_paginated_response(serializer.data)
+        return paginator.get_paginated_response(data)
 
 
 class OGCSingleBuildingItemView(OGCAPIBaseView):
 
-    renderer_classes = [GeoJSONRenderer, JSONRenderer]
+    renderer_classes = [GeoJSONRenderer, ORJSONRenderer]
 
     @rnb_doc(
         {
@@ -397,12 +397,11 @@ class OGCSingleBuildingItemView(OGCAPIBaseView):
         qs = list_bdgs(
             {"user": request.user, "status": "all", "with_plots": with_plots},
             only_active=False,
+            projection="geojson",
         )
         building = get_object_or_404(qs, rnb_id=clean_rnb_id(featureId))
 
-        serializer = BuildingGeoJSONSerializer(building, with_plots=with_plots)
-
-        return Response(serializer.data)
+        return Response(building_feature(building, with_plots))
 
 
 class OGCOpenAPIDefinitionView(OGCAPIBaseView):
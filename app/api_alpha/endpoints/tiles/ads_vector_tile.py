@@ -3,5 +3,7 @@ from batid.services.vector_tiles import ads_tiles_sql
 
 
 class ADSVectorTileView(BaseVectorTileView):
+    cache_layer = "ads"
+
     def build_sql(self, request, tile_params):
         return ads_tiles_sql(tile_params)
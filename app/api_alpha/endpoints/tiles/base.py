@@ -1,8 +1,14 @@
 from abc import abstractmethod
+from typing import Optional
 
 from batid.services.vector_tiles import TileParams
+from batid.services.vector_tiles.archive import get_archived_tile
+from batid.services.vector_tiles.cache import area_edited_since, get_or_build_tile
+from django.conf import settings
 from django.db import connection
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework.request import Request
 from rest_framework.views import APIView
 
@@ -11,16 +17,67 @@ class BaseVectorTileView(APIView):
     min_zoom = 16
     max_zoom = 30
     content_type = "application/vnd.mapbox-vector-tile"
+    # name of the layer in the tiles cache, the tiles are not cached if None
+    # (nor when settings.TILES_CACHE_ENABLED is False)
+    cache_layer: Optional[str] = None
+    # in seconds, None means the cached tiles only expire when invalidated
+    cache_timeout: Optional[int] = 3600
+    # name of the pre-rendered archive of the layer, the tiles are built from the database if None
+    archive_layer: Optional[str] = None
 
     def get(self, request, x, y, z):
         z = int(z)
-        if z < self.min_zoom or z > self.max_zoom:
+        if z < self.get_min_zoom(request) or z > self.max_zoom:
             return HttpResponse(status=204)
 
         tile_params = self._url_params_to_tile(x, y, z)
+
+        if self.cache_layer is None or not settings.TILES_CACHE_ENABLED:
+            tile = self._build_tile(request, tile_params)
+            return HttpResponse(tile, content_type=self.content_type)
+
+        cached = get_or_build_tile(
+            self.cache_layer,
+            tile_params,
+            self.cache_variant(request),
+            lambda: self._build_tile(request, tile_params),
+            self.cache_timeout,
+        )
+        last_modified = int(cached["last_modified"])
+
+        # 304 if the client already has this version of the tile
+        response = get_conditional_response(
+            request, etag=cached["etag"], last_modified=last_modified
+        )
+        if response is None:
+            response = HttpResponse(cached["tile"], content_type=self.content_type)
+
+        response["ETag"] = cached["etag"]
+        response["Last-Modified"] = http_date(last_modified)
+        return response
+
+    def get_min_zoom(self, request: Request) -> int:
+        return self.min_zoom
+
+    def cache_variant(self, request: Request) -> str:
+        # query parameters changing the content of the tiles
+        return ""
+
+    def use_archive(self, request: Request) -> bool:
+        # the archive only contains the tiles built with the default query parameters
+        return True
+
+    def _build_tile(self, request: Request, tile_params: TileParams):
+        if self.archive_layer is not None and self.use_archive(request):
+            archived = get_archived_tile(self.archive_layer, tile_params)
+            if archived is not None:
+                tile, rendered_at = archived
+                # the archive is not used where the data has been edited since its rendering
+                if not area_edited_since(self.archive_layer, tile_params, rendered_at):
+                    return tile
+
         sql = self.build_sql(request, tile_params)
-        tile = self._exec_sql(sql)
-        return HttpResponse(tile, content_type=self.content_type)
+        return self._exec_sql(sql)
 
     def _exec_sql(self, sql):
         with connection.cursor() as cursor:
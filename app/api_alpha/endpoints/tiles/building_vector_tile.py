@@ -1,19 +1,40 @@
 from api_alpha.endpoints.tiles.base import BaseVectorTileView
 from api_alpha.utils.parse_boolean import parse_boolean
 from batid.services.vector_tiles import bdgs_tiles_sql
+from batid.services.vector_tiles.building import GENERALIZED_MIN_ZOOM
 
 
-class BuildingsVectorTileView(BaseVectorTileView):
+class BaseBuildingsVectorTileView(BaseVectorTileView):
+    # the buildings tiles are invalidated when a building is edited
+    cache_timeout = 24 * 3600
+
+    def only_active_and_real(self, request) -> bool:
+        return parse_boolean(request.GET.get("only_active_and_real", "true"))
+
+    def get_min_zoom(self, request):
+        # the lower zooms are drawn from the generalization, which only has active and real buildings
+        if self.only_active_and_real(request):
+            return GENERALIZED_MIN_ZOOM
+        return self.min_zoom
+
+    def cache_variant(self, request):
+        return f"only_active_and_real={self.only_active_and_real(request)}"
+
+    def use_archive(self, request):
+        return self.only_active_and_real(request)
+
+
+class BuildingsVectorTileView(BaseBuildingsVectorTileView):
+    cache_layer = "buildings"
+    archive_layer = "buildings"
+
     def build_sql(self, request, tile_params):
-        only_active_and_real = parse_boolean(
-            request.GET.get("only_active_and_real", "true")
-        )
-        return bdgs_tiles_sql(tile_params, "point", only_active_and_real)
+        return bdgs_tiles_sql(tile_params, "point", self.only_active_and_real(request))
+
 
+class BuildingsShapeVectorTileView(BaseBuildingsVectorTileView):
+    cache_layer = "shapes"
+    archive_layer = "shapes"
 
-class BuildingsShapeVectorTileView(BaseVectorTileView):
     def build_sql(self, request, tile_params):
-        only_active_and_real = parse_boolean(
-            request.GET.get("only_active_and_real", "true")
-        )
-        return bdgs_tiles_sql(tile_params, "shape", only_active_and_real)
+        return bdgs_tiles_sql(tile_params, "shape", self.only_active_and_real(request))
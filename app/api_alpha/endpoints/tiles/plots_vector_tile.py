@@ -3,5 +3,9 @@ from batid.services.vector_tiles import plots_tiles_sql
 
 
 class PlotsVectorTileView(BaseVectorTileView):
+    cache_layer = "plots"
+    archive_layer = "plots"
+    cache_timeout = 24 * 3600
+
     def build_sql(self, request, tile_params):
         return plots_tiles_sql(tile_params)
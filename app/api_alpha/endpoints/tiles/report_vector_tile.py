@@ -5,6 +5,8 @@ from rest_framework.request import Request
 
 class ReportVectorTileView(BaseVectorTileView):
     min_zoom = 0
+    cache_layer = "reports"
+    cache_timeout = 5 * 60
 
     def build_sql(self, request: Request, tile_params: TileParams) -> str:
         return reports_tiles_sql(tile_params)
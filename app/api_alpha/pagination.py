@@ -1,6 +1,10 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timezone
 
-from django.db.models import BooleanField
+from django.contrib.gis.measure import MeasureBase
+from django.db.models import BooleanField, Q
 from django.db.models.expressions import RawSQL
 from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import BasePagination, CursorPagination
@@ -9,16 +13,33 @@ from rest_framework.utils.urls import replace_query_param
 
 
 class BuildingCursorPagination(BasePagination):
+    """
+    Keyset pagination on an explicit ordering, eg ("distance", "id") or ("-bdg_cover_ratio", "rnb_id").
+
+    The cursor is an opaque token containing the ordering values of the last (or first, when going
+    backward) row of the current page. The next page is fetched by filtering on the rows coming
+    after those values, so every page costs the same whatever its depth.
+    The last field of the ordering must be unique.
+
+    Legacy page number cursors (cursor=N) are still accepted and served with an offset.
+    The links they return are keyset cursors.
+    """
 
     cursor_query_param = "cursor"
+    ordering = ("id",)
 
-    def __init__(self):
+    def __init__(self, ordering=None):
         self.base_url = None
-        self.current_page = None
+
+        if ordering is not None:
+            self.ordering = tuple(ordering)
 
         self.has_next = False
         self.has_previous = False
 
+        self.next_position = None
+        self.previous_position = None
+
         self.page = None
 
         self.page_size = 20
@@ -56,7 +77,7 @@ class BuildingCursorPagination(BasePagination):
     def get_next_link(self):
 
         if self.has_next:
-            next_cursor = str(self.current_page + 1)
+            next_cursor = self.encode_cursor(self.next_position, reverse=False)
             return replace_query_param(
                 self.base_url, self.cursor_query_param, next_cursor
             )
@@ -66,7 +87,7 @@ class BuildingCursorPagination(BasePagination):
     def get_previous_link(self):
 
         if self.has_previous:
-            previous_cursor = str(self.current_page - 1)
+            previous_cursor = self.encode_cursor(self.previous_position, reverse=True)
             return replace_query_param(
                 self.base_url, self.cursor_query_param, previous_cursor
             )
@@ -95,38 +116,124 @@ class BuildingCursorPagination(BasePagination):
         # Get the current URL with all parameters
         self.base_url = request.build_absolute_uri()
 
-        self.current_page = self.get_page(request)
-        if self.current_page is None:
-            self.current_page = 1
+        legacy_page = self.get_legacy_page(request)
+        if legacy_page is not None:
+            return self.paginate_with_offset(queryset, legacy_page)
 
-        offset = (self.current_page - 1) * self.page_size
+        position, reverse = self.decode_cursor(request)
 
-        # If we have an offset cursor then offset the entire page by that amount.
-        # We also always fetch an extra item in order to determine if there is a
+        ordering = self.reversed_ordering() if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, position))
+
+        # We always fetch an extra item in order to determine if there is a
         # page following on from this one.
-        results = queryset[offset : offset + self.page_size + 1]
+        results = list(queryset[: self.page_size + 1])
+        has_following = len(results) > self.page_size
+        page = results[: self.page_size]
 
-        if len(results) > self.page_size:
+        if reverse:
+            # The query ordering was reversed, we put the rows back in the right order.
+            page = list(reversed(page))
             self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
 
-        if self.current_page > 1:
-            self.has_previous = True
+        self.set_positions(page)
 
-        return results[: self.page_size]
+        return page
 
-    def get_page(self, request):
+    def paginate_with_offset(self, queryset, current_page):
+        offset = (current_page - 1) * self.page_size
 
+        results = list(
+            queryset.order_by(*self.ordering)[offset : offset + self.page_size + 1]
+        )
+        page = results[: self.page_size]
+
+        self.has_next = len(results) > self.page_size
+        self.has_previous = current_page > 1
+
+        self.set_positions(page)
+
+        return page
+
+    def set_positions(self, page):
+        if not page:
+            # An empty page can only be reached with a previous link (going backward
+            # from the first row) or a page number past the end. We come back to the start.
+            self.has_next = False
+            self.has_previous = False
+            return
+
+        self.next_position = self.get_position(page[-1])
+        self.previous_position = self.get_position(page[0])
+
+    def get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip("-"))
+            # distance annotations are returned as Distance objects
+            if isinstance(value, MeasureBase):
+                value = value.standard
+            position.append(value)
+        return position
+
+    def reversed_ordering(self):
+        return tuple(
+            field[1:] if field.startswith("-") else f"-{field}"
+            for field in self.ordering
+        )
+
+    @staticmethod
+    def keyset_filter(ordering, position):
+        # (a, b) after (x, y) <=> a after x OR (a = x AND b after y)
+        condition = Q()
+        equal_prefix = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            condition |= equal_prefix & Q(**{f"{name}__{lookup}": value})
+            equal_prefix &= Q(**{name: value})
+        return condition
+
+    def get_legacy_page(self, request):
         request_page = request.query_params.get(self.cursor_query_param)
-        if request_page:
-            try:
-                return int(request_page)
-            except ValueError:
-                return None
+        if request_page and request_page.isdigit():
+            return max(int(request_page), 1)
 
         return None
 
-    def encode_cursor(self, cursor):
-        return b64encode(cursor.encode("ascii")).decode("ascii")
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            cursor = json.loads(
+                urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8")
+            )
+            position = cursor["p"]
+            reverse = bool(cursor.get("r", False))
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError()
+        except (ValueError, KeyError, TypeError, UnicodeError, binascii.Error):
+            # an unreadable cursor brings back to the first page
+            return None, False
+
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        cursor = {"p": position}
+        if reverse:
+            cursor["r"] = 1
+        return urlsafe_b64encode(
+            json.dumps(cursor, separators=(",", ":")).encode("utf-8")
+        ).decode("ascii")
 
 
 class BuildingListingCursorPagination(CursorPagination):
@@ -0,0 +1,153 @@
+"""
+Serialization of the buildings of the read endpoints (/buildings/, single building, OGC items, closest, address).
+
+The DRF serializers (BuildingSerializer, BuildingGeoJSONSerializer, BuildingClosestSerializer)
+go through their fields machinery for each building and each nested address, user and ext_id.
+Those functions build the very same data directly from the buildings and their prefetched
+relations. The DRF serializers remain the reference (see the tests) and are still used
+for the API schema.
+
+The values holding floats (geometries, distances, plots cover ratios) are encoded by the DRF
+encoder, as orjson does not write some floats the same way (eg 5e-05), and passed
+as orjson.Fragment: the data must be rendered by api_alpha.utils.renderers.ORJSONRenderer.
+"""
+
+import json
+
+import orjson
+from api_alpha.serializers.public_user import PublicUserSerializer
+from batid.models import Address, Building
+from rest_framework.renderers import JSONRenderer
+
+_public_user = PublicUserSerializer()
+_drf_encoder_class = JSONRenderer.encoder_class
+
+
+def _str_or_none(value):
+    return None if value is None else str(value)
+
+
+def address_data(address: Address) -> dict:
+    # as AddressSerializer
+    return {
+        "id": _str_or_none(address.id),
+        "ban_id": _str_or_none(address.ban_id),
+        "source": _str_or_none(address.source),
+        "street_number": _str_or_none(address.street_number),
+        "street_rep": _str_or_none(address.street_rep),
+        "street": _str_or_none(address.street),
+        "city_name": _str_or_none(address.city_name),
+        "city_zipcode": _str_or_none(address.city_zipcode),
+        "city_insee_code": _str_or_none(address.city_insee_code),
+    }
+
+
+def ext_id_data(ext_id: dict) -> dict:
+    # as ExtIdSerializer. The created_at dates are stored as strings, they are kept as is
+    return {
+        "id": _str_or_none(ext_id["id"]),
+        "source": _str_or_none(ext_id["source"]),
+        "created_at": ext_id["created_at"] or None,
+        "source_version": _str_or_none(ext_id["source_version"]),
+    }
+
+
+def _point(bdg: Building):
+    return _drf_json(bdg.point_geojson() if bdg.point is not None else None)
+
+
+def _shape(bdg: Building):
+    return _drf_json(bdg.shape_geojson())
+
+
+def _drf_json(value):
+    # the bytes the DRF JSONRenderer writes for this value
+    if value is None:
+        return None
+    return orjson.Fragment(
+        json.dumps(
+            value,
+            cls=_drf_encoder_class,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        )
+    )
+
+
+def _addresses(bdg: Building) -> list:
+    return [address_data(address) for address in bdg.addresses_read_only.all()]
+
+
+def _validated_by(bdg: Building) -> list:
+    return [_public_user.to_representation(u) for u in bdg.validated_by_read_only.all()]
+
+
+def _ext_ids(bdg: Building):
+    if bdg.ext_ids is None:
+        return None
+    return [ext_id_data(ext_id) for ext_id in bdg.ext_ids]
+
+
+def building_data(bdg: Building, with_plots: bool = False) -> dict:
+    # as BuildingSerializer
+    data = {
+        "rnb_id": _str_or_none(bdg.rnb_id),
+        "status": bdg.status,
+        "point": _point(bdg),
+        "shape": _shape(bdg),
+        "addresses": _addresses(bdg),
+        "ext_ids": _ext_ids(bdg),
+        "is_active": bdg.is_active,
+    }
+    if with_plots:
+        data["plots"] = _drf_json(getattr(bdg, "plots", None))
+    data["validated_by"] = _validated_by(bdg)
+
+    return data
+
+
+def buildings_data(bdgs: list[Building], with_plots: bool = False) -> list:
+    return [building_data(bdg, with_plots) for bdg in bdgs]
+
+
+def building_feature(bdg: Building, with_plots: bool = False) -> dict:
+    # as BuildingGeoJSONSerializer
+    properties = {
+        "status": bdg.status,
+        "ext_ids": _ext_ids(bdg),
+        "addresses": _addresses(bdg),
+        "is_active": bdg.is_active,
+    }
+    if with_plots:
+        properties["plots"] = _drf_json(getattr(bdg, "plots", None))
+    properties["validated_by"] = _validated_by(bdg)
+
+    return {
+        "id": _str_or_none(bdg.rnb_id),
+        "type": "Feature",
+        "geometry": _shape(bdg),
+        "properties": properties,
+    }
+
+
+def buildings_feature_collection(bdgs: list[Building], with_plots: bool = False):
+    # as BuildingGeoJSONSerializer(many=True)
+    return {
+        "type": "FeatureCollection",
+        "features": [building_feature(bdg, with_plots) for bdg in bdgs],
+    }
+
+
+def closest_building_data(bdg: Building) -> dict:
+    # as BuildingClosestSerializer
+    return {
+        "rnb_id": _str_or_none(bdg.rnb_id),
+        "distance": _drf_json(bdg.distance.m),
+        "status": bdg.status,
+        "point": _point(bdg),
+        "addresses": _addresses(bdg),
+        "ext_ids": bdg.ext_ids,
+        "shape": _shape(bdg),
+        "validated_by": _validated_by(bdg),
+    }
@@ -1,10 +1,30 @@
 import json
 
+from api_alpha.exceptions import BadRequest, ServiceUnavailable
+from batid.exceptions import BANAPIDown, BANBadResultType, BANUnknownCleInterop
+from batid.models import Address
 from batid.services.ads import can_manage_ads_in_cities, get_cities
 from batid.services.rnb_id import clean_rnb_id
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import GEOSException, GEOSGeometry
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
+
+
+def add_contribution_addresses(addresses_id: list[str]) -> None:
+    """
+    Add the addresses of a contribution missing from our Address table before the contribution
+    transaction is opened: the transaction does not wait for the BAN API.
+    """
+    try:
+        Address.add_addresses_to_db_if_needed(addresses_id)
+    except BANAPIDown:
+        raise ServiceUnavailable(detail="BAN API is currently down")
+    except BANUnknownCleInterop:
+        raise NotFound(detail="Cle d'intéropérabilité not found on the BAN API")
+    except BANBadResultType:
+        raise BadRequest(
+            detail="BAN result has not the expected type (must be 'numero')"
+        )
 
 
 class BuildingADS:
@@ -3,6 +3,7 @@ import uuid
 from unittest import mock
 
 from batid.models import Address, Building, Contribution, SummerChallenge, Trophy
+from batid.tasks import award_trophies
 from batid.tests.factories.users import ContributorUserFactory
 from django.test import override_settings
 from rest_framework.authtoken.models import Token
@@ -328,8 +329,9 @@ class BuildingPostIsValidTest(APITestCase):
         """
         Input: user already has 9 validations, POST a building with `is_valid=True`
         (the 10th validation).
-        Expected: 201 (trophies are no longer returned in the response); the
-        'validateur' level 1 Trophy is awarded in the database.
+        Expected: 201 (trophies are no longer returned in the response); the trophies
+        are evaluated asynchronously and the 'validateur' level 1 Trophy is awarded in
+        the database.
         """
         for _ in range(9):
             SummerChallenge.objects.create(
@@ -339,10 +341,16 @@ class BuildingPostIsValidTest(APITestCase):
                 event_id=uuid.uuid4(),
             )
 
-        r = self._post({**self.data, "is_valid": True})
+        with mock.patch("batid.tasks.award_trophies.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                r = self._post({**self.data, "is_valid": True})
 
         self.assertEqual(r.status_code, 201)
         self.assertNotIn("trophies", r.json())
+        delay.assert_called_once_with(self.user.id)
+        self.assertFalse(Trophy.objects.filter(user=self.user).exists())
+
+        award_trophies(self.user.id)
         self.assertTrue(
             Trophy.objects.filter(
                 user=self.user, trophy_type="validateur", level=1
@@ -366,8 +374,13 @@ class BuildingPostIsValidTest(APITestCase):
                 event_id=uuid.uuid4(),
             )
 
-        r = self._post({**self.data, "is_valid": True})
+        with mock.patch("batid.tasks.award_trophies.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                r = self._post({**self.data, "is_valid": True})
 
         self.assertEqual(r.status_code, 201)
         self.assertNotIn("trophies", r.json())
+        delay.assert_called_once_with(self.user.id)
+
+        self.assertEqual(award_trophies(self.user.id), [])
         self.assertFalse(Trophy.objects.filter(user=self.user).exists())
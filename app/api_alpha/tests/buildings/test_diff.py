@@ -2,11 +2,26 @@ import csv
 import datetime
 import io
 import json
+import threading
 import uuid
 
-from batid.models import Address, Building, City, Organization, UserProfile
+from batid.models import (
+    Address,
+    Building,
+    City,
+    DiffSegment,
+    Organization,
+    UserProfile,
+)
+from batid.services.bdg_diff import (
+    build_day_segments,
+    build_diff_segments,
+    day_start,
+    last_closed_day,
+)
 from django.contrib.auth.models import User
 from django.contrib.gis.geos import GEOSGeometry
+from django.db import connection, transaction
 from django.test import TransactionTestCase, override_settings
 from django.utils.http import urlencode
 
@@ -408,7 +423,7 @@ class DiffTest(TransactionTestCase):
         url = f"/api/alpha/buildings/diff/?{params}"
         r = self.client.get(url)
         self.assertEqual(r.status_code, 200)
-        # Consume the streaming response to ensure the forked child process
+        # Consume the streaming response to ensure the export thread
         # finishes and closes its DB connection before teardown runs flush.
         get_content_from_streaming_response(r)
 
@@ -428,10 +443,33 @@ class DiffTest(TransactionTestCase):
         url = f"/api/alpha/buildings/diff/?{params}"
         r = self.client.get(url)
         self.assertEqual(r.status_code, 200)
-        # Consume the streaming response to ensure the forked child process
+        # Consume the streaming response to ensure the export thread
         # finishes and closes its DB connection before teardown runs flush.
         get_content_from_streaming_response(r)
 
+    @override_settings(DIFF_VIEW_MAX_CONCURRENT_EXPORTS=1)
+    def test_concurrent_exports_limit(self):
+        Building.objects.create(rnb_id="t", event_type="creation")
+        threshold = Building.objects.get(rnb_id="t").sys_period.lower
+
+        params = urlencode({"since": threshold.isoformat()})
+        url = f"/api/alpha/buildings/diff/?{params}"
+
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+
+        # the first export is still in progress
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 429)
+
+        content = get_content_from_streaming_response(first)
+        self.assertIn("rnb_id", content)
+
+        # the first export is over, its slot is released
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+        get_content_from_streaming_response(r)
+
     def test_since_is_invalid(self):
         url = f"/api/alpha/buildings/diff/?since=invalid"
 
@@ -779,7 +817,7 @@ class DiffInseeCodeTest(TransactionTestCase):
         r = self.client.get(url)
 
         self.assertEqual(r.status_code, 200)
-        # Consume the streaming response to ensure the forked child process
+        # Consume the streaming response to ensure the export thread
         # finishes and closes its DB connection before teardown runs flush.
         get_content_from_streaming_response(r)
 
@@ -906,3 +944,141 @@ class DiffInseeCodeTest(TransactionTestCase):
         r = self.client.get(url)
 
         self.assertEqual(r.status_code, 200)
+
+
+class DiffSegmentsTest(TransactionTestCase):
+    def setUp(self):
+        City.objects.create(
+            code_insee="75056",
+            name="Paris",
+            shape=GEOSGeometry(
+                "MULTIPOLYGON(((2.3 48.8, 2.4 48.8, 2.4 48.9, 2.3 48.9, 2.3 48.8)))",
+                srid=4326,
+            ),
+        )
+
+        inside = GEOSGeometry(
+            "MULTIPOLYGON(((2.35 48.85, 2.36 48.85, 2.36 48.86, 2.35 48.86, 2.35 48.85)))",
+            srid=4326,
+        )
+        outside = GEOSGeometry(
+            "MULTIPOLYGON(((5.35 43.29, 5.36 43.29, 5.36 43.30, 5.35 43.30, 5.35 43.29)))",
+            srid=4326,
+        )
+        for rnb_id, shape in [("INSIDE", inside), ("OUTSIDE", outside)]:
+            Building.objects.create(
+                rnb_id=rnb_id,
+                shape=shape,
+                point=shape.point_on_surface,
+                status="constructed",
+                event_type="creation",
+            )
+
+    def get_diff(self, since, insee_code=None):
+        params = {"since": since.isoformat()}
+        if insee_code:
+            params["insee_code"] = insee_code
+        r = self.client.get(f"/api/alpha/buildings/diff/?{urlencode(params)}")
+        self.assertEqual(r.status_code, 200)
+        return get_content_from_streaming_response(r)
+
+    def test_diff_from_segments(self):
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        since = day_start(today - datetime.timedelta(days=1))
+
+        expected = self.get_diff(since)
+        expected_city = self.get_diff(since, "75056")
+        self.assertIn("OUTSIDE", expected)
+        self.assertNotIn("OUTSIDE", expected_city)
+
+        # today is not closed, but we build its segments to serve it from them
+        build_day_segments(today)
+        self.assertEqual(
+            set(DiffSegment.objects.values_list("insee_code", flat=True)),
+            {"", "75056"},
+        )
+
+        # the output is identical
+        self.assertEqual(self.get_diff(since), expected)
+        self.assertEqual(self.get_diff(since, "75056"), expected_city)
+
+        # a row of the day gets closed: the segments of the day are deleted
+        # and the day is queried again
+        bdg = Building.objects.get(rnb_id="INSIDE")
+        bdg.status = "demolished"
+        bdg.event_type = "update"
+        bdg.save()
+
+        self.assertFalse(DiffSegment.objects.filter(day=today).exists())
+        self.assertIn("demolished", self.get_diff(since))
+
+    def test_segments_deleted_on_username_change(self):
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        user = User.objects.create_user(username="editor")
+        Building.objects.create(rnb_id="EDITED", event_type="creation", event_user=user)
+
+        build_day_segments(today)
+        self.assertTrue(
+            DiffSegment.objects.filter(
+                day=today, insee_code="", user_ids__contains=[user.id]
+            ).exists()
+        )
+
+        user.username = "editor_renamed"
+        user.save()
+
+        self.assertFalse(DiffSegment.objects.filter(day=today).exists())
+        since = day_start(today - datetime.timedelta(days=1))
+        self.assertIn("editor_renamed", self.get_diff(since))
+
+    def test_late_commit_is_returned(self):
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        started = threading.Event()
+        release = threading.Event()
+
+        # an import started today, committed after the end of the day
+        def late_import():
+            try:
+                with transaction.atomic():
+                    Building.objects.create(rnb_id="LATE", event_type="creation")
+                    started.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=late_import)
+        thread.start()
+        self.assertTrue(started.wait(10))
+
+        # tomorrow, today is not closed while the import is running
+        tomorrow = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            days=1
+        )
+        self.assertEqual(last_closed_day(tomorrow), today - datetime.timedelta(days=1))
+        build_diff_segments(days=2, now=tomorrow)
+        self.assertFalse(DiffSegment.objects.filter(day=today).exists())
+
+        release.set()
+        thread.join()
+
+        since = day_start(today - datetime.timedelta(days=1))
+        self.assertIn("LATE", self.get_diff(since))
+
+        # once committed, the day is closed and built with the late change
+        self.assertEqual(build_diff_segments(days=2, now=tomorrow), 1)
+        self.assertIn("LATE", self.get_diff(since))
+
+    def test_build_diff_segments(self):
+        old_day = datetime.date.today() - datetime.timedelta(days=400)
+        DiffSegment.objects.create(day=old_day, insee_code="", data=b"")
+
+        count = build_diff_segments(days=3)
+
+        self.assertEqual(count, 3)
+        days = set(DiffSegment.objects.values_list("day", flat=True))
+        self.assertEqual(len(days), 3)
+        self.assertEqual(max(days), last_closed_day())
+        self.assertNotIn(old_day, days)
+
+        # the days already built are skipped
+        self.assertEqual(build_diff_segments(days=3), 0)
@@ -975,3 +975,66 @@ class BuildingsWithPlots(APITestCase):
         self.assertEqual(r.status_code, 200)
         data = r.json()
         self.assertDictEqual(data, expected_wo_plots)
+
+
+class BuildingsQueryCountTest(APITestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(
+            name="Mairie de Dreux", short_name="Dreux"
+        )
+        self.add_buildings(0, 2)
+
+    def add_buildings(self, start, end):
+        for idx in range(start, end):
+            user = User.objects.create_user(username=f"user_{idx}")
+            profile, _ = UserProfile.objects.get_or_create(user=user)
+            profile.organization = self.org
+            profile.save(update_fields=["organization"])
+
+            Address.objects.create(id=f"add_{idx}")
+            Building.objects.create(
+                rnb_id=f"BDG{idx}",
+                status="constructed",
+                point="POINT(0 0)",
+                shape="POINT(0 0)",
+                addresses_id=[f"add_{idx}"],
+                validated_by=[user.id],
+            )
+
+    def assertConstantQueries(self, num, url):
+        # 1 for the buildings, 1 for the addresses, 1 for the validators and their organization,
+        # 1 to log the call
+        with self.assertNumQueries(num):
+            r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+
+        return r
+
+    @patch.object(ListBuildingQuerySerializer, "validate", lambda self, data: data)
+    def test_list_buildings(self):
+        urls = [
+            "/api/alpha/buildings/",
+            "/api/alpha/buildings/?format=geojson",
+            "/api/alpha/buildings/?withPlots=1",
+            "/api/alpha/ogc/collections/buildings/items",
+        ]
+
+        for url in urls:
+            self.assertConstantQueries(4, url)
+
+        # more buildings, validators and addresses: still the same number of queries
+        self.add_buildings(2, 6)
+
+        for url in urls:
+            self.assertConstantQueries(4, url)
+
+        r = self.assertConstantQueries(4, "/api/alpha/buildings/")
+        self.assertEqual(
+            r.json()["results"][0]["validated_by"][0]["organization_name"],
+            "Mairie de Dreux",
+        )
+
+    def test_single_building(self):
+        self.assertConstantQueries(4, "/api/alpha/buildings/BDG0/")
+        self.assertConstantQueries(4, "/api/alpha/buildings/BDG0/?format=geojson")
+        self.assertConstantQueries(4, "/api/alpha/ogc/collections/buildings/items/BDG0")
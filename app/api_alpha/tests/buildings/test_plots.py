@@ -117,3 +117,66 @@ class BuildingPlotViewTest(APITestCase):
         self.assertEqual(r.status_code, 404)
         res = r.json()
         self.assertEqual(res["detail"], "Plot unknown")
+
+    def test_buildings_on_plot_pagination(self):
+
+        Plot.objects.create(
+            id="plot_1", shape="MULTIPOLYGON(((0 0, 0 1, 1 1, 1 0, 0 0)))"
+        )
+
+        # two buildings fully on the plot, two buildings 25% on the plot
+        # so the pagination has to deal with ties on the cover ratio
+        for rnb_id, shape in [
+            ("building_a", "POLYGON((0.5 0.5, 0.5 1.5, 1.5 1.5, 1.5 0.5, 0.5 0.5))"),
+            ("building_b", "POLYGON((0 0, 0 0.5, 0.5 0.5, 0.5 0, 0 0))"),
+            ("building_c", "POLYGON((0 0, 0 2, 2 2, 2 0, 0 0))"),
+            ("building_d", "POLYGON((0.5 0, 0.5 0.5, 1 0.5, 1 0, 0.5 0))"),
+        ]:
+            bdg = Building.objects.create(rnb_id=rnb_id, shape=shape)
+            bdg.point = bdg.shape.point_on_surface
+            bdg.save()
+
+        expected = ["building_b", "building_d", "building_a", "building_c"]
+
+        # walk forward
+        r = self.client.get("/api/alpha/buildings/plot/plot_1/?limit=1")
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertIsNone(data["previous"])
+
+        seen = [data["results"][0]["rnb_id"]]
+        while data["next"]:
+            data = self.client.get(data["next"]).json()
+            self.assertIsNotNone(data["previous"])
+            seen += [bdg["rnb_id"] for bdg in data["results"]]
+
+        self.assertListEqual(seen, expected)
+
+        # walk backward from the last page
+        seen = [data["results"][0]["rnb_id"]]
+        while data["previous"]:
+            data = self.client.get(data["previous"]).json()
+            self.assertIsNotNone(data["next"])
+            seen += [bdg["rnb_id"] for bdg in data["results"]]
+
+        self.assertListEqual(seen, list(reversed(expected)))
+
+        # the cursor is opaque, page numbers are not exposed anymore
+        r = self.client.get("/api/alpha/buildings/plot/plot_1/?limit=2")
+        data = r.json()
+        self.assertNotIn("cursor=2", data["next"])
+
+        # legacy page number cursors are still accepted
+        r = self.client.get("/api/alpha/buildings/plot/plot_1/?limit=2&cursor=2")
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertListEqual(
+            [bdg["rnb_id"] for bdg in data["results"]], ["building_a", "building_c"]
+        )
+        self.assertIsNone(data["next"])
+
+        data = self.client.get(data["previous"]).json()
+        self.assertListEqual(
+            [bdg["rnb_id"] for bdg in data["results"]], ["building_b", "building_d"]
+        )
+        self.assertIsNone(data["previous"])
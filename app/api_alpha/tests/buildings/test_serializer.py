@@ -1,8 +1,21 @@
+from api_alpha.serializers.building_list import (
+    buildings_data,
+    buildings_feature_collection,
+    closest_building_data,
+)
 from api_alpha.serializers.serializers import (
+    BuildingClosestSerializer,
     BuildingGeoJSONSerializer,
     BuildingSerializer,
 )
+from api_alpha.utils.renderers import ORJSONRenderer
+from batid.list_bdg import list_bdgs
+from batid.models import Address, Building, Organization, Plot, UserProfile
+from batid.services.closest_bdg import get_closest_from_point
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import GEOSGeometry
 from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
 
 
 class GeoJSONSerializer(TestCase):
@@ -22,3 +35,144 @@ class GeoJSONSerializer(TestCase):
         geojson_fields = BuildingGeoJSONSerializer.Meta.fields
 
         self.assertEqual(set(geojson_fields), set(reference_fields))
+
+
+class BuildingListSerialization(TestCase):
+    """
+    The list endpoints serialize the buildings without the DRF serializers:
+    the rendered JSON must be the same.
+    """
+
+    def setUp(self):
+        user = User.objects.create_user(username="julie")
+        org = Organization.objects.create(name="Mairie de Dreux", short_name="Dreux")
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+        profile.organization = org
+        profile.save(update_fields=["organization"])
+
+        Address.objects.create(
+            id="28134_0010_00001",
+            source="ban",
+            ban_id="b4f1d2a3-5e6f-7a8b-9c0d-1e2f3a4b5c6d",
+            street_number="1",
+            street="rue de Chartres",
+            city_name="Dreux",
+            city_zipcode="28100",
+            city_insee_code="28134",
+        )
+        Address.objects.create(id="28134_0010_00002", source="bdnb")
+
+        Plot.objects.create(
+            id="281340000A0001",
+            shape="MULTIPOLYGON(((1.3 48.7, 1.3 48.8, 1.4 48.8, 1.4 48.7, 1.3 48.7)))",
+        )
+
+        shape = GEOSGeometry(
+            "POLYGON((1.3654705955877262 48.73423852982024, 1.365454930919401 48.734105152847496, "
+            "1.3656648374661017 48.73409009413692, 1.3654705955877262 48.73423852982024))",
+            srid=4326,
+        )
+        Building.objects.create(
+            rnb_id="BDG1",
+            shape=shape,
+            point=shape.point_on_surface,
+            status="constructed",
+            addresses_id=["28134_0010_00001", "28134_0010_00002"],
+            ext_ids=[
+                {
+                    "id": "bdnb-1",
+                    "source": "bdnb",
+                    "created_at": "2023-12-07T13:20:58.310444+00:00",
+                    "source_version": "2023_01",
+                },
+                {
+                    "id": "bdtopo-1",
+                    "source": "bdtopo",
+                    "created_at": "",
+                    "source_version": None,
+                },
+            ],
+            validated_by=[user.id],
+            is_active=True,
+        )
+        Building.objects.create(
+            rnb_id="BDG2",
+            shape=GEOSGeometry("POINT(1.35 48.75)", srid=4326),
+            point=GEOSGeometry("POINT(1.35 48.75)", srid=4326),
+            status="constructed",
+            is_active=True,
+        )
+        # coordinates written differently by the JSON encoders: whole numbers, exponents
+        Building.objects.create(
+            rnb_id="BDG3",
+            shape=GEOSGeometry(
+                "POLYGON((0.00005 45, 0.00005 45.0001, 0.0001 45.0001, 0.0001 45, 0.00005 45))",
+                srid=4326,
+            ),
+            point=GEOSGeometry("POINT(0.000075 45.00005)", srid=4326),
+            status="constructed",
+            is_active=True,
+        )
+
+    def assertSameJSON(self, data, expected):
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(expected))
+
+    def test_buildings(self):
+        for with_plots in (False, True):
+            bdgs = list(list_bdgs({"status": "all", "with_plots": with_plots}, False))
+
+            self.assertSameJSON(
+                buildings_data(bdgs, with_plots),
+                BuildingSerializer(bdgs, with_plots=with_plots, many=True).data,
+            )
+            self.assertSameJSON(
+                buildings_feature_collection(bdgs, with_plots),
+                BuildingGeoJSONSerializer(bdgs, with_plots=with_plots, many=True).data,
+            )
+
+    def test_buildings_projections(self):
+        for with_plots in (False, True):
+            params = {"status": "all", "with_plots": with_plots}
+            bdgs = list(list_bdgs(params, False))
+
+            self.assertSameJSON(
+                buildings_data(list(list_bdgs(params, False, "building")), with_plots),
+                BuildingSerializer(bdgs, with_plots=with_plots, many=True).data,
+            )
+            self.assertSameJSON(
+                buildings_feature_collection(
+                    list(list_bdgs(params, False, "geojson")), with_plots
+                ),
+                BuildingGeoJSONSerializer(bdgs, with_plots=with_plots, many=True).data,
+            )
+
+    def test_closest_buildings(self):
+        bdgs = list(get_closest_from_point(48.75, 1.35, 10000))
+        self.assertEqual(len(bdgs), 2)
+
+        self.assertSameJSON(
+            [closest_building_data(bdg) for bdg in bdgs],
+            BuildingClosestSerializer(bdgs, many=True).data,
+        )
+
+    def test_indented_json(self):
+        bdgs = list(list_bdgs({"status": "all", "with_plots": True}, False))
+        context = {"indent": 2}
+
+        self.assertEqual(
+            ORJSONRenderer().render(
+                buildings_data(bdgs, True), renderer_context=context
+            ),
+            JSONRenderer().render(
+                BuildingSerializer(bdgs, with_plots=True, many=True).data,
+                renderer_context=context,
+            ),
+        )
+
+        r = self.client.get(
+            "/api/alpha/buildings/closest/?point=48.75,1.35&radius=1000",
+            HTTP_ACCEPT="application/json; indent=2",
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertIn(b'\n  "results": [', r.content)
+        self.assertEqual(r.json()["results"][0]["rnb_id"], "BDG2")
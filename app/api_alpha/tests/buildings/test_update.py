@@ -3,6 +3,7 @@ import uuid
 from unittest import mock
 
 from batid.models import Address, Building, Contribution, SummerChallenge, Trophy
+from batid.tasks import award_trophies
 from batid.tests.factories.users import ContributorUserFactory
 from django.contrib.gis.geos import GEOSGeometry
 from django.test import override_settings
@@ -810,8 +811,9 @@ class BuildingPatchValidateTest(APITestCase):
         """
         Input: user already has 9 validations; PATCH with `is_valid=True`
         (the 10th validation).
-        Expected: 204 (trophies are no longer returned in the response); the
-        'validateur' level 1 Trophy is awarded in the database.
+        Expected: 204 (trophies are no longer returned in the response); the trophies
+        are evaluated asynchronously and the 'validateur' level 1 Trophy is awarded in
+        the database.
         """
         for _ in range(9):
             SummerChallenge.objects.create(
@@ -822,13 +824,19 @@ class BuildingPatchValidateTest(APITestCase):
             )
 
         data = {"is_valid": True, "comment": "ok"}
-        r = self.client.patch(
-            f"/api/alpha/buildings/{self.rnb_id}/",
-            data=json.dumps(data),
-            content_type="application/json",
-        )
+        with mock.patch("batid.tasks.award_trophies.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                r = self.client.patch(
+                    f"/api/alpha/buildings/{self.rnb_id}/",
+                    data=json.dumps(data),
+                    content_type="application/json",
+                )
 
         self.assertEqual(r.status_code, 204)
+        delay.assert_called_once_with(self.user.id)
+        self.assertFalse(Trophy.objects.filter(user=self.user).exists())
+
+        award_trophies(self.user.id)
         self.assertTrue(
             Trophy.objects.filter(
                 user=self.user, trophy_type="validateur", level=1
@@ -842,11 +850,16 @@ class BuildingPatchValidateTest(APITestCase):
         Expected: 204 with no body; no Trophy awarded to the user.
         """
         data = {"is_valid": True, "comment": "ok"}
-        r = self.client.patch(
-            f"/api/alpha/buildings/{self.rnb_id}/",
-            data=json.dumps(data),
-            content_type="application/json",
-        )
+        with mock.patch("batid.tasks.award_trophies.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                r = self.client.patch(
+                    f"/api/alpha/buildings/{self.rnb_id}/",
+                    data=json.dumps(data),
+                    content_type="application/json",
+                )
 
         self.assertEqual(r.status_code, 204)
+        delay.assert_called_once_with(self.user.id)
+
+        self.assertEqual(award_trophies(self.user.id), [])
         self.assertFalse(Trophy.objects.filter(user=self.user).exists())
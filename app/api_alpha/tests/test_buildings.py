@@ -239,6 +239,45 @@ class BuildingClosestViewTest(APITestCase):
         # Check the very far building is not in the results
         self.assertNotIn(very_far_bdg.rnb_id, all_rnb_ids)
 
+    def test_closest_pagination_with_equal_distances(self):
+        # the buildings at the same distance are ordered by id, on both sides of the page breaks
+        origin = "POINT(-0.5675637291200246 44.83045932150495)"
+        near = "POINT(-0.5676 44.8305)"
+        far = "POINT(-0.5677 44.8306)"
+        ranks = {origin: 0, near: 1, far: 2}
+
+        bdgs = []
+        for i, wkt in enumerate([near, near, origin, far, near, far, near]):
+            bdg = Building.objects.create(
+                rnb_id=f"EQUALDIST{i:03}",
+                shape=GEOSGeometry(wkt, srid=4326),
+                point=GEOSGeometry(wkt, srid=4326),
+                status="constructed",
+                is_active=True,
+            )
+            bdgs.append((ranks[wkt], bdg.id, bdg.rnb_id))
+        expected = [rnb_id for _, _, rnb_id in sorted(bdgs)]
+
+        url = "/api/alpha/buildings/closest/?point=44.83045932150495,-0.5675637291200246&radius=100&limit=2"
+        pages = []
+        while True:
+            data = self.client.get(url).json()
+            pages.append([b["rnb_id"] for b in data["results"]])
+            if data["next"] is None:
+                break
+            url = data["next"]
+
+        self.assertEqual(len(pages), 4)
+        self.assertListEqual([rnb_id for page in pages for rnb_id in page], expected)
+
+        # the previous links bring back the same pages
+        previous_pages = []
+        while data["previous"] is not None:
+            data = self.client.get(data["previous"]).json()
+            previous_pages.append([b["rnb_id"] for b in data["results"]])
+
+        self.assertListEqual(previous_pages, pages[-2::-1])
+
     def test_closest_invalid_query_params(self):
         r = self.client.get(
             "/api/alpha/buildings/closest/?point=46.63423852982024,1.0654705955877262"
@@ -1,9 +1,12 @@
 import json
+import time
 from unittest import mock
 
 from api_alpha.serializers.serializers import ListBuildingQuerySerializer
+from api_alpha.utils.logging_mixin import api_request_logs
 from batid.models import Building
 from django.contrib.gis.geos import GEOSGeometry
+from django.test import TransactionTestCase, override_settings
 from freezegun import freeze_time
 from rest_framework.test import APITestCase
 from rest_framework_tracking.models import APIRequestLog
@@ -150,3 +153,39 @@ class LogEndpointsTest(APITestCase):
         count = APIRequestLog.objects.all().count()
 
         self.assertEqual(count, 1)
+
+
+@override_settings(
+    API_LOG_BUFFERED=True, API_LOG_FLUSH_SIZE=2, API_LOG_FLUSH_INTERVAL=60
+)
+class BufferedLogTest(TransactionTestCase):
+    def wait_for_logs(self, count):
+        for _ in range(50):
+            if APIRequestLog.objects.count() >= count:
+                break
+            time.sleep(0.1)
+
+    def test_logs_written_in_bulk(self):
+        r = self.client.get("/api/alpha/ogc/")
+        self.assertEqual(r.status_code, 200)
+
+        # the first log waits for the batch to be full
+        time.sleep(0.5)
+        self.assertEqual(APIRequestLog.objects.count(), 0)
+
+        r = self.client.get("/api/alpha/ogc/conformance")
+        self.assertEqual(r.status_code, 200)
+
+        self.wait_for_logs(2)
+        self.assertListEqual(
+            sorted(APIRequestLog.objects.values_list("path", flat=True)),
+            ["/api/alpha/ogc/", "/api/alpha/ogc/conformance"],
+        )
+
+    def test_flush(self):
+        r = self.client.get("/api/alpha/ogc/")
+        self.assertEqual(r.status_code, 200)
+
+        api_request_logs.flush()
+
+        self.assertEqual(APIRequestLog.objects.count(), 1)
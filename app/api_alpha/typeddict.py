@@ -1,6 +1,20 @@
-from typing import TypedDict
+from typing import Any, TypedDict
 
 SplitCreatedBuilding = TypedDict(
     "SplitCreatedBuilding",
     {"status": str, "shape": str, "addresses_cle_interop": list[str]},
 )
+
+# The changes of one building given to Building.bulk_update_events
+BuildingChanges = TypedDict(
+    "BuildingChanges",
+    {
+        "event_origin": dict | None,
+        "status": str | None,
+        "addresses_id": list[str] | None,
+        "ext_ids": list | None,
+        "shape": Any,
+        "is_active": bool,
+    },
+    total=False,
+)
@@ -1,6 +1,120 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.db import connection
 from rest_framework_tracking.mixins import LoggingMixin
 from rest_framework_tracking.models import APIRequestLog
 
+logger = logging.getLogger(__name__)
+
+
+class APIRequestLogBuffer:
+    """
+    In-process buffer of the API requests logs.
+
+    The logs are written in bulk by a background thread with its own database connection,
+    every API_LOG_FLUSH_SIZE logs or API_LOG_FLUSH_INTERVAL seconds. At most API_LOG_MAX_BUFFER
+    logs are waiting to be written: beyond, the new ones are dropped. The buffer is flushed
+    when the process exits.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid: Optional[int] = None
+        self.queue: queue.Queue = queue.Queue()
+        self.thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def push(self, log: APIRequestLog):
+        self._start()
+
+        try:
+            self.queue.put_nowait(log)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning("API logs buffer is full, %d logs dropped", self.dropped)
+
+    def flush(self, timeout: float = 10):
+        """Write the buffered logs now, waiting at most `timeout` seconds."""
+        if self.pid != os.getpid():
+            return
+
+        flushed = threading.Event()
+        try:
+            self.queue.put(flushed, timeout=timeout)
+        except queue.Full:
+            return
+        flushed.wait(timeout)
+
+    def _start(self):
+        # the buffer is started once per process, after the server workers are forked
+        if self.pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+
+            self.queue = queue.Queue(maxsize=settings.API_LOG_MAX_BUFFER)
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+            atexit.register(self.flush)
+            self.pid = os.getpid()
+
+    def _run(self):
+        while True:
+            logs, flushed = self._next_batch()
+            try:
+                self._write(logs)
+            finally:
+                # Django connections are per thread
+                connection.close()
+
+            if flushed is not None:
+                flushed.set()
+
+    def _next_batch(self) -> tuple[list[APIRequestLog], Optional[threading.Event]]:
+        # waits for a first log, then for the batch to be full, the interval to be over
+        # or a flush to be requested
+        logs: list[APIRequestLog] = []
+        item = self.queue.get()
+        deadline = time.monotonic() + settings.API_LOG_FLUSH_INTERVAL
+
+        while True:
+            if isinstance(item, threading.Event):
+                return logs, item
+
+            logs.append(item)
+            if len(logs) >= settings.API_LOG_FLUSH_SIZE:
+                return logs, None
+
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                return logs, None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return logs, None
+
+    def _write(self, logs: list[APIRequestLog]):
+        if not logs:
+            return
+
+        try:
+            APIRequestLog.objects.bulk_create(logs)
+        except Exception:
+            logger.exception("Failed to write %d API logs", len(logs))
+
+
+api_request_logs = APIRequestLogBuffer()
+
 
 class RNBLoggingMixin(LoggingMixin):
 
@@ -17,4 +131,10 @@ class RNBLoggingMixin(LoggingMixin):
         # truncate user agent at 255 chars because of DB limit
         data["user_agent"] = data["user_agent"][:255]
 
-        APIRequestLog(**data).save()
+        log = APIRequestLog(**data)
+
+        # the logs are written in bulk, out of the request (see settings.API_LOG_BUFFERED)
+        if settings.API_LOG_BUFFERED:
+            api_request_logs.push(log)
+        else:
+            log.save()
@@ -0,0 +1,46 @@
+import json
+
+import orjson
+from rest_framework.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+_drf_encoder = JSONEncoder()
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Same JSON as the DRF renderer (compact, unescaped unicode), rendered by orjson.
+    The values orjson does not render like DRF (eg the dates) go through the DRF encoder.
+    Pre-rendered JSON can be given as orjson.Fragment (see api_alpha.serializers.building_list).
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        # the indented output is left to DRF, which cannot encode the fragments
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(
+                _parse_fragments(data), accepted_media_type, renderer_context
+            )
+
+        ret = orjson.dumps(
+            data,
+            default=_drf_encoder.default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+
+        # as DRF: those characters are valid JSON but not valid JavaScript
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+            b"\xe2\x80\xa9", b"\\u2029"
+        )
+
+
+def _parse_fragments(data):
+    if isinstance(data, orjson.Fragment):
+        return json.loads(data.contents)
+    if isinstance(data, dict):
+        return {key: _parse_fragments(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_parse_fragments(value) for value in data]
+    return data
@@ -11,19 +11,24 @@ from api_alpha.pagination import (
     BuildingCursorPagination,
 )
 from api_alpha.permissions import ADSPermission, RNBContributorPermission
+from api_alpha.serializers.building_list import (
+    buildings_data,
+    closest_building_data,
+)
 from api_alpha.serializers.serializers import (
     ADSSerializer,
     BuildingAddressQuerySerializer,
     BuildingClosestQuerySerializer,
-    BuildingClosestSerializer,
     BuildingMergeSerializer,
     BuildingSerializer,
     BuildingSplitSerializer,
     DiffusionDatabaseSerializer,
     GuessBuildingSerializer,
 )
+from api_alpha.services import add_contribution_addresses
 from api_alpha.typeddict import SplitCreatedBuilding
 from api_alpha.utils.logging_mixin import RNBLoggingMixin
+from api_alpha.utils.renderers import ORJSONRenderer
 from api_alpha.utils.rnb_doc import build_schema_all_endpoints, get_status_list, rnb_doc
 from api_alpha.utils.sandbox_client import SandboxClient, SandboxClientError
 from batid.exceptions import (
@@ -32,6 +37,7 @@ from batid.exceptions import (
     BANUnknownCleInterop,
     InvalidOperation,
 )
+from batid.list_bdg import with_projection
 from batid.models import ADS, Building, Contribution, DiffusionDatabase, Organization
 from batid.services.closest_bdg import get_closest_from_point
 from batid.services.email import build_reset_password_email
@@ -174,6 +180,8 @@ class BuildingGuessView(RNBLoggingMixin, APIView):
 
 
 class BuildingClosestView(RNBLoggingMixin, APIView):
+    renderer_classes = [ORJSONRenderer]
+
     @rnb_doc(
         {
             "get": {
@@ -258,11 +266,11 @@ class BuildingClosestView(RNBLoggingMixin, APIView):
 
             # Get results and paginate
             bdgs = get_closest_from_point(lat, lng, radius)
-            paginator = BuildingCursorPagination()
+            paginator = BuildingCursorPagination(ordering=("distance", "id"))
             paginated_bdgs = paginator.paginate_queryset(bdgs, request)
-            serializer = BuildingClosestSerializer(paginated_bdgs, many=True)
+            data = [closest_building_data(bdg) for bdg in paginated_bdgs]
 
-            return paginator.get_paginated_response(serializer.data)
+            return paginator.get_paginated_response(data)
 
         else:
             # Invalid data, return validation errors
@@ -270,6 +278,8 @@ class BuildingClosestView(RNBLoggingMixin, APIView):
 
 
 class BuildingAddressView(RNBLoggingMixin, APIView):
+    renderer_classes = [ORJSONRenderer]
+
     @rnb_doc(
         {
             "get": {
@@ -355,7 +365,7 @@ class BuildingAddressView(RNBLoggingMixin, APIView):
 
         if query_serializer.is_valid():
             q = request.query_params.get("q")
-            paginator = BuildingAddressCursorPagination()
+            paginator = BuildingAddressCursorPagination(ordering=("rnb_id",))
 
             if q:
                 # 0.8 is the default value
@@ -382,16 +392,16 @@ class BuildingAddressView(RNBLoggingMixin, APIView):
                 infos["cle_interop_ban"] = cle_interop_ban
 
             infos["status"] = "ok"
-            buildings = (
-                Building.objects.filter(is_active=True)
-                .filter(addresses_read_only__id=cle_interop_ban)
-                .prefetch_related("addresses_read_only")
-                .prefetch_related("validated_by_read_only")
+            buildings = with_projection(
+                Building.objects.filter(is_active=True).filter(
+                    addresses_read_only__id=cle_interop_ban
+                ),
+                "building",
             )
             paginated_bdgs = paginator.paginate_queryset(buildings, request)
-            serialized_buildings = BuildingSerializer(paginated_bdgs, many=True)
-
-            return paginator.get_paginated_response(serialized_buildings.data, infos)
+            return paginator.get_paginated_response(
+                buildings_data(paginated_bdgs), infos
+            )
         else:
             # Invalid data, return validation errors
             return Response(query_serializer.errors, status=400)
@@ -486,6 +496,10 @@ Cet endpoint nécessite d'être identifié et d'avoir des droits d'édition du R
         data = serializer.data
         user = request.user
 
+        # the addresses of the merged buildings are already known
+        if not data.get("merge_existing_addresses"):
+            add_contribution_addresses(data.get("addresses_cle_interop") or [])
+
         with transaction.atomic():
             contribution = Contribution(
                 text=data.get("comment"),
@@ -645,6 +659,14 @@ Cet endpoint nécessite d'être identifié et d'avoir des droits d'édition du R
         data = serializer.data
         user = request.user
 
+        add_contribution_addresses(
+            [
+                address_id
+                for created_building in data.get("created_buildings")
+                for address_id in created_building.get("addresses_cle_interop") or []
+            ]
+        )
+
         with transaction.atomic():
             rnb_id = clean_rnb_id(rnb_id)
             comment = data.get("comment")
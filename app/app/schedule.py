@@ -11,6 +11,12 @@ common_schedule = {
         # everyday at 4am
         "schedule": crontab(hour=4, minute=0),
     },
+    "build_diff_segments": {
+        "task": "batid.tasks.build_diff_segments",
+        # every hour: the previous day once it is closed, the days whose segments
+        # have been deleted because their rows changed
+        "schedule": crontab(minute=30),
+    },
 }
 
 development_schedule = {
@@ -48,7 +54,7 @@ production_schedule = {
         ),
     },
     "publish_data_gouv": {
-        "task": "batid.tasks.publish_datagouv_all",
+        "task": "batid.tasks.publish_datagouv_single_pass",
         # once a week, saturday at 3am
         "schedule": crontab(hour=3, minute=0, day_of_week=6),
     },
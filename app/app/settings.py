@@ -166,6 +166,10 @@ POSTGRES_STATEMENT_TIMEOUT = os.environ.get("POSTGRES_STATEMENT_TIMEOUT")
 DIFF_VIEW_POSTGRES_STATEMENT_TIMEOUT = os.environ.get(
     "DIFF_VIEW_POSTGRES_STATEMENT_TIMEOUT", "0"
 )
+# Diff exports streamed at the same time by each server process
+DIFF_VIEW_MAX_CONCURRENT_EXPORTS = int(
+    os.environ.get("DIFF_VIEW_MAX_CONCURRENT_EXPORTS", "4")
+)
 DATA_GOUV_POSTGRES_STATEMENT_TIMEOUT = os.environ.get(
     "DATA_GOUV_POSTGRES_STATEMENT_TIMEOUT", "259200000"  # Default to 72h
 )
@@ -175,6 +179,47 @@ if POSTGRES_STATEMENT_TIMEOUT:
     ] = f"-c statement_timeout={POSTGRES_STATEMENT_TIMEOUT}"
 
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # vector tiles, see batid/services/vector_tiles/cache.py
+    # the tiles are invalidated by the web and the Celery containers: the cache must be shared
+    # by all of them. It is only enabled with a Redis instance, configured with a maxmemory
+    # and an eviction policy (the former versions of the tiles are never deleted)
+    "tiles": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("TILES_CACHE_REDIS_URL"),
+        }
+        if os.environ.get("TILES_CACHE_REDIS_URL")
+        else {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+    ),
+}
+TILES_CACHE_ENABLED = bool(os.environ.get("TILES_CACHE_REDIS_URL"))
+
+if ENVIRONMENT == "test":
+    # tests are rolled back, the tiles built during a test must not be served to the next ones
+    CACHES["tiles"] = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+    TILES_CACHE_ENABLED = False
+
+
+# API requests logs (see api_alpha/utils/logging_mixin.py), written in bulk by a background thread
+# of each server process, every API_LOG_FLUSH_SIZE logs or API_LOG_FLUSH_INTERVAL seconds.
+# Beyond API_LOG_MAX_BUFFER logs waiting to be written, the new ones are dropped.
+API_LOG_BUFFERED = (
+    os.environ.get("API_LOG_BUFFERED", default="true").lower() == "true"
+    and ENVIRONMENT != "test"
+)
+API_LOG_FLUSH_SIZE = int(os.environ.get("API_LOG_FLUSH_SIZE", "500"))
+API_LOG_FLUSH_INTERVAL = float(os.environ.get("API_LOG_FLUSH_INTERVAL", "5"))
+API_LOG_MAX_BUFFER = int(os.environ.get("API_LOG_MAX_BUFFER", "50000"))
+
+
+# pre-rendered vector tiles archives (MBTiles), see batid/services/vector_tiles/archive.py
+TILES_ARCHIVE_DIR = os.environ.get("TILES_ARCHIVE_DIR")
+
+
 # any active user part of this group can edit the RNB
 CONTRIBUTORS_GROUP_NAME = "Contributors"
 
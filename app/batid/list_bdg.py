@@ -1,24 +1,76 @@
-from batid.models import Building, City, Plot
+from typing import Optional
+
+from batid.models import Address, Building, BuildingPlotReadOnly, City, City_subdivided
 from batid.services.bdg_status import BuildingStatus
+from django.contrib.auth.models import User
 from django.contrib.gis.geos import Polygon
-from django.db.models import (
-    Case,
-    CharField,
-    ExpressionWrapper,
-    F,
-    FloatField,
-    Func,
-    OuterRef,
-    QuerySet,
-    Subquery,
-    Value,
-    When,
-)
-from django.db.models.lookups import Exact, In
+from django.db.models import Exists, OuterRef, Prefetch, QuerySet, Subquery
 from django.shortcuts import get_object_or_404
 
+# What each output reads from the buildings, see with_projection():
+# the building columns to load (the others are deferred) and the relations to prefetch
+PROJECTIONS = {
+    # BuildingSerializer, BuildingClosestSerializer and api_alpha.serializers.building_list
+    "building": {
+        "fields": ("rnb_id", "status", "point", "shape", "ext_ids", "is_active"),
+        "addresses": True,
+        "validated_by": True,
+    },
+    # BuildingGeoJSONSerializer: the shape is the geometry, the point is not needed
+    "geojson": {
+        "fields": ("rnb_id", "status", "shape", "ext_ids", "is_active"),
+        "addresses": True,
+        "validated_by": True,
+    },
+}
+
+# the addresses fields exposed by the API (AddressSerializer)
+ADDRESS_FIELDS = (
+    "id",
+    "ban_id",
+    "source",
+    "street_number",
+    "street_rep",
+    "street",
+    "city_name",
+    "city_zipcode",
+    "city_insee_code",
+)
+
+
+def with_projection(qs: QuerySet, projection: Optional[str]) -> QuerySet:
+    """
+    Load only what the projection needs, with a constant number of queries:
+    one for the buildings and one per prefetched relation.
+    Without projection, all the columns are loaded and both relations are prefetched.
+    """
+
+    spec = PROJECTIONS[projection] if projection else None
+
+    if spec is not None:
+        qs = qs.only(*spec["fields"])
+
+    if spec is None or spec["addresses"]:
+        qs = qs.prefetch_related(
+            Prefetch(
+                "addresses_read_only",
+                queryset=Address.objects.only(*ADDRESS_FIELDS),
+            )
+        )
+
+    if spec is None or spec["validated_by"]:
+        # the public representation of a user includes their organization
+        qs = qs.prefetch_related(
+            Prefetch(
+                "validated_by_read_only",
+                queryset=User.objects.select_related("profile__organization"),
+            )
+        )
+
+    return qs
+
 
-def list_bdgs(params, only_active=True) -> QuerySet:
+def list_bdgs(params, only_active=True, projection: Optional[str] = None) -> QuerySet:
 
     qs = Building.objects.all()
 
@@ -94,9 +146,17 @@ def list_bdgs(params, only_active=True) -> QuerySet:
 
     insee_code = params.get("insee_code", None)
     if insee_code:
-        city = get_object_or_404(City, code_insee=insee_code)
-
-        qs = qs.filter(point__intersects=city.shape)
+        # the city shape itself is not needed
+        city = get_object_or_404(City.objects.only("code_insee"), code_insee=insee_code)
+
+        # the subdivided shape of the city is much faster to intersect than the whole one
+        qs = qs.filter(
+            Exists(
+                City_subdivided.objects.filter(
+                    code_insee=city.code_insee, shape__intersects=OuterRef("point")
+                )
+            )
+        )
         # We have to order by created_at to avoid pagination issues on geographic queries
         qs = qs.order_by("created_at")
 
@@ -110,75 +170,18 @@ def list_bdgs(params, only_active=True) -> QuerySet:
     with_plots = params.get("with_plots", False)
     if with_plots:
 
-        # Subquery to get the plots ids and the bdg_cover_ratio
-        # This quite a big nested query. Here is the breakdwon:
-        # - We filter the plots that intersects the building shape
-        # - We annotate the bdg_cover_ratio field with the ratio of the building shape that is covered by the plot
-        # - We use a Case statement to handle the different geometry types (Point, Polygon)
-        # - We use a subquery to get the plots ids and the bdg_cover_ratio
-        # - We make an array of them in the "plot" field in the main query (PlotsAggSubquery)
+        # The plots ids and the bdg_cover_ratio are read from the building/plot links,
+        # maintained by postgres triggers. They are aggregated in the "plots" field (PlotsAggSubquery)
         subquery = (
-            Plot.objects.filter(shape__intersects=OuterRef("shape"))
-            .annotate(
-                bdg_cover_ratio=Case(
-                    # When the building shape is a point, the intersecting ratio is 1 (we hard code it since SQL returns 0 instead of 1)
-                    When(
-                        Exact(
-                            Func(OuterRef("shape"), function="ST_GeometryType"),
-                            "ST_Point",
-                        ),
-                        then=Value(1.0),
-                    ),
-                    # When the building shape is a polygon or a multipolygon, we calculate the intersecting ratio
-                    When(
-                        In(
-                            Func(
-                                OuterRef("shape"),
-                                function="ST_GeometryType",
-                                output_field=CharField(),
-                            ),
-                            ("ST_Polygon", "ST_MultiPolygon"),
-                        ),
-                        then=(
-                            # This is the formula to calculate the intersecting ratio
-                            ExpressionWrapper(
-                                (
-                                    # We get the area of the intersection between the building shape and the plot shape
-                                    Func(
-                                        Func(
-                                            OuterRef("shape"),
-                                            F("shape"),
-                                            function="ST_Intersection",
-                                        ),
-                                        function="ST_Area",
-                                        output_field=FloatField(),
-                                    )
-                                    # We divide it ...
-                                    /
-                                    # ... by the area of the building shape
-                                    Func(
-                                        OuterRef("shape"),
-                                        function="ST_Area",
-                                        output_field=FloatField(),
-                                    )
-                                ),
-                                output_field=FloatField(),
-                            )
-                        ),
-                    ),
-                    default=Value(0.0),
-                )
-            )
-            .values("id", "bdg_cover_ratio")
+            BuildingPlotReadOnly.objects.filter(building_id=OuterRef("id"))
+            .order_by("plot_id")
+            .values("plot_id", "bdg_cover_ratio")
         )
         qs = qs.annotate(plots=PlotsAggSubquery(subquery))
 
     # to prevent an ugly N+1 problem on the addresses and the validated_by fields
-    qs = qs.prefetch_related("addresses_read_only")
-    qs = qs.prefetch_related("validated_by_read_only")
-
-    return qs
+    return with_projection(qs, projection)
 
 
 class PlotsAggSubquery(Subquery):
-    template = "(SELECT json_agg(json_build_object('id', _agg.id, 'bdg_cover_ratio', _agg.bdg_cover_ratio)) FROM (%(subquery)s) _agg)"
+    template = "(SELECT json_agg(json_build_object('id', _agg.plot_id, 'bdg_cover_ratio', _agg.bdg_cover_ratio)) FROM (%(subquery)s) _agg)"
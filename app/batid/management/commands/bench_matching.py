@@ -0,0 +1,78 @@
+import time
+
+from batid.models import Building, Candidate
+from batid.services.candidate import Inspector
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the candidate matching query with and without the bbox prefilter. "
+        "Verify both paths return the same buildings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sample", type=int, default=1000)
+        parser.add_argument(
+            "--source",
+            type=str,
+            default="buildings",
+            choices=["buildings", "candidates"],
+            help="Use existing buildings shapes or candidates shapes as sample",
+        )
+
+    def handle(self, *args, **options):
+
+        shapes = sample_shapes(options["source"], options["sample"])
+        print(f"Sample: {len(shapes)} shapes from {options['source']}")
+
+        geography_results, geography_duration = run_matching(shapes, False)
+        prefilter_results, prefilter_duration = run_matching(shapes, True)
+
+        print(f"Geography only: {geography_duration:.2f}s")
+        print(f"Bbox prefilter: {prefilter_duration:.2f}s")
+        if prefilter_duration > 0:
+            print(f"Speedup: x{geography_duration / prefilter_duration:.1f}")
+
+        differences = [
+            idx
+            for idx, (geo_ids, pre_ids) in enumerate(
+                zip(geography_results, prefilter_results)
+            )
+            if geo_ids != pre_ids
+        ]
+
+        if differences:
+            print(f"{len(differences)} shapes have different match sets")
+            for idx in differences[:10]:
+                print(
+                    f"Shape #{idx}: {geography_results[idx]} vs {prefilter_results[idx]}"
+                )
+        else:
+            print("All match sets are identical")
+
+
+def sample_shapes(source: str, size: int) -> list:
+    model = Building if source == "buildings" else Candidate
+
+    return list(
+        model.objects.filter(shape__isnull=False)
+        .order_by("?")
+        .values_list("shape", flat=True)[:size]
+    )
+
+
+def run_matching(shapes: list, bbox_prefilter: bool) -> tuple[list, float]:
+
+    inspector = Inspector()
+    inspector.BBOX_PREFILTER = bbox_prefilter
+
+    results = []
+    start = time.perf_counter()
+
+    for shape in shapes:
+        inspector.candidate = Candidate(shape=shape)
+        inspector.get_matching_bdgs()
+        results.append({bdg.id for bdg in inspector.matching_bdgs})
+
+    return results, time.perf_counter() - start
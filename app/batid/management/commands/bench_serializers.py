@@ -0,0 +1,100 @@
+import time
+
+from api_alpha.serializers.building_list import (
+    buildings_data,
+    buildings_feature_collection,
+)
+from api_alpha.serializers.serializers import (
+    BuildingGeoJSONSerializer,
+    BuildingSerializer,
+)
+from api_alpha.utils.renderers import ORJSONRenderer
+from batid.list_bdg import list_bdgs
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the serialization of the buildings list pages, with the DRF serializers "
+        "and with the functions of api_alpha.serializers.building_list. "
+        "Verify both produce the same JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=50)
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--format", choices=["json", "geojson"], default="json")
+        parser.add_argument("--with-plots", action="store_true")
+
+    def handle(self, *args, **options):
+
+        with_plots = options["with_plots"]
+        projection = "geojson" if options["format"] == "geojson" else "building"
+
+        pages = sample_pages(
+            options["pages"], options["page_size"], with_plots, projection
+        )
+        print(f"Sample: {len(pages)} pages of {options['page_size']} buildings")
+
+        if options["format"] == "geojson":
+
+            def drf(page):
+                return BuildingGeoJSONSerializer(
+                    page, with_plots=with_plots, many=True
+                ).data
+
+            def fast(page):
+                return buildings_feature_collection(page, with_plots)
+
+        else:
+
+            def drf(page):
+                return BuildingSerializer(page, with_plots=with_plots, many=True).data
+
+            def fast(page):
+                return buildings_data(page, with_plots)
+
+        drf_results, drf_duration = run_serialization(pages, drf, JSONRenderer())
+        fast_results, fast_duration = run_serialization(pages, fast, ORJSONRenderer())
+
+        print(f"DRF serializers: {len(pages) / drf_duration:.1f} pages/s")
+        print(f"Fast path: {len(pages) / fast_duration:.1f} pages/s")
+        if fast_duration > 0:
+            print(f"Speedup: x{drf_duration / fast_duration:.1f}")
+
+        differences = sum(
+            1
+            for drf_json, fast_json in zip(drf_results, fast_results)
+            if drf_json != fast_json
+        )
+        if differences:
+            print(f"{differences} pages have a different JSON output")
+        else:
+            print("All pages are identical")
+
+
+def sample_pages(count: int, page_size: int, with_plots: bool, projection=None) -> list:
+    # the pages are loaded (with their prefetched relations) before the benchmark,
+    # only the serialization is measured
+    qs = list_bdgs({"with_plots": with_plots}, projection=projection)
+
+    pages = []
+    for idx in range(count):
+        page = list(qs[idx * page_size : (idx + 1) * page_size])
+        if not page:
+            break
+        pages.append(page)
+
+    return pages
+
+
+def run_serialization(pages: list, serialize, renderer) -> tuple[list, float]:
+
+    results = []
+    start = time.perf_counter()
+
+    for page in pages:
+        results.append(renderer.render(serialize(page)))
+
+    return results, time.perf_counter() - start
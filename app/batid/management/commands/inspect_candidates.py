@@ -1,3 +1,5 @@
+from batid.services.candidate import create_inspection_tasks
+from celery import group
 from django.core.management.base import BaseCommand
 
 from app.celery import app
@@ -6,5 +8,26 @@ from app.celery import app
 class Command(BaseCommand):
     help = "Inspect candidates created by previous imports. And eventually create buildings from candidates."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Inspect candidates by batches of this size instead of one by one",
+        )
+        parser.add_argument(
+            "--partitioned",
+            action="store_true",
+            help="Queue one inspection task per CPU, each draining its own spatial partitions of the candidates",
+        )
+
     def handle(self, *args, **options):
-        app.send_task("batid.tasks.inspect_candidates")
+        if options["partitioned"]:
+            tasks = create_inspection_tasks(options["batch_size"])
+            group(*tasks)()
+            return
+
+        app.send_task(
+            "batid.tasks.inspect_candidates",
+            kwargs={"batch_size": options["batch_size"]},
+        )
@@ -13,7 +13,7 @@ class Command(BaseCommand):
             "--strate",
             type=str,
             default="department",
-            choices=["country", "department"],
+            choices=["country", "department", "all"],
         ),
         parser.add_argument(
             "--start-dpt",
@@ -30,6 +30,9 @@ class Command(BaseCommand):
 def enqueue_tasks(strate, starting_code=None):
     if strate == "country":
         app.send_task("batid.tasks.publish_datagouv_national")
+    elif strate == "all":
+        # national and department files from a single scan of the buildings
+        app.send_task("batid.tasks.publish_datagouv_single_pass")
     elif strate == "department":
         dpts = dpts_list()
 
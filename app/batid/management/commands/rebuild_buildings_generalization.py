@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from app.celery import app
+
+
+class Command(BaseCommand):
+    help = "Rebuild the buildings generalization used by the low zoom vector tiles. It is then kept up to date by a trigger."
+
+    def handle(self, *args, **options):
+        app.send_task("batid.tasks.rebuild_buildings_generalization")
@@ -0,0 +1,37 @@
+from batid.services.vector_tiles.archive import ARCHIVE_LAYERS
+from django.core.management.base import BaseCommand
+
+from app.celery import app
+
+
+class Command(BaseCommand):
+    help = "Pre-render the vector tiles of a layer into its MBTiles archive, for a department or all of France"
+
+    def add_arguments(self, parser):
+        parser.add_argument("layer", type=str, choices=sorted(ARCHIVE_LAYERS.keys()))
+        parser.add_argument("--min-zoom", type=int, default=16)
+        parser.add_argument("--max-zoom", type=int, default=18)
+        parser.add_argument(
+            "--dpt",
+            type=str,
+            default=None,
+            help="Department code. All of France if not given",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of tiles rendered in parallel",
+        )
+
+    def handle(self, *args, **options):
+        app.send_task(
+            "batid.tasks.render_tiles_archive",
+            kwargs={
+                "layer": options["layer"],
+                "min_zoom": options["min_zoom"],
+                "max_zoom": options["max_zoom"],
+                "dpt": options["dpt"],
+                "workers": options["workers"],
+            },
+        )
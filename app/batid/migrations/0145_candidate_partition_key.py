@@ -0,0 +1,26 @@
+# Generated by Django 6.0.6 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0144_eventannotation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="candidate",
+            name="partition_key",
+            field=models.CharField(max_length=12, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="candidate",
+            index=models.Index(
+                condition=models.Q(("inspected_at__isnull", True)),
+                fields=["partition_key", "random"],
+                name="candidate_partition_todo_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,153 @@
+# Generated by Django 6.0.6 on 2026-10-18 14:05
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+# Zoom 16 tile of a EPSG:3857 point
+BUILDING_GRID_CELL_FUNCTION_SQL = """
+            CREATE OR REPLACE FUNCTION public.building_grid_cell(merc geometry, OUT x integer, OUT y integer)
+            LANGUAGE sql
+            IMMUTABLE
+            AS $function$
+                SELECT
+                    floor((ST_X(merc) + 20037508.3427892) / (40075016.6855784 / 65536))::integer,
+                    floor((20037508.3427892 - ST_Y(merc)) / (40075016.6855784 / 65536))::integer
+            $function$
+            ;
+"""
+
+GENERALIZATION_TRIGGER_SQL = """
+            CREATE OR REPLACE FUNCTION public.keep_building_generalization_updated()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $function$
+            DECLARE
+                old_counted BOOLEAN := FALSE;
+                new_counted BOOLEAN := FALSE;
+                merc geometry;
+                cell RECORD;
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    old_counted := OLD.is_active AND OLD.status IN ('constructed', 'notUsable') AND OLD.point IS NOT NULL;
+                END IF;
+
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    new_counted := NEW.is_active AND NEW.status IN ('constructed', 'notUsable') AND NEW.point IS NOT NULL;
+                END IF;
+
+                -- nothing drawn on the generalized tiles has changed
+                IF TG_OP = 'UPDATE' AND old_counted = new_counted
+                    AND NEW.point IS NOT DISTINCT FROM OLD.point
+                    AND NEW.shape IS NOT DISTINCT FROM OLD.shape
+                    AND NEW.rnb_id = OLD.rnb_id
+                    AND NEW.status = OLD.status
+                    AND NEW.validated_by IS NOT DISTINCT FROM OLD.validated_by THEN
+                    RETURN NULL;
+                END IF;
+
+                IF old_counted THEN
+                    merc := ST_Transform(OLD.point, 3857);
+                    SELECT * INTO cell FROM building_grid_cell(merc);
+
+                    UPDATE batid_buildinggridcell
+                    SET count = count - 1, sum_x = sum_x - ST_X(merc), sum_y = sum_y - ST_Y(merc)
+                    WHERE x = cell.x AND y = cell.y;
+
+                    DELETE FROM batid_buildinggeneralized WHERE building_id = OLD.id;
+                END IF;
+
+                IF new_counted THEN
+                    merc := ST_Transform(NEW.point, 3857);
+                    SELECT * INTO cell FROM building_grid_cell(merc);
+
+                    INSERT INTO batid_buildinggridcell (x, y, count, sum_x, sum_y)
+                    VALUES (cell.x, cell.y, 1, ST_X(merc), ST_Y(merc))
+                    ON CONFLICT (x, y) DO UPDATE SET
+                        count = batid_buildinggridcell.count + 1,
+                        sum_x = batid_buildinggridcell.sum_x + EXCLUDED.sum_x,
+                        sum_y = batid_buildinggridcell.sum_y + EXCLUDED.sum_y;
+
+                    INSERT INTO batid_buildinggeneralized (building_id, rnb_id, status, is_validated, point, shape)
+                    VALUES (
+                        NEW.id,
+                        NEW.rnb_id,
+                        NEW.status,
+                        COALESCE(array_length(NEW.validated_by, 1), 0) > 0,
+                        merc,
+                        ST_SimplifyPreserveTopology(ST_Transform(NEW.shape, 3857), 1)
+                    );
+                END IF;
+
+                RETURN NULL;
+            END;
+            $function$
+            ;
+
+            CREATE TRIGGER building_generalization_trigger AFTER INSERT OR UPDATE OR DELETE ON public.batid_building FOR EACH ROW EXECUTE FUNCTION keep_building_generalization_updated();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0145_candidate_partition_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BuildingGeneralized",
+            fields=[
+                (
+                    "building_id",
+                    models.BigIntegerField(primary_key=True, serialize=False),
+                ),
+                ("rnb_id", models.CharField(max_length=12)),
+                ("status", models.CharField(max_length=30)),
+                ("is_validated", models.BooleanField(default=False)),
+                (
+                    "point",
+                    django.contrib.gis.db.models.fields.PointField(srid=3857),
+                ),
+                (
+                    "shape",
+                    django.contrib.gis.db.models.fields.GeometryField(
+                        null=True, srid=3857
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="BuildingGridCell",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("x", models.IntegerField()),
+                ("y", models.IntegerField()),
+                ("count", models.IntegerField(default=0)),
+                ("sum_x", models.FloatField(default=0)),
+                ("sum_y", models.FloatField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("x", "y"), name="building_grid_cell_xy"
+                    )
+                ],
+            },
+        ),
+        migrations.RunSQL(
+            BUILDING_GRID_CELL_FUNCTION_SQL + GENERALIZATION_TRIGGER_SQL,  # nosec
+            reverse_sql="""
+            DROP TRIGGER building_generalization_trigger ON batid_building;
+            DROP FUNCTION keep_building_generalization_updated();
+            DROP FUNCTION building_grid_cell(geometry);
+            """,
+        ),
+    ]
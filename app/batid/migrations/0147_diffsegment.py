@@ -0,0 +1,42 @@
+# Generated by Django 6.0.6 on 2026-10-18 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0146_building_generalization"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DiffSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                (
+                    "insee_code",
+                    models.CharField(blank=True, default="", max_length=10),
+                ),
+                ("data", models.BinaryField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("day", "insee_code"),
+                        name="diff_segment_day_insee_code",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,143 @@
+# Generated by Django 6.0.6 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The links of a building are computed again when its shape changes,
+# the links of a plot when its shape changes or when it is deleted (eg by the plots import).
+# The links of the existing buildings and plots are computed by the queue_full_building_plots_refresh task,
+# to run once after deploying.
+BUILDING_PLOT_LINK_TRIGGERS_SQL = """
+            CREATE OR REPLACE FUNCTION public.bdg_plot_cover_ratio(bdg_shape geometry, plot_shape geometry)
+            RETURNS double precision
+            LANGUAGE sql
+            IMMUTABLE
+            AS $function$
+                SELECT CASE
+                    -- a point is fully on the plot
+                    WHEN ST_GeometryType(bdg_shape) = 'ST_Point' THEN 1.0
+                    WHEN ST_GeometryType(bdg_shape) IN ('ST_Polygon', 'ST_MultiPolygon') AND ST_Area(bdg_shape) > 0 THEN
+                        ST_Area(ST_Intersection(bdg_shape, plot_shape)) / ST_Area(bdg_shape)
+                    ELSE 0.0
+                END
+            $function$
+            ;
+
+            CREATE OR REPLACE FUNCTION public.keep_building_plot_link_updated()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $function$
+            BEGIN
+                IF TG_OP = 'UPDATE' THEN
+                    IF ST_AsEWKB(NEW.shape) IS NOT DISTINCT FROM ST_AsEWKB(OLD.shape) THEN
+                        RETURN NEW;
+                    END IF;
+
+                    DELETE FROM batid_buildingplotreadonly WHERE building_id = NEW.id;
+                END IF;
+
+                INSERT INTO batid_buildingplotreadonly (building_id, plot_id, bdg_cover_ratio)
+                SELECT NEW.id, p.id, bdg_plot_cover_ratio(NEW.shape, p.shape)
+                FROM batid_plot p
+                WHERE ST_Intersects(p.shape, NEW.shape);
+
+                RETURN NEW;
+            END;
+            $function$
+            ;
+
+            CREATE OR REPLACE FUNCTION public.keep_plot_building_link_updated()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $function$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    DELETE FROM batid_buildingplotreadonly WHERE plot_id = OLD.id;
+                    RETURN OLD;
+                END IF;
+
+                IF TG_OP = 'UPDATE' THEN
+                    IF ST_AsEWKB(NEW.shape) IS NOT DISTINCT FROM ST_AsEWKB(OLD.shape) THEN
+                        RETURN NEW;
+                    END IF;
+
+                    DELETE FROM batid_buildingplotreadonly WHERE plot_id = NEW.id;
+                END IF;
+
+                INSERT INTO batid_buildingplotreadonly (building_id, plot_id, bdg_cover_ratio)
+                SELECT b.id, NEW.id, bdg_plot_cover_ratio(b.shape, NEW.shape)
+                FROM batid_building b
+                WHERE ST_Intersects(b.shape, NEW.shape);
+
+                RETURN NEW;
+            END;
+            $function$
+            ;
+
+            CREATE TRIGGER building_plots_trigger AFTER INSERT OR UPDATE OF shape ON public.batid_building FOR EACH ROW EXECUTE FUNCTION keep_building_plot_link_updated();
+            CREATE TRIGGER plot_buildings_trigger AFTER INSERT OR UPDATE OF shape ON public.batid_plot FOR EACH ROW EXECUTE FUNCTION keep_plot_building_link_updated();
+            CREATE TRIGGER plot_buildings_delete_trigger BEFORE DELETE ON public.batid_plot FOR EACH ROW EXECUTE FUNCTION keep_plot_building_link_updated();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0147_diffsegment"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BuildingPlotReadOnly",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bdg_cover_ratio", models.FloatField()),
+                (
+                    "building",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="batid.building",
+                    ),
+                ),
+                (
+                    "plot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="batid.plot",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("building", "plot")},
+            },
+        ),
+        migrations.AddField(
+            model_name="building",
+            name="plots_read_only",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="buildings_read_only",
+                through="batid.BuildingPlotReadOnly",
+                to="batid.plot",
+            ),
+        ),
+        migrations.RunSQL(
+            BUILDING_PLOT_LINK_TRIGGERS_SQL,
+            reverse_sql="""
+            DROP TRIGGER building_plots_trigger ON batid_building;
+            DROP TRIGGER plot_buildings_trigger ON batid_plot;
+            DROP TRIGGER plot_buildings_delete_trigger ON batid_plot;
+            DROP FUNCTION keep_building_plot_link_updated();
+            DROP FUNCTION keep_plot_building_link_updated();
+            DROP FUNCTION bdg_plot_cover_ratio(geometry, geometry);
+            """,
+        ),
+    ]
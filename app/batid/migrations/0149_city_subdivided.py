@@ -0,0 +1,83 @@
+# Generated by Django 6.0.6 on 2026-10-18 19:10
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+# The subdivided shape of a city is computed again when its shape or its code changes
+# and is deleted with the city, whatever writes the cities (import_etalab_cities, admin, tests).
+CITY_SUBDIVIDED_TRIGGER_SQL = """
+            CREATE OR REPLACE FUNCTION public.keep_city_subdivided_updated()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $function$
+            BEGIN
+                IF TG_OP = 'UPDATE' THEN
+                    IF ST_AsEWKB(NEW.shape) IS NOT DISTINCT FROM ST_AsEWKB(OLD.shape)
+                        AND NEW.code_insee = OLD.code_insee THEN
+                        RETURN NEW;
+                    END IF;
+                END IF;
+
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    DELETE FROM batid_city_subdivided WHERE code_insee = OLD.code_insee;
+                END IF;
+
+                IF TG_OP = 'DELETE' THEN
+                    RETURN OLD;
+                END IF;
+
+                IF NEW.shape IS NOT NULL THEN
+                    INSERT INTO batid_city_subdivided (code_insee, shape)
+                    SELECT NEW.code_insee, ST_SubDivide(NEW.shape);
+                END IF;
+
+                RETURN NEW;
+            END;
+            $function$
+            ;
+
+            CREATE TRIGGER city_subdivided_trigger AFTER INSERT OR UPDATE OF shape, code_insee OR DELETE ON public.batid_city FOR EACH ROW EXECUTE FUNCTION keep_city_subdivided_updated();
+
+            INSERT INTO batid_city_subdivided (code_insee, shape)
+            SELECT code_insee, ST_SubDivide(shape)
+            FROM batid_city
+            WHERE shape IS NOT NULL;
+"""
+
+DROP_CITY_SUBDIVIDED_TRIGGER_SQL = """
+            DROP TRIGGER IF EXISTS city_subdivided_trigger ON public.batid_city;
+            DROP FUNCTION IF EXISTS public.keep_city_subdivided_updated();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0148_buildingplotreadonly"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="City_subdivided",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("code_insee", models.CharField(db_index=True, max_length=10)),
+                (
+                    "shape",
+                    django.contrib.gis.db.models.fields.PolygonField(srid=4326),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            CITY_SUBDIVIDED_TRIGGER_SQL,
+            reverse_sql=DROP_CITY_SUBDIVIDED_TRIGGER_SQL,
+        ),
+    ]
@@ -0,0 +1,157 @@
+# Generated by Django 6.0.6 on 2026-10-18 19:40
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# A new validation increments the progress of its user. The validations are rarely
+# updated or deleted (eg when their date is fixed): the progress of their user is then
+# computed again from all their validations.
+# The days are the calendar days in Europe/Paris, the cities are INSEE codes.
+TROPHY_PROGRESS_TRIGGERS_SQL = """
+            CREATE OR REPLACE FUNCTION public.refresh_trophy_progress(uid integer)
+            RETURNS void
+            LANGUAGE sql
+            AS $function$
+                WITH v AS (
+                    SELECT (sc.created_at AT TIME ZONE 'Europe/Paris')::date AS day, c.code_insee
+                    FROM batid_summerchallenge sc
+                    LEFT JOIN batid_city c ON c.id = sc.city_id
+                    WHERE sc.user_id = uid AND sc.action = 'validation'
+                )
+                INSERT INTO batid_trophyprogress (user_id, validations, validation_days, validation_cities)
+                SELECT
+                    uid,
+                    (SELECT count(*) FROM v),
+                    COALESCE((SELECT array_agg(DISTINCT day ORDER BY day) FROM v), '{}'),
+                    COALESCE((SELECT array_agg(DISTINCT code_insee) FROM v WHERE code_insee IS NOT NULL), '{}')
+                ON CONFLICT (user_id) DO UPDATE SET
+                    validations = EXCLUDED.validations,
+                    validation_days = EXCLUDED.validation_days,
+                    validation_cities = EXCLUDED.validation_cities;
+            $function$
+            ;
+
+            CREATE OR REPLACE FUNCTION public.keep_trophy_progress_updated()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $function$
+            DECLARE
+                new_day date;
+                new_city varchar(10);
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    new_day := (NEW.created_at AT TIME ZONE 'Europe/Paris')::date;
+                    SELECT code_insee INTO new_city FROM batid_city WHERE id = NEW.city_id;
+
+                    INSERT INTO batid_trophyprogress AS p (user_id, validations, validation_days, validation_cities)
+                    VALUES (
+                        NEW.user_id,
+                        1,
+                        ARRAY[new_day],
+                        CASE WHEN new_city IS NULL THEN '{}' ELSE ARRAY[new_city] END
+                    )
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        validations = p.validations + 1,
+                        validation_days = CASE
+                            WHEN new_day = ANY(p.validation_days) THEN p.validation_days
+                            ELSE array_append(p.validation_days, new_day)
+                        END,
+                        validation_cities = CASE
+                            WHEN new_city IS NULL OR new_city = ANY(p.validation_cities) THEN p.validation_cities
+                            ELSE array_append(p.validation_cities, new_city)
+                        END;
+
+                    RETURN NEW;
+                END IF;
+
+                IF TG_OP = 'DELETE' THEN
+                    PERFORM refresh_trophy_progress(OLD.user_id);
+                    RETURN OLD;
+                END IF;
+
+                IF NEW.user_id = OLD.user_id
+                    AND NEW.action = OLD.action
+                    AND NEW.created_at = OLD.created_at
+                    AND NEW.city_id IS NOT DISTINCT FROM OLD.city_id THEN
+                    RETURN NEW;
+                END IF;
+
+                PERFORM refresh_trophy_progress(NEW.user_id);
+                IF NEW.user_id <> OLD.user_id THEN
+                    PERFORM refresh_trophy_progress(OLD.user_id);
+                END IF;
+
+                RETURN NEW;
+            END;
+            $function$
+            ;
+
+            CREATE TRIGGER trophy_progress_insert_trigger AFTER INSERT ON public.batid_summerchallenge FOR EACH ROW WHEN (NEW.action = 'validation') EXECUTE FUNCTION keep_trophy_progress_updated();
+            CREATE TRIGGER trophy_progress_update_trigger AFTER UPDATE OF user_id, action, created_at, city_id ON public.batid_summerchallenge FOR EACH ROW WHEN (NEW.action = 'validation' OR OLD.action = 'validation') EXECUTE FUNCTION keep_trophy_progress_updated();
+            CREATE TRIGGER trophy_progress_delete_trigger AFTER DELETE ON public.batid_summerchallenge FOR EACH ROW WHEN (OLD.action = 'validation') EXECUTE FUNCTION keep_trophy_progress_updated();
+
+            INSERT INTO batid_trophyprogress (user_id, validations, validation_days, validation_cities)
+            SELECT
+                sc.user_id,
+                count(*),
+                array_agg(DISTINCT (sc.created_at AT TIME ZONE 'Europe/Paris')::date ORDER BY (sc.created_at AT TIME ZONE 'Europe/Paris')::date),
+                COALESCE(array_agg(DISTINCT c.code_insee) FILTER (WHERE c.code_insee IS NOT NULL), '{}')
+            FROM batid_summerchallenge sc
+            LEFT JOIN batid_city c ON c.id = sc.city_id
+            WHERE sc.action = 'validation'
+            GROUP BY sc.user_id;
+"""
+
+DROP_TROPHY_PROGRESS_TRIGGERS_SQL = """
+            DROP TRIGGER IF EXISTS trophy_progress_insert_trigger ON public.batid_summerchallenge;
+            DROP TRIGGER IF EXISTS trophy_progress_update_trigger ON public.batid_summerchallenge;
+            DROP TRIGGER IF EXISTS trophy_progress_delete_trigger ON public.batid_summerchallenge;
+            DROP FUNCTION IF EXISTS public.keep_trophy_progress_updated();
+            DROP FUNCTION IF EXISTS public.refresh_trophy_progress(integer);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0149_city_subdivided"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrophyProgress",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        primary_key=True,
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("validations", models.PositiveIntegerField(db_index=True, default=0)),
+                (
+                    "validation_days",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.DateField(), default=list, size=None
+                    ),
+                ),
+                (
+                    "validation_cities",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(max_length=10),
+                        default=list,
+                        size=None,
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            TROPHY_PROGRESS_TRIGGERS_SQL,
+            reverse_sql=DROP_TROPHY_PROGRESS_TRIGGERS_SQL,
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 6.0.6 on 2026-10-19 09:30
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+# The segments of a day are deleted, and the day is queried live until it is built again,
+# when one of its rows changes:
+# - a row of the day gets closed (the building is updated or deleted): its sys_period
+#   in the CSV is not open anymore
+# - the username or the organization of a user in the rows of the day changes
+#
+# The triggers take a shared advisory lock on the day (or on the users, key -1).
+# build_day_segments takes the exclusive ones before reading the rows, so a change
+# committed while a day is built cannot leave a stale segment.
+DIFF_SEGMENT_INVALIDATION_SQL = """
+            CREATE OR REPLACE FUNCTION public.invalidate_diff_segments_of_closed_row()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $function$
+            DECLARE
+                segment_day date;
+            BEGIN
+                -- a day segment holds the rows with start < lower(sys_period) <= end
+                segment_day := ((lower(NEW.sys_period) - interval '1 microsecond') AT TIME ZONE 'UTC')::date;
+
+                PERFORM pg_advisory_xact_lock_shared(hashtext('batid_diffsegment'), segment_day - DATE '1970-01-01');
+                DELETE FROM batid_diffsegment WHERE day = segment_day;
+
+                RETURN NULL;
+            END;
+            $function$
+            ;
+
+            CREATE OR REPLACE FUNCTION public.invalidate_diff_segments_of_users(uids integer[])
+            RETURNS void
+            LANGUAGE plpgsql
+            AS $function$
+            BEGIN
+                PERFORM pg_advisory_xact_lock_shared(hashtext('batid_diffsegment'), -1);
+                DELETE FROM batid_diffsegment WHERE day IN (
+                    SELECT day FROM batid_diffsegment WHERE insee_code = '' AND user_ids && uids
+                );
+            END;
+            $function$
+            ;
+
+            CREATE OR REPLACE FUNCTION public.invalidate_diff_segments_of_user_change()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $function$
+            BEGIN
+                IF TG_TABLE_NAME = 'auth_user' THEN
+                    PERFORM invalidate_diff_segments_of_users(ARRAY[NEW.id]);
+                ELSIF TG_TABLE_NAME = 'batid_organization' THEN
+                    PERFORM invalidate_diff_segments_of_users(
+                        ARRAY(SELECT user_id FROM batid_userprofile WHERE organization_id = NEW.id)
+                    );
+                ELSIF TG_OP = 'INSERT' THEN
+                    PERFORM invalidate_diff_segments_of_users(ARRAY[NEW.user_id]);
+                ELSIF TG_OP = 'DELETE' THEN
+                    PERFORM invalidate_diff_segments_of_users(ARRAY[OLD.user_id]);
+                ELSE
+                    PERFORM invalidate_diff_segments_of_users(ARRAY[OLD.user_id, NEW.user_id]);
+                END IF;
+
+                RETURN NULL;
+            END;
+            $function$
+            ;
+
+            CREATE TRIGGER diff_segment_closed_row_trigger AFTER INSERT ON public.batid_building_history FOR EACH ROW EXECUTE FUNCTION invalidate_diff_segments_of_closed_row();
+            CREATE TRIGGER diff_segment_username_trigger AFTER UPDATE OF username ON public.auth_user FOR EACH ROW WHEN (OLD.username IS DISTINCT FROM NEW.username) EXECUTE FUNCTION invalidate_diff_segments_of_user_change();
+            CREATE TRIGGER diff_segment_organization_trigger AFTER UPDATE OF name, short_name ON public.batid_organization FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.short_name IS DISTINCT FROM NEW.short_name) EXECUTE FUNCTION invalidate_diff_segments_of_user_change();
+            CREATE TRIGGER diff_segment_profile_insert_trigger AFTER INSERT OR DELETE ON public.batid_userprofile FOR EACH ROW EXECUTE FUNCTION invalidate_diff_segments_of_user_change();
+            CREATE TRIGGER diff_segment_profile_update_trigger AFTER UPDATE OF user_id, organization_id ON public.batid_userprofile FOR EACH ROW WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id OR OLD.organization_id IS DISTINCT FROM NEW.organization_id) EXECUTE FUNCTION invalidate_diff_segments_of_user_change();
+
+            -- the segments built so far may be stale and have no users: they are built again
+            DELETE FROM batid_diffsegment;
+"""
+
+DROP_DIFF_SEGMENT_INVALIDATION_SQL = """
+            DROP TRIGGER IF EXISTS diff_segment_closed_row_trigger ON public.batid_building_history;
+            DROP TRIGGER IF EXISTS diff_segment_username_trigger ON public.auth_user;
+            DROP TRIGGER IF EXISTS diff_segment_organization_trigger ON public.batid_organization;
+            DROP TRIGGER IF EXISTS diff_segment_profile_insert_trigger ON public.batid_userprofile;
+            DROP TRIGGER IF EXISTS diff_segment_profile_update_trigger ON public.batid_userprofile;
+            DROP FUNCTION IF EXISTS public.invalidate_diff_segments_of_user_change();
+            DROP FUNCTION IF EXISTS public.invalidate_diff_segments_of_users(integer[]);
+            DROP FUNCTION IF EXISTS public.invalidate_diff_segments_of_closed_row();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0150_trophyprogress"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="diffsegment",
+            name="user_ids",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.IntegerField(), default=list, size=None
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="diffsegment",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["user_ids"], name="diff_segment_user_ids_idx"
+            ),
+        ),
+        migrations.RunSQL(
+            DIFF_SEGMENT_INVALIDATION_SQL,
+            reverse_sql=DROP_DIFF_SEGMENT_INVALIDATION_SQL,
+        ),
+    ]
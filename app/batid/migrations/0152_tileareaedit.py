@@ -0,0 +1,38 @@
+# Generated by Django 6.0.6 on 2026-10-19 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0151_diffsegment_invalidation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TileAreaEdit",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("layer", models.CharField(max_length=20)),
+                ("x", models.IntegerField()),
+                ("y", models.IntegerField()),
+                ("edited_at", models.BigIntegerField()),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("layer", "x", "y"), name="tile_area_edit_layer_xy"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.6 on 2026-10-19 15:20
+
+from django.db import migrations
+
+# As in the former computation of the plot endpoint, a shape without area
+# (a point, a line, a degenerate polygon) is fully on the plots it intersects.
+# The links are not computed here: rebuilding them nationwide would hold a lock
+# on the table for the whole migration. Run the queue_full_building_plots_refresh task
+# once deployed, it computes them department by department.
+BDG_PLOT_COVER_RATIO_SQL = """
+            CREATE OR REPLACE FUNCTION public.bdg_plot_cover_ratio(bdg_shape geometry, plot_shape geometry)
+            RETURNS double precision
+            LANGUAGE sql
+            IMMUTABLE
+            AS $function$
+                SELECT CASE
+                    WHEN ST_Area(bdg_shape) = 0 THEN 1.0
+                    ELSE ST_Area(ST_Intersection(bdg_shape, plot_shape)) / ST_Area(bdg_shape)
+                END
+            $function$
+            ;
+"""
+
+BDG_PLOT_COVER_RATIO_0148_SQL = """
+            CREATE OR REPLACE FUNCTION public.bdg_plot_cover_ratio(bdg_shape geometry, plot_shape geometry)
+            RETURNS double precision
+            LANGUAGE sql
+            IMMUTABLE
+            AS $function$
+                SELECT CASE
+                    -- a point is fully on the plot
+                    WHEN ST_GeometryType(bdg_shape) = 'ST_Point' THEN 1.0
+                    WHEN ST_GeometryType(bdg_shape) IN ('ST_Polygon', 'ST_MultiPolygon') AND ST_Area(bdg_shape) > 0 THEN
+                        ST_Area(ST_Intersection(bdg_shape, plot_shape)) / ST_Area(bdg_shape)
+                    ELSE 0.0
+                END
+            $function$
+            ;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0152_tileareaedit"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            BDG_PLOT_COVER_RATIO_SQL,
+            reverse_sql=BDG_PLOT_COVER_RATIO_0148_SQL,
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 6.0.6 on 2026-10-19 16:40
+
+from django.db import migrations
+
+# The partition key of a candidate is the geohash cell (5 characters, about 4.9km x 4.9km)
+# of its shape centroid, set when it is inserted: the candidates inserted while the inspection
+# tasks run are in a partition too. See batid.services.candidate.PARTITION_GEOHASH_PRECISION
+# The candidates waiting for inspection get their key in the finer cells.
+CANDIDATE_PARTITION_KEY_TRIGGER_SQL = """
+            CREATE OR REPLACE FUNCTION public.candidate_partition_key(shape geometry)
+            RETURNS varchar
+            LANGUAGE sql
+            IMMUTABLE
+            AS $function$
+                SELECT CASE
+                    WHEN shape IS NULL OR ST_IsEmpty(shape) THEN ''
+                    ELSE ST_GeoHash(ST_Centroid(shape), 5)
+                END
+            $function$
+            ;
+
+            CREATE OR REPLACE FUNCTION public.set_candidate_partition_key()
+            RETURNS trigger
+            LANGUAGE plpgsql
+            AS $function$
+            BEGIN
+                NEW.partition_key := candidate_partition_key(NEW.shape);
+                RETURN NEW;
+            END;
+            $function$
+            ;
+
+            CREATE TRIGGER candidate_partition_key_trigger BEFORE INSERT OR UPDATE OF shape ON public.batid_candidate FOR EACH ROW EXECUTE FUNCTION set_candidate_partition_key();
+
+            UPDATE batid_candidate SET partition_key = candidate_partition_key(shape)
+            WHERE inspected_at IS NULL;
+"""
+
+DROP_CANDIDATE_PARTITION_KEY_TRIGGER_SQL = """
+            DROP TRIGGER IF EXISTS candidate_partition_key_trigger ON public.batid_candidate;
+            DROP FUNCTION IF EXISTS public.set_candidate_partition_key();
+            DROP FUNCTION IF EXISTS public.candidate_partition_key(geometry);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("batid", "0153_buildingplotreadonly_backfill"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            CANDIDATE_PARTITION_KEY_TRIGGER_SQL,
+            reverse_sql=DROP_CANDIDATE_PARTITION_KEY_TRIGGER_SQL,
+        ),
+    ]
@@ -5,8 +5,9 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional, cast
 
-from api_alpha.typeddict import SplitCreatedBuilding
+from api_alpha.typeddict import BuildingChanges, SplitCreatedBuilding
 from batid.exceptions import (
+    BuildingOverlapError,
     DatabaseInconsistency,
     EventUnknown,
     NotEnoughBuildings,
@@ -14,7 +15,10 @@ from batid.exceptions import (
     RevertNotAllowed,
 )
 from batid.services.bdg_status import BuildingStatus as BuildingStatusModel
-from batid.services.building_overlap import check_building_overlap
+from batid.services.building_overlap import (
+    check_building_overlap,
+    find_overlapping_buildings_many,
+)
 from batid.services.rnb_id import generate_rnb_id
 from batid.services.user import check_and_increment_contribution_count
 from batid.utils.db import from_now_to_infinity
@@ -29,6 +33,7 @@ from django.db import connection, transaction
 from django.db.models import CheckConstraint, F, Func, Q, UniqueConstraint
 from django.db.models.functions import Lower
 from django.db.models.indexes import Index
+from django.utils import timezone
 
 from .others import Address, SummerChallenge
 
@@ -125,6 +130,32 @@ class Building(BuildingAbstract):
         related_name="buildings_validated_by_read_only",
         through="BuildingValidatedByReadOnly",
     )
+    plots_read_only = models.ManyToManyField(  # type: ignore[var-annotated]
+        "Plot",
+        blank=True,
+        related_name="buildings_read_only",
+        through="BuildingPlotReadOnly",
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # keep the geometries as loaded, their vector tiles are invalidated on save
+        instance._loaded_geometries = (
+            instance.__dict__.get("shape"),
+            instance.__dict__.get("point"),
+        )
+        return instance
+
+    def save(self, *args, **kwargs):
+        from batid.services.vector_tiles.cache import invalidate_building_tiles
+
+        super().save(*args, **kwargs)
+
+        invalidate_building_tiles(
+            [*getattr(self, "_loaded_geometries", ()), self.shape, self.point]
+        )
+        self._loaded_geometries = (self.shape, self.point)
 
     def delete(self, *args, **kwargs):
         raise NotImplementedError(
@@ -427,6 +458,207 @@ class Building(BuildingAbstract):
 
         self.save()
 
+    @staticmethod
+    def bulk_update_events(
+        updates: list[tuple["Building", BuildingChanges]],
+        user: User,
+        score: bool = True,
+    ) -> list["Building"]:
+        """
+        Apply many building changes, each one being its own event, as update()
+        (or deactivate() when the changes set is_active to False) would do one by one.
+
+        The missing addresses are fetched from the BAN API before the transaction is opened.
+        All the changes are checked before any write. The shapes overlaps are checked at once,
+        against the buildings as they are after the changes. The buildings are written
+        with one query. The history rows are created by the database trigger.
+
+        Automated edits should set score to False: they do not count in the Summer Challenge.
+
+        Return the buildings which have changed.
+        """
+
+        Address.add_addresses_to_db_if_needed(
+            sorted(
+                {
+                    address_id
+                    for _, changes in updates
+                    for address_id in changes.get("addresses_id") or []
+                }
+            )
+        )
+
+        return Building._bulk_update_events(updates, user, score)
+
+    @staticmethod
+    @transaction.atomic
+    def _bulk_update_events(
+        updates: list[tuple["Building", BuildingChanges]],
+        user: User,
+        score: bool,
+    ) -> list["Building"]:
+
+        changed = []
+        overlap_checks = []
+
+        for bdg, changes in updates:
+            if changes.get("is_active") is False:
+                if not bdg.is_active:
+                    raise OperationOnInactiveBuilding(
+                        f"Impossible de désactiver un identifiant déjà inactif : {bdg.rnb_id}"
+                    )
+                changed.append((bdg, changes))
+                continue
+
+            status = changes.get("status")
+            addresses_id = changes.get("addresses_id")
+            ext_ids = changes.get("ext_ids")
+            shape = changes.get("shape")
+
+            building_identical = (
+                (status is None or status == bdg.status)
+                and (
+                    addresses_id is None
+                    or set(addresses_id) == set(bdg.addresses_id or [])
+                )
+                and (ext_ids is None or ext_ids == bdg.ext_ids)
+                and (shape is None or shape == bdg.shape)
+            )
+            if building_identical:
+                continue
+
+            if not bdg.is_active:
+                raise OperationOnInactiveBuilding(
+                    f"Impossible de mettre à jour un identifiant inactif : {bdg.rnb_id}"
+                )
+            if shape:
+                assert_shape_is_valid(shape)
+                if bdg.shape:
+                    assert_new_shape_is_close_enough(bdg.shape, shape)
+                overlap_checks.append((shape, bdg.rnb_id))
+
+            changed.append((bdg, changes))
+
+        # The buildings of the batch are compared with their shape after the changes:
+        # two buildings moved onto each other overlap, a building may take the place
+        # of one which is moved away or deactivated.
+        replaced = [
+            (bdg.rnb_id, Building._shape_after_changes(bdg, changes))
+            for bdg, changes in changed
+            if changes.get("is_active") is False
+            or changes.get("shape") is not None
+            or changes.get("status") is not None
+        ]
+        for overlapping in find_overlapping_buildings_many(
+            overlap_checks, replaced=replaced
+        ):
+            if overlapping:
+                raise BuildingOverlapError(overlapping)
+
+        if not changed:
+            return []
+
+        check_and_increment_contribution_count(user, len(changed))
+
+        now = timezone.now()
+        old_geometries = []
+
+        for bdg, changes in changed:
+            old_geometries += [bdg.shape, bdg.point]
+
+            bdg.event_id = uuid.uuid4()
+            bdg.event_user = user
+            bdg.event_origin = changes.get("event_origin")
+            bdg.revert_event_id = None
+            bdg.updated_at = now
+
+            if changes.get("is_active") is False:
+                bdg.event_type = EventType.DEACTIVATION.value
+                bdg.is_active = False
+
+                if score and (bdg.event_origin or {}).get("source") == "contribution":
+                    SummerChallenge.score_deactivation(
+                        user, bdg.point, bdg.rnb_id, bdg.event_id
+                    )
+                continue
+
+            bdg.event_type = EventType.UPDATE.value
+            bdg.validated_by = []
+
+            status = changes.get("status")
+            if status is not None and bdg.status != status:
+                bdg.status = status
+                if score:
+                    SummerChallenge.score_status(
+                        user, bdg.point, bdg.rnb_id, bdg.event_id
+                    )
+
+            if changes.get("ext_ids") is not None:
+                bdg.ext_ids = changes["ext_ids"]
+
+            shape = changes.get("shape")
+            if shape is not None and bdg.shape != shape:
+                bdg.shape = shape
+                bdg.point = shape.point_on_surface
+                if score:
+                    SummerChallenge.score_shape(
+                        user, bdg.point, bdg.rnb_id, bdg.event_id
+                    )
+
+            addresses_id = changes.get("addresses_id")
+            if addresses_id is not None:
+                if score and bdg.addresses_id != addresses_id:
+                    SummerChallenge.score_address(
+                        user, bdg.point, bdg.rnb_id, bdg.event_id
+                    )
+                bdg.addresses_id = addresses_id
+
+        bdgs = [bdg for bdg, _ in changed]
+        Building.objects.bulk_update(
+            bdgs,
+            [
+                "status",
+                "ext_ids",
+                "shape",
+                "point",
+                "addresses_id",
+                "validated_by",
+                "is_active",
+                "event_type",
+                "event_id",
+                "event_user",
+                "event_origin",
+                "revert_event_id",
+                "updated_at",
+            ],
+            batch_size=1000,
+        )
+
+        # bulk_update does not call save(), which invalidates the vector tiles
+        from batid.services.vector_tiles.cache import invalidate_building_tiles
+
+        invalidate_building_tiles(
+            old_geometries + [g for bdg in bdgs for g in (bdg.shape, bdg.point)]
+        )
+        for bdg in bdgs:
+            bdg._loaded_geometries = (bdg.shape, bdg.point)
+
+        return bdgs
+
+    @staticmethod
+    def _shape_after_changes(
+        bdg: "Building", changes: BuildingChanges
+    ) -> Optional[GEOSGeometry]:
+        # the shape other buildings can overlap once the changes are applied
+        if changes.get("is_active") is False:
+            return None
+
+        status = changes.get("status") or bdg.status
+        if status not in BuildingStatusModel.REAL_BUILDINGS_STATUS:
+            return None
+
+        return changes.get("shape") or bdg.shape
+
     @staticmethod
     def revert_update(
         user: User, event_origin: dict, event_id_to_revert: uuid.UUID
@@ -1,3 +1,6 @@
+import threading
+import time
+
 import requests
 from batid.exceptions import (
     BANAPIDown,
@@ -5,12 +8,19 @@ from batid.exceptions import (
     BANBadResultType,
     BANUnknownCleInterop,
 )
+from batid.utils.misc import map_in_threads
 from batid.validators import JSONSchemaValidator
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models
 from django.contrib.gis.geos import Point
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+
+# the missing addresses are looked up on the BAN API by a few threads,
+# spaced to stay under the API rate limit (50 requests/s)
+BAN_LOOKUP_WORKERS = 4
+BAN_LOOKUP_MIN_INTERVAL = 0.02
 
 
 class BuildingAddressesReadOnly(models.Model):
@@ -29,6 +39,17 @@ class BuildingValidatedByReadOnly(models.Model):
         unique_together = ("building", "user")
 
 
+class BuildingPlotReadOnly(models.Model):
+    # kept up to date by postgres triggers on the buildings and plots shapes
+    building = models.ForeignKey("Building", on_delete=models.CASCADE, db_index=True)
+    plot = models.ForeignKey("Plot", on_delete=models.CASCADE, db_index=True)
+    # share of the building shape covered by the plot
+    bdg_cover_ratio = models.FloatField()
+
+    class Meta:
+        unique_together = ("building", "plot")
+
+
 class City(models.Model):
     id = models.AutoField(primary_key=True)
     code_insee = models.CharField(max_length=10, null=False, db_index=True, unique=True)
@@ -38,6 +59,13 @@ class City(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
 
+class City_subdivided(models.Model):
+    # this model exists for performance reasons, as Department_subdivided
+    # it is filled from City by a trigger (see migration 0149)
+    code_insee = models.CharField(max_length=10, null=False, db_index=True)
+    shape = models.PolygonField(null=False, spatial_index=True, srid=4326)
+
+
 class Department(models.Model):
     id = models.AutoField(primary_key=True)
     code = models.CharField(max_length=3, null=False, db_index=True, unique=True)
@@ -116,6 +144,82 @@ class Candidate(models.Model):
     inspection_details = models.JSONField(null=True)
     created_by = models.JSONField(null=True)
     random = models.IntegerField(db_index=True, null=False, default=0)
+    # spatial key (geohash cell) used to split the inspection work between workers
+    # set by a trigger at insert, see batid.services.candidate.PARTITION_GEOHASH_PRECISION
+    partition_key = models.CharField(max_length=12, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["partition_key", "random"],
+                condition=models.Q(inspected_at__isnull=True),
+                name="candidate_partition_todo_idx",
+            ),
+        ]
+
+
+class BuildingGridCell(models.Model):
+    # Number of active and real buildings per zoom 16 tile (x, y), and the sum of their
+    # points coordinates (EPSG:3857) to draw clusters on the low zoom vector tiles.
+    # This table is maintained by a trigger on batid_building, do not write in it.
+    x = models.IntegerField()
+    y = models.IntegerField()
+    count = models.IntegerField(default=0)
+    sum_x = models.FloatField(default=0)
+    sum_y = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["x", "y"], name="building_grid_cell_xy")
+        ]
+
+
+class BuildingGeneralized(models.Model):
+    # Simplified copy of the active and real buildings in EPSG:3857, for the medium zoom vector tiles.
+    # This table is maintained by a trigger on batid_building, do not write in it.
+    building_id = models.BigIntegerField(primary_key=True)
+    rnb_id = models.CharField(max_length=12)
+    status = models.CharField(max_length=30)
+    is_validated = models.BooleanField(default=False)
+    point = models.PointField(srid=3857, spatial_index=True)
+    shape = models.GeometryField(srid=3857, null=True, spatial_index=True)
+
+
+class TileAreaEdit(models.Model):
+    # Last edit (time.time_ns()) of the data of a vector tiles layer in a zoom 14 tile (x, y).
+    # The archived tiles rendered before it are not served, see batid/services/vector_tiles/cache.py
+    layer = models.CharField(max_length=20)
+    x = models.IntegerField()
+    y = models.IntegerField()
+    edited_at = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["layer", "x", "y"], name="tile_area_edit_layer_xy"
+            )
+        ]
+
+
+class DiffSegment(models.Model):
+    # Gzipped CSV rows (without header) of the /buildings/diff of a closed day (UTC),
+    # for all of France (empty insee_code) or for a city where buildings changed that day.
+    # Built by batid.services.bdg_diff.build_diff_segments
+    # The segments of a day are deleted by triggers when their rows change (see migration 0151)
+    day = models.DateField()
+    insee_code = models.CharField(max_length=10, blank=True, default="")
+    data = models.BinaryField()
+    # the users whose username or organization are in the rows (segment of all of France only)
+    user_ids = ArrayField(models.IntegerField(), null=False, default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "insee_code"], name="diff_segment_day_insee_code"
+            )
+        ]
+        indexes = [GinIndex(fields=["user_ids"], name="diff_segment_user_ids_idx")]
 
 
 class Plot(models.Model):
@@ -153,18 +257,67 @@ class Address(models.Model):
     @staticmethod
     def add_addresses_to_db_if_needed(addresses_id: list[str]) -> None:
         """given a list of "clés d'interopérabilité BAN", we add those addresses to our Address table if they don't exist yet."""
-        for address_id in addresses_id:
-            Address.add_address_to_db_if_needed(address_id)
+        missing = Address.missing_addresses(addresses_id)
+        if not missing:
+            return
+
+        addresses = []
+        for result in Address.fetch_from_ban_api(missing):
+            if isinstance(result, Exception):
+                raise result
+            addresses.append(result)
+
+        # the address may have been added by a concurrent request in the meantime
+        Address.objects.bulk_create(addresses, ignore_conflicts=True)
 
     @staticmethod
     def add_address_to_db_if_needed(address_id: str) -> None:
-        if Address.objects.filter(id=address_id).exists():
-            return
-        else:
-            Address.add_new_address_from_ban_api(address_id)
+        Address.add_addresses_to_db_if_needed([address_id])
+
+    @staticmethod
+    def missing_addresses(addresses_id: list[str]) -> list[str]:
+        """
+        The ids absent from our Address table (where the BAN is imported), found with one query.
+        """
+        known = set(
+            Address.objects.filter(id__in=addresses_id).values_list("id", flat=True)
+        )
+        return [
+            address_id
+            for address_id in dict.fromkeys(addresses_id)
+            if address_id not in known
+        ]
+
+    @staticmethod
+    def fetch_from_ban_api(addresses_id: list[str]) -> list:
+        """
+        Look up the addresses on the BAN API, BAN_LOOKUP_WORKERS at a time and at most
+        one request every BAN_LOOKUP_MIN_INTERVAL seconds. Nothing is written in the database,
+        so it can be called before opening a transaction.
+
+        Return, in the same order, an unsaved Address or the BAN exception of each id.
+        """
+
+        def lookup(address_id):
+            _ban_rate_limiter.wait()
+            try:
+                return Address.address_from_ban_api(address_id)
+            except (
+                BANUnknownCleInterop,
+                BANBadRequest,
+                BANAPIDown,
+                BANBadResultType,
+            ) as e:
+                return e
+
+        return list(map_in_threads(lookup, iter(addresses_id), BAN_LOOKUP_WORKERS))
 
     @staticmethod
     def add_new_address_from_ban_api(address_id):
+        Address.address_from_ban_api(address_id).save()
+
+    @staticmethod
+    def address_from_ban_api(address_id) -> "Address":
 
         BAN_API_URL = "https://plateforme.adresse.data.gouv.fr/lookup/"
 
@@ -173,7 +326,7 @@ class Address(models.Model):
 
         if r.status_code == 200:
             data = r.json()
-            Address.save_new_address(data)
+            return Address.address_from_ban_data(data)
         elif r.status_code == 404:
             raise BANUnknownCleInterop
         elif r.status_code == 400:
@@ -183,10 +336,14 @@ class Address(models.Model):
 
     @staticmethod
     def save_new_address(data: dict):
+        Address.address_from_ban_data(data).save()
+
+    @staticmethod
+    def address_from_ban_data(data: dict) -> "Address":
         if data["type"] != "numero":
             raise BANBadResultType
 
-        Address.objects.create(
+        return Address(
             id=data["cleInterop"],
             source="ban",
             point=Point(data["lon"], data["lat"], srid=4326),
@@ -202,6 +359,26 @@ class Address(models.Model):
         )
 
 
+class _RateLimiter:
+    """Spaces the calls to wait(), across threads, by at least min_interval seconds."""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.min_interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_ban_rate_limiter = _RateLimiter(BAN_LOOKUP_MIN_INTERVAL)
+
+
 class Organization(models.Model):
     name = models.CharField(max_length=100, null=False)
     short_name = models.CharField(max_length=30, null=True, blank=True)
@@ -234,19 +411,19 @@ class UserProfile(models.Model):
     max_allowed_contributions = models.IntegerField(null=False, default=500)
     total_contributions = models.IntegerField(null=False, default=0)
 
-    def check_and_increment_contribution_count(self) -> None:
+    def check_and_increment_contribution_count(self, count: int = 1) -> None:
         from api_alpha.exceptions import TooManyContributions
 
         if (
             settings.ENVIRONMENT != "sandbox"
             and not self.user.is_staff
-            and self.total_contributions >= self.max_allowed_contributions
+            and self.total_contributions + count > self.max_allowed_contributions
         ):
             raise TooManyContributions(
                 detail=f"{self.user.username} a atteint ou dépassé le nombre maximum de contributions autorisées ({self.max_allowed_contributions}). Veuillez nous contacter à rnb@beta.gouv.fr pour plus d'informations."
             )
 
-        self.total_contributions += 1
+        self.total_contributions += count
         self.save(update_fields=["total_contributions"])
 
 
@@ -1,10 +1,8 @@
 from dataclasses import dataclass
-from zoneinfo import ZoneInfo
 
-from batid.models.others import SummerChallenge
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models
-from django.db.models.functions import TruncDate
+from django.contrib.postgres.fields import ArrayField
 
 
 @dataclass(frozen=True)
@@ -50,6 +48,24 @@ class TrophyDef:
         ]
 
 
+class TrophyProgress(models.Model):
+    """
+    What the trophies of a user are computed from: their number of validations, the
+    calendar days (Europe/Paris) and the cities (INSEE codes) of their validations.
+
+    Each row is maintained by a trigger on the SummerChallenge validations (see migration
+    0150), the trophies checks read it instead of aggregating SummerChallenge.
+    """
+
+    user = models.OneToOneField(User, on_delete=models.PROTECT, primary_key=True)
+    # indexed: the leaderboard (see Trophy.check_and_award_superv)
+    validations = models.PositiveIntegerField(null=False, default=0, db_index=True)
+    validation_days = ArrayField(models.DateField(), null=False, default=list)
+    validation_cities = ArrayField(
+        models.CharField(max_length=10), null=False, default=list
+    )
+
+
 class Trophy(models.Model):
     """
     Each row represents of trophy won by a user, with the corresponding timestamp and the
@@ -69,8 +85,6 @@ class Trophy(models.Model):
             )
         ]
 
-    PARIS_TZ = ZoneInfo("Europe/Paris")
-
     # Values stored in the `trophy_type` column, one per trophy.
     VALIDATEUR = "validateur"
     # "course de fond" counts consecutive calendar days (Europe/Paris) with at least
@@ -253,7 +267,9 @@ class Trophy(models.Model):
     def check_and_award_all(user):
         """Run every badge check for the user and return the list of newly unlocked
         trophies, each as {"trophy_type": ..., "level": ...}. Empty list when nothing
-        new."""
+        new.
+
+        Called asynchronously after the validations, see the award_trophies task."""
         results = []
         for check in (
             Trophy.check_and_award_validateur,
@@ -266,6 +282,11 @@ class Trophy(models.Model):
                 results.append(trophy)
         return results
 
+    @staticmethod
+    def _progress(user):
+        """The TrophyProgress of the user, None when they have never validated."""
+        return TrophyProgress.objects.filter(user=user).first()
+
     @staticmethod
     def _award_threshold_badge(user, trophy_type, thresholds, measure):
         """Award the cumulative levels of a threshold-based badge. `thresholds` is a
@@ -308,7 +329,8 @@ class Trophy(models.Model):
         if not user or not user.is_authenticated:
             return None
 
-        count = SummerChallenge.objects.filter(user=user, action="validation").count()
+        progress = Trophy._progress(user)
+        count = progress.validations if progress else 0
         validateur = Trophy.TROPHIES[Trophy.VALIDATEUR]
         return Trophy._award_threshold_badge(
             user, validateur.trophy_type, validateur.thresholds, count
@@ -325,12 +347,8 @@ class Trophy(models.Model):
         if not user or not user.is_authenticated:
             return None
 
-        days = (
-            SummerChallenge.objects.filter(user=user, action="validation")
-            .annotate(day=TruncDate("created_at", tzinfo=Trophy.PARIS_TZ))
-            .values_list("day", flat=True)
-            .distinct()
-        )
+        progress = Trophy._progress(user)
+        days = progress.validation_days if progress else []
         streak = Trophy._longest_consecutive_day_streak(days)
         course_de_fond = Trophy.TROPHIES[Trophy.COURSE_DE_FOND]
         return Trophy._award_threshold_badge(
@@ -366,14 +384,9 @@ class Trophy(models.Model):
 
         codes = Trophy.TOUR_DE_FRANCE_2026_INSEE_CODES
 
-        distinct_cities = (
-            SummerChallenge.objects.filter(
-                user=user, action="validation", city__code_insee__in=codes
-            )
-            .values_list("city__code_insee", flat=True)
-            .distinct()
-            .count()
-        )
+        progress = Trophy._progress(user)
+        cities = progress.validation_cities if progress else []
+        distinct_cities = len(set(cities) & set(codes))
         # The last level requires every stage city, so read its threshold from the code
         # list at call time (tests patch it); lower levels keep the definition's values.
         tdf = Trophy.TROPHIES[Trophy.TOUR_DE_FRANCE]
@@ -394,13 +407,11 @@ class Trophy(models.Model):
             return None
 
         top = (
-            SummerChallenge.objects.filter(action="validation")
-            .values("user")
-            .annotate(c=models.Count("id"))
-            .order_by("-c")
+            TrophyProgress.objects.filter(validations__gt=0)
+            .order_by("-validations")
             .first()
         )
-        if not top or top["user"] != user.id:
+        if not top or top.user_id != user.id:
             return None
 
         holder = Trophy.objects.filter(trophy_type=Trophy.SUPERV).first()
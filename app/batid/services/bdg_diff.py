@@ -0,0 +1,307 @@
+import gzip
+import io
+from datetime import date, datetime, time, timedelta, timezone
+from typing import IO, Optional
+
+from batid.models import DiffSegment
+from django.db import connection, transaction
+from django.db.models import BinaryField, Case, When
+from psycopg2 import sql
+
+# The rows of the /buildings/diff CSV of each closed day (UTC) are precomputed
+# into gzipped segments (see DiffSegment), for all of France and for each city
+# where a building has changed that day. The diff is streamed from the segments,
+# only the days not built yet (including today) are queried from the history table.
+# The segments of a day are deleted by triggers when its rows change (see migration 0151):
+# the day is queried again until it is built again.
+
+# segments older than the maximum diff period are useless
+SEGMENTS_MAX_DAYS = 185
+
+CHANGED_CITIES_SQL = """
+    SELECT DISTINCT c.code_insee
+    FROM batid_building_with_history bb
+    JOIN batid_city_subdivided c ON ST_Intersects(bb.shape, c.shape)
+    WHERE lower(bb.sys_period) > %(start)s AND lower(bb.sys_period) <= %(end)s
+"""
+
+# the users whose username or organization are written in the rows of the day
+CHANGED_USERS_SQL = """
+    SELECT COALESCE(array_agg(DISTINCT u.id), '{}')
+    FROM (
+        SELECT bb.event_user_id AS id
+        FROM batid_building_with_history bb
+        WHERE lower(bb.sys_period) > %(start)s AND lower(bb.sys_period) <= %(end)s
+        UNION
+        SELECT unnest(bb.validated_by)
+        FROM batid_building_with_history bb
+        WHERE lower(bb.sys_period) > %(start)s AND lower(bb.sys_period) <= %(end)s
+    ) u
+    WHERE u.id IS NOT NULL
+"""
+
+# The changes are dated from the start of their transaction: the oldest running
+# transaction may still write changes dated from its start.
+# NB: the sessions of the other database roles are not seen without pg_read_all_stats.
+OLDEST_TRANSACTION_SQL = """
+    SELECT min(xact_start)
+    FROM pg_stat_activity
+    WHERE datname = current_database()
+    AND backend_type = 'client backend'
+    AND pid <> pg_backend_pid()
+"""
+
+# the same keys as the triggers of migration 0151
+LOCK_SQL = """
+    SELECT pg_try_advisory_xact_lock(hashtext('batid_diffsegment'), %(day)s)
+    AND pg_try_advisory_xact_lock(hashtext('batid_diffsegment'), -1)
+"""
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def last_closed_day(now: Optional[datetime] = None) -> date:
+    """
+    The last day whose changes are all committed: it is over and no transaction
+    started before its end is still running.
+    """
+    limit = now or datetime.now(timezone.utc)
+
+    with connection.cursor() as cursor:
+        cursor.execute(OLDEST_TRANSACTION_SQL)
+        oldest_transaction = cursor.fetchone()[0]
+
+    if oldest_transaction is not None:
+        limit = min(limit, oldest_transaction)
+
+    return limit.astimezone(timezone.utc).date() - timedelta(days=1)
+
+
+def build_diff_segments(
+    days: int = SEGMENTS_MAX_DAYS, now: Optional[datetime] = None
+) -> int:
+    """
+    Build the segments of the closed days of the period which have not been built yet
+    (or whose segments have been deleted since) and delete the segments older than the
+    period. Return the number of days built.
+    """
+    last_day = last_closed_day(now)
+    first_day = last_day - timedelta(days=days - 1)
+
+    built_days = set(
+        DiffSegment.objects.filter(
+            insee_code="", day__gte=first_day, day__lte=last_day
+        ).values_list("day", flat=True)
+    )
+
+    count = 0
+    day = first_day
+    while day <= last_day:
+        if day not in built_days and build_day_segments(day):
+            count += 1
+        day += timedelta(days=1)
+
+    DiffSegment.objects.filter(day__lt=first_day).delete()
+
+    return count
+
+
+def build_day_segments(day: date) -> bool:
+    """
+    Build the segments of the day. Return False, without building them, when
+    a transaction changing the rows of the day is running: the day is built later.
+    """
+    start_ts = day_start(day)
+    end_ts = day_start(day + timedelta(days=1))
+
+    # the lock is held until the segments are saved: the changes made meanwhile
+    # wait for it, then delete the new segments
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(LOCK_SQL, {"day": (day - date(1970, 1, 1)).days})
+        if not cursor.fetchone()[0]:
+            return False
+
+        cursor.execute(CHANGED_USERS_SQL, {"start": start_ts, "end": end_ts})
+        user_ids = cursor.fetchone()[0]
+
+        segments = [
+            DiffSegment(
+                day=day,
+                insee_code="",
+                data=gzip.compress(
+                    _copy_to_bytes(cursor, diff_copy_query(start_ts, end_ts))
+                ),
+                user_ids=user_ids,
+            )
+        ]
+
+        cursor.execute(CHANGED_CITIES_SQL, {"start": start_ts, "end": end_ts})
+        codes = [row[0] for row in cursor.fetchall()]
+
+        for code in codes:
+            # the same query as the live diff of the city, the output is identical
+            data = _copy_to_bytes(cursor, diff_copy_query(start_ts, end_ts, code))
+            if data:
+                segments.append(
+                    DiffSegment(day=day, insee_code=code, data=gzip.compress(data))
+                )
+
+        # the segment of all of France is the mark of a built day
+        DiffSegment.objects.filter(day=day).delete()
+        DiffSegment.objects.bulk_create(segments)
+
+    return True
+
+
+def write_diff(
+    cursor,
+    w: IO,
+    since: datetime,
+    until: datetime,
+    insee_code: Optional[str] = None,
+):
+    """
+    Write to w the CSV of the changes made after `since` until the `until` time.
+    The closed days are read from their segments, the other days are queried.
+    """
+    since = since.astimezone(timezone.utc)
+    built_days = set(
+        DiffSegment.objects.filter(
+            insee_code="", day__gt=since.date(), day__lte=until.date()
+        ).values_list("day", flat=True)
+    )
+
+    start_ts = since
+    first_query = True
+
+    while start_ts < until:
+        day = start_ts.date()
+        end_ts = day_start(day + timedelta(days=1))
+
+        # the first query gives the CSV header
+        if not first_query and start_ts == day_start(day) and day in built_days:
+            segments = _day_segments(day, insee_code or "")
+            # the segments of the day may have been deleted since built_days was read
+            if "" in segments:
+                # no segment for a city means no change that day
+                data = segments.get(insee_code or "")
+                if data:
+                    w.write(gzip.decompress(data))
+                start_ts = end_ts
+                continue
+
+        sql_query = diff_copy_query(start_ts, end_ts, insee_code, header=first_query)
+        first_query = False
+        cursor.copy_expert(sql_query, w)
+
+        start_ts = end_ts
+
+
+def _day_segments(day: date, insee_code: str) -> dict:
+    # in a single query, the mark of a built day and the data of the segment requested
+    return dict(
+        DiffSegment.objects.filter(
+            day=day, insee_code__in=["", insee_code]
+        ).values_list(
+            "insee_code",
+            Case(When(insee_code=insee_code, then="data"), output_field=BinaryField()),
+        )
+    )
+
+
+def _copy_to_bytes(cursor, sql_query: sql.Composed) -> bytes:
+    buffer = io.BytesIO()
+    cursor.copy_expert(sql_query, buffer)
+    return buffer.getvalue()
+
+
+def diff_copy_query(
+    start_ts: datetime,
+    end_ts: datetime,
+    insee_code: Optional[str] = None,
+    header: bool = False,
+) -> sql.Composed:
+    # the buildings intersecting the city, on its subdivided shape (see City_subdivided)
+    spatial_filter = ""
+    if insee_code:
+        spatial_filter = """ AND EXISTS (
+                SELECT 1 FROM batid_city_subdivided cs
+                WHERE cs.code_insee = {insee_code} AND ST_Intersects(bb.shape, cs.shape)
+            )"""
+
+    raw_sql = (
+        """
+        COPY (
+            select
+            CASE
+                WHEN event_type = 'delete' THEN 'deactivate'
+                WHEN event_type = 'deactivation' THEN 'deactivate'
+                WHEN event_type = 'update' THEN 'update'
+                WHEN event_type = 'split' and not bb.is_active THEN 'deactivate'
+                WHEN event_type = 'split' and bb.is_active THEN 'create'
+                WHEN event_type = 'merge' and not bb.is_active THEN 'deactivate'
+                WHEN event_type = 'merge' and bb.is_active THEN 'create'
+                WHEN event_type = 'reactivation' THEN 'reactivate'
+                WHEN event_type = 'creation' THEN 'create'
+                WHEN event_type = 'revert_creation' THEN 'deactivate'
+                WHEN event_type = 'revert_update' THEN 'update'
+                WHEN event_type = 'revert_merge' and not bb.is_active THEN 'deactivate'
+                WHEN event_type = 'revert_merge' and bb.is_active THEN 'reactivate'
+                WHEN event_type = 'revert_split' and not bb.is_active THEN 'deactivate'
+                WHEN event_type = 'revert_split' and bb.is_active THEN 'reactivate'
+                ELSE CONCAT('unhandled_event_type_', event_type)
+            END as action,
+            rnb_id,
+            status,
+            bb.is_active::int,
+            sys_period,
+            ST_AsEWKT(point) as point,
+            ST_AsEWKT(shape) as shape,
+            to_json(addresses_id) as addresses_id,
+            COALESCE(ext_ids, '[]'::jsonb) as ext_ids,
+            parent_buildings,
+            event_id,
+            event_type,
+            COALESCE(u.username, 'RNB') as username,
+            (
+                SELECT COALESCE(json_agg(
+                    json_build_object(
+                        'id', mu.id,
+                        'username', mu.username,
+                        'organization_name', mu_org.name,
+                        'organization_short_name', mu_org.short_name
+                    ) ORDER BY mu.id
+                ), '[]'::json)
+                FROM auth_user mu
+                LEFT JOIN LATERAL (
+                    SELECT org.name, org.short_name
+                    FROM batid_userprofile up
+                    JOIN batid_organization org ON up.organization_id = org.id
+                    WHERE up.user_id = mu.id
+                    LIMIT 1
+                ) AS mu_org ON TRUE
+                WHERE mu.id = ANY(bb.validated_by)
+            ) as validated_by
+            FROM batid_building_with_history bb
+            LEFT JOIN auth_user u on u.id = bb.event_user_id
+            where lower(sys_period) > {start}::timestamp with time zone and lower(sys_period) <= {end}::timestamp with time zone"""
+        + spatial_filter  # nosec B608: spatial_filter is a constant, the insee code is escaped via sql.Literal() below
+        + """
+            order by lower(sys_period), is_active, rnb_id
+        ) TO STDOUT WITH CSV
+        """
+    )
+
+    if header:
+        raw_sql = raw_sql + " HEADER"
+
+    format_args = {
+        "start": sql.Literal(start_ts.isoformat()),
+        "end": sql.Literal(end_ts.isoformat()),
+    }
+    if insee_code:
+        format_args["insee_code"] = sql.Literal(insee_code)
+
+    return sql.SQL(raw_sql).format(**format_args)
@@ -1,8 +1,7 @@
 from batid.exceptions import PlotUnknown
 from batid.models import Building, Plot
-from django.contrib.gis.db.models.functions import Area, Intersection
-from django.db.models import Case, F, Func, When
-from django.db.models.lookups import Exact
+from django.db import connection, transaction
+from django.db.models import F
 
 
 def get_buildings_on_plot(plot_id: str):
@@ -11,21 +10,11 @@ def get_buildings_on_plot(plot_id: str):
     except Plot.DoesNotExist:
         raise PlotUnknown(f"plot id {plot_id} is unknown to the RNB")
 
+    # the cover ratios are precomputed in the building/plot links
     qs = (
         Building.objects.filter(is_active=True)
-        .filter(shape__intersects=plot.shape)
-        .annotate(
-            bdg_cover_ratio=Case(
-                When(
-                    Exact(
-                        Func(F("shape"), function="ST_AREA"),
-                        0,
-                    ),
-                    then=1.0,
-                ),
-                default=Area(Intersection("shape", plot.shape)) / Area("shape"),
-            )
-        )
+        .filter(buildingplotreadonly__plot=plot)
+        .annotate(bdg_cover_ratio=F("buildingplotreadonly__bdg_cover_ratio"))
         .order_by("-bdg_cover_ratio", "rnb_id")
     )
 
@@ -33,3 +22,27 @@ def get_buildings_on_plot(plot_id: str):
     qs = qs.prefetch_related("validated_by_read_only")
 
     return qs
+
+
+def refresh_building_plots(dpt: str):
+    # The building/plot links are kept up to date by postgres triggers.
+    # This procedure computes again all the links of a department plots,
+    # eg after fixing links written by hand.
+    params = {"dpt_prefix": f"{dpt}%"}
+
+    # the links of the department are never read missing
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM batid_buildingplotreadonly WHERE plot_id LIKE %(dpt_prefix)s",
+            params,
+        )
+        cursor.execute(
+            """
+            INSERT INTO batid_buildingplotreadonly (building_id, plot_id, bdg_cover_ratio)
+            SELECT b.id, p.id, bdg_plot_cover_ratio(b.shape, p.shape)
+            FROM batid_plot p
+            JOIN batid_building b ON ST_Intersects(b.shape, p.shape)
+            WHERE p.id LIKE %(dpt_prefix)s
+            """,
+            params,
+        )
@@ -1,4 +1,4 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from batid.exceptions import BuildingOverlapError
 from batid.services.bdg_status import BuildingStatus
@@ -6,6 +6,9 @@ from django.conf import settings
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import connection
 
+# number of geometries checked by each query of find_overlapping_buildings_many
+OVERLAP_CHUNK_SIZE = 1000
+
 
 def check_building_overlap(
     shape: GEOSGeometry,
@@ -46,43 +49,111 @@ def _find_overlapping_buildings(
         List of dicts {"rnb_id": str, "overlap_ratio": float} for buildings
         exceeding the overlap threshold.
     """
+    return find_overlapping_buildings_many([(shape, exclude_rnb_id)])[0]
+
+
+def find_overlapping_buildings_many(
+    items: list[tuple[GEOSGeometry | None, str | None]],
+    replaced: Optional[list[tuple[str, GEOSGeometry | None]]] = None,
+) -> list[list[dict]]:
+    """
+    Batch version of _find_overlapping_buildings: the overlaps of many geometries
+    are found with one query per chunk of OVERLAP_CHUNK_SIZE geometries.
+
+    Args:
+        items: List of (shape, exclude_rnb_id) pairs. A None shape has no overlap.
+        replaced: List of (rnb_id, shape) pairs of the buildings changed along with the items.
+            Their shape in the database is ignored: the items are compared with the given shape,
+            or with nothing when it is None (eg the building is deactivated).
+
+    Returns:
+        For each item, in the same order, the list of dicts
+        {"rnb_id": str, "overlap_ratio": float} for buildings exceeding the overlap threshold.
+    """
+
+    replaced = replaced or []
+    overlapping_buildings: list[list[dict]] = [[] for _ in items]
 
-    # SQL query to find intersecting buildings
-    # and compute overlap ratios in both directions
+    to_check = [idx for idx, (shape, _) in enumerate(items) if shape is not None]
+
+    for start in range(0, len(to_check), OVERLAP_CHUNK_SIZE):
+        chunk = to_check[start : start + OVERLAP_CHUNK_SIZE]
+        for idx, overlap in _find_chunk_overlaps(
+            chunk,
+            [items[idx][0].wkt for idx in chunk],
+            [items[idx][1] for idx in chunk],
+            replaced,
+        ):
+            overlapping_buildings[idx].append(overlap)
+
+    return overlapping_buildings
+
+
+def _find_chunk_overlaps(
+    idxs: list[int],
+    wkts: list[str],
+    exclude_rnb_ids: list[str | None],
+    replaced: list[tuple[str, GEOSGeometry | None]],
+):
+
+    # SQL query to find the buildings intersecting each new geometry
+    # and compute overlap ratios in both directions.
+    # The replaced buildings are compared with their new shape instead of the database one.
     query = """
         WITH new_geom AS (
-            SELECT ST_GeomFromText(%(new_shape)s, 4326) as geom
+            SELECT idx, ST_GeomFromText(wkt, 4326) as geom, exclude_rnb_id
+            FROM unnest(%(idxs)s::int[], %(wkts)s::text[], %(exclude_rnb_ids)s::text[])
+                AS t(idx, wkt, exclude_rnb_id)
+        ),
+        replaced AS (
+            SELECT rnb_id, ST_GeomFromText(wkt, 4326) as shape
+            FROM unnest(%(replaced_rnb_ids)s::text[], %(replaced_wkts)s::text[])
+                AS t(rnb_id, wkt)
+            WHERE wkt IS NOT NULL
+        ),
+        pairs AS (
+            SELECT ng.idx, ng.geom, b.rnb_id, b.shape
+            FROM new_geom ng
+            JOIN batid_building b ON ST_Intersects(b.shape, ng.geom)
+            WHERE
+                b.is_active = true
+                AND b.status=ANY(%(real_statuses)s)
+                AND (ng.exclude_rnb_id IS NULL OR b.rnb_id != ng.exclude_rnb_id)
+                AND b.rnb_id != ALL(%(replaced_rnb_ids)s::text[])
+            UNION ALL
+            SELECT ng.idx, ng.geom, r.rnb_id, r.shape
+            FROM new_geom ng
+            JOIN replaced r ON ST_Intersects(r.shape, ng.geom)
+            WHERE ng.exclude_rnb_id IS NULL OR r.rnb_id != ng.exclude_rnb_id
         )
         SELECT
-            b.rnb_id,
+            idx,
+            rnb_id,
             CASE
-                WHEN ST_Area(ng.geom) > 0 THEN
-                    ST_Area(ST_Intersection(b.shape, ng.geom)) / ST_Area(ng.geom)
+                WHEN ST_Area(geom) > 0 THEN
+                    ST_Area(ST_Intersection(shape, geom)) / ST_Area(geom)
                 ELSE 1
             END as new_in_existing_ratio,
             CASE
-                WHEN ST_Area(b.shape) > 0 THEN
-                    ST_Area(ST_Intersection(b.shape, ng.geom)) / ST_Area(b.shape)
+                WHEN ST_Area(shape) > 0 THEN
+                    ST_Area(ST_Intersection(shape, geom)) / ST_Area(shape)
                 ELSE 1
             END as existing_in_new_ratio
-        FROM batid_building b, new_geom ng
-        WHERE
-            b.is_active = true
-            AND b.status=ANY(%(real_statuses)s)
-            AND ST_Intersects(b.shape, ng.geom)
+        FROM pairs
+        ORDER BY idx
     """
 
     params: Dict[str, Any] = {
-        "new_shape": shape.wkt,
+        "idxs": idxs,
+        "wkts": wkts,
+        "exclude_rnb_ids": exclude_rnb_ids,
+        "replaced_rnb_ids": [rnb_id for rnb_id, _ in replaced],
+        "replaced_wkts": [
+            shape.wkt if shape is not None else None for _, shape in replaced
+        ],
         "real_statuses": list(BuildingStatus.REAL_BUILDINGS_STATUS),
     }
 
-    if exclude_rnb_id is not None:
-        query += "            AND b.rnb_id != %(exclude_rnb_id)s\n"
-        params["exclude_rnb_id"] = exclude_rnb_id
-
-    overlapping_buildings = []
-
     # used in tests to bypass the overlap verification
     BUILDING_OVERLAP_THRESHOLD = settings.BUILDING_OVERLAP_THRESHOLD
 
@@ -91,17 +162,13 @@ def _find_overlapping_buildings(
         rows = cursor.fetchall()
 
         for row in rows:
-            rnb_id, new_in_existing, existing_in_new = row
+            idx, rnb_id, new_in_existing, existing_in_new = row
 
             # Take the max ratio from both directions
             max_ratio = max(new_in_existing or 0, existing_in_new or 0)
 
             if max_ratio > BUILDING_OVERLAP_THRESHOLD:
-                overlapping_buildings.append(
-                    {
-                        "rnb_id": rnb_id,
-                        "overlap_ratio": max_ratio,
-                    }
-                )
-
-    return overlapping_buildings
+                yield idx, {
+                    "rnb_id": rnb_id,
+                    "overlap_ratio": max_ratio,
+                }
@@ -1,33 +1,109 @@
 import os
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
 from datetime import datetime, timezone
-from typing import Literal
-
-from batid.exceptions import BuildingTooLarge, BuildingTooSmall, InvalidWGS84Geometry
-from batid.models import Building, BuildingWithHistory, Candidate
+from typing import Literal, Optional
+
+import numpy as np
+import shapely
+from batid.exceptions import (
+    BuildingOverlapError,
+    BuildingTooLarge,
+    BuildingTooSmall,
+    InvalidWGS84Geometry,
+)
+from batid.models import (
+    Address,
+    Building,
+    BuildingWithHistory,
+    Candidate,
+    EventType,
+)
 from batid.services.bdg_status import BuildingStatus as BuildingStatusService
+from batid.services.building_overlap import (
+    check_building_overlap,
+    find_overlapping_buildings_many,
+)
 from batid.services.data_fix.fill_empty_event_origin import building_identicals
+from batid.services.rnb_id import generate_rnb_id
 from batid.services.RNB_team_user import get_RNB_team_user
-from batid.utils.geo import assert_shape_is_valid
+from batid.services.user import check_and_increment_contribution_count
+from batid.services.vector_tiles.cache import invalidate_building_tiles
+from batid.utils.geo import (
+    assert_shape_is_valid,
+    dwithin_bbox_deltas,
+    dwithin_bbox_sql,
+)
 from celery import Signature
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import connection, transaction
 from psycopg2 import sql
 
+# A 5 characters geohash cell is roughly 4.9km x 4.9km
+# The partition key is computed by a trigger when the candidate is inserted
+# (see migration 0154_candidate_partition_key_trigger)
+PARTITION_GEOHASH_PRECISION = 5
+# the workers waiting for the neighbours of their partitions give up after this many passes
+PARTITION_MAX_IDLE_PASSES = 60
+# seconds between two passes waiting for the neighbours locks
+PARTITION_LOCK_WAIT = 1
+
+PARTITION_UNLOCKS = {
+    "pg_try_advisory_lock": "pg_advisory_unlock",
+    "pg_try_advisory_lock_shared": "pg_advisory_unlock_shared",
+}
+
+# the geohash cells around a partition (none for the candidates without shape)
+PARTITION_NEIGHBOURS_SQL = """
+    SELECT DISTINCT ST_GeoHash(
+        ST_SetSRID(
+            ST_MakePoint(
+                ST_X(c) + dx * (ST_XMax(b) - ST_XMin(b)),
+                ST_Y(c) + dy * (ST_YMax(b) - ST_YMin(b))
+            ),
+            4326
+        ),
+        length(%(partition)s)
+    )
+    FROM ST_Box2dFromGeoHash(NULLIF(%(partition)s, '')) b,
+         ST_PointFromGeoHash(NULLIF(%(partition)s, '')) c,
+         generate_series(-1, 1) dx,
+         generate_series(-1, 1) dy
+    WHERE (dx, dy) <> (0, 0)
+    AND abs(ST_Y(c) + dy * (ST_YMax(b) - ST_YMin(b))) < 90
+"""
+
 
 class Inspector:
     MATCH_BIG_COVER_RATIO = 0.85
     MATCH_SMALL_COVER_RATIO = 0.10
-
-    def __int__(self):
+    # buildings closer than this radius (meters) to the candidate are compared with it
+    MATCHING_RADIUS = 3
+    # prefilter the buildings with their bbox in SRID 4326 before computing metric distances
+    BBOX_PREFILTER = True
+
+    def __init__(
+        self,
+        partition: Optional[str] = None,
+        candidate_ids: Optional[list[int]] = None,
+    ):
+        # When a partition is given, only the candidates of this spatial cell are inspected
+        self.partition = partition
+        # When ids are given, only those candidates are inspected
+        self.candidate_ids = candidate_ids
         self.candidate = None
         self.matching_bdgs = []
 
-    def inspect(self):
+    def inspect(self) -> int:
+        inspected_count = 0
         while True:
             self.inspect_one()
 
             if self.candidate is None:
-                return
+                return inspected_count
+            inspected_count += 1
 
     def inspect_one(self):
         self.reset()
@@ -52,28 +128,58 @@ class Inspector:
 
     def get_candidate(self):
         q = sql.SQL(
-            "SELECT id, ST_AsEWKB(shape) as shape, source, source_version, source_id, address_keys, is_light, inspected_at  FROM {candidate} WHERE inspected_at IS NULL ORDER BY inspected_at asc, random asc LIMIT 1 FOR UPDATE SKIP LOCKED"
+            "SELECT id, ST_AsEWKB(shape) as shape, source, source_version, source_id, address_keys, is_light, inspected_at  FROM {candidate} WHERE inspected_at IS NULL {partition_filter} {ids_filter} ORDER BY inspected_at asc, random asc LIMIT 1 FOR UPDATE SKIP LOCKED"
         ).format(
             candidate=sql.Identifier(Candidate._meta.db_table),
+            partition_filter=self.partition_filter(),
+            ids_filter=self.ids_filter(),
         )
-        qs = Candidate.objects.raw(q)
+        params = {"partition": self.partition, "candidate_ids": self.candidate_ids}
+        qs = Candidate.objects.raw(q, params)
         self.candidate = qs[0] if len(qs) > 0 else None
 
+    def partition_filter(self) -> sql.SQL:
+        if self.partition is None:
+            return sql.SQL("")
+
+        return sql.SQL("AND partition_key = %(partition)s")
+
+    def ids_filter(self) -> sql.SQL:
+        if self.candidate_ids is None:
+            return sql.SQL("")
+
+        return sql.SQL("AND id = ANY(%(candidate_ids)s)")
+
     def get_matching_bdgs(self):
 
+        bbox_filter = sql.SQL("")
+        params = {
+            "c_shape": f"{self.candidate.shape}",
+            "status": tuple(BuildingStatusService.REAL_BUILDINGS_STATUS),
+            "radius": self.MATCHING_RADIUS,
+        }
+
+        if self.BBOX_PREFILTER:
+            # The GiST index on shape can't be used by ST_DWithin on geographies.
+            # We first keep buildings in an expanded bbox, then compute the exact distance.
+            bbox_filter = sql.SQL(
+                "shape && ST_Expand(ST_SetSRID(ST_GeomFromText(%(c_shape)s), 4326), %(dx)s, %(dy)s) AND "
+            )
+            params["dx"], params["dy"] = dwithin_bbox_deltas(
+                self.candidate.shape, self.MATCHING_RADIUS
+            )
+
         q = sql.SQL(
             "SELECT id, ST_AsEWKB(shape) as shape "
             "FROM {building} "
-            "WHERE ST_DWithin(shape::geography, ST_GeomFromText(%(c_shape)s)::geography, 3) "
+            "WHERE {bbox_filter}"
+            "ST_DWithin(shape::geography, ST_GeomFromText(%(c_shape)s)::geography, %(radius)s) "
             "AND status IN %(status)s "
             "AND is_active = true"
         ).format(
             building=sql.Identifier(Building._meta.db_table),
+            bbox_filter=bbox_filter,
         )
-        params = {
-            "c_shape": f"{self.candidate.shape}",
-            "status": tuple(BuildingStatusService.REAL_BUILDINGS_STATUS),
-        }
         self.matching_bdgs = Building.objects.raw(q, params)
 
     def inspect_candidate(self):
@@ -104,8 +210,12 @@ class Inspector:
     def compare_matching_bdgs(self):
         kept_matches = []
 
-        for bdg in self.matching_bdgs:
-            shape_match_result = match_shapes(self.candidate.shape, bdg.shape)
+        match_results = self.match_results()
+
+        for bdg, shape_match_result in zip(self.matching_bdgs, match_results):
+            if shape_match_result is None:
+                # Not handled by the vectorized matcher, the pair is compared alone
+                shape_match_result = match_shapes(self.candidate.shape, bdg.shape)
 
             if shape_match_result == "match":
                 kept_matches.append(bdg)
@@ -129,40 +239,45 @@ class Inspector:
         if len(self.matching_bdgs) > 1:
             self.decide_refusal_too_many_geomatches()
 
+    def match_results(self) -> list:
+        return match_shapes_many(
+            self.candidate.shape, [bdg.shape for bdg in self.matching_bdgs]
+        )
+
     def decide_refusal_topology_exception(self):
         self.candidate.inspection_details = {
             "decision": "refusal",
             "reason": "topology_exception",
         }
-        self.candidate.save()
+        self.save_candidate()
 
     def decide_refusal_is_light(self):
         self.candidate.inspection_details = {
             "decision": "refusal",
             "reason": "is_light",
         }
-        self.candidate.save()
+        self.save_candidate()
 
     def decide_refusal_invalid_geometry(self):
         self.candidate.inspection_details = {
             "decision": "refusal",
             "reason": "invalid_geometry",
         }
-        self.candidate.save()
+        self.save_candidate()
 
     def decide_refusal_area_too_large(self):
         self.candidate.inspection_details = {
             "decision": "refusal",
             "reason": "area_too_large",
         }
-        self.candidate.save()
+        self.save_candidate()
 
     def decide_refusal_area_too_small(self):
         self.candidate.inspection_details = {
             "decision": "refusal",
             "reason": "area_too_small",
         }
-        self.candidate.save()
+        self.save_candidate()
 
     def decide_refusal_ambiguous_overlap(self, conflict_with_bdg: int):
         self.candidate.inspection_details = {
@@ -170,7 +285,7 @@ class Inspector:
             "reason": "ambiguous_overlap",
             "conflict_with_bdg": conflict_with_bdg,
         }
-        self.candidate.save()
+        self.save_candidate()
 
     def decide_refusal_too_many_geomatches(self):
         self.candidate.inspection_details = {
@@ -178,7 +293,7 @@ class Inspector:
             "reason": "too_many_geomatches",
             "matches": [bdg.id for bdg in self.matching_bdgs],
         }
-        self.candidate.save()
+        self.save_candidate()
 
     def decide_creation(self):
         # We build the new building
@@ -190,21 +305,14 @@ class Inspector:
             "rnb_id": bdg.rnb_id,
         }
 
-        self.candidate.save()
+        self.save_candidate()
 
     def decide_update(self):
-        bdg = Building.objects.get(id=self.matching_bdgs[0].id)
+        bdg = self.get_bdg_to_update(self.matching_bdgs[0].id)
         changes = self.calc_bdg_update(bdg)
 
         if changes:
-            bdg.update(
-                user=get_RNB_team_user(),
-                event_origin=changes.get("event_origin"),
-                status=None,
-                addresses_id=changes.get("addresses_id"),
-                ext_ids=changes.get("ext_ids"),
-                shape=changes.get("shape"),
-            )
+            self.update_bdg(bdg, changes)
             self.candidate.inspection_details = {
                 "decision": "update",
                 "rnb_id": bdg.rnb_id,
@@ -214,8 +322,27 @@ class Inspector:
                 "decision": "refusal",
                 "reason": "nothing_to_update",
             }
+        self.save_candidate()
+
+    def save_candidate(self):
         self.candidate.save()
 
+    def get_bdg_to_update(self, bdg_id: int) -> Building:
+        return Building.objects.get(id=bdg_id)
+
+    def get_user(self):
+        return get_RNB_team_user()
+
+    def update_bdg(self, bdg: Building, changes: dict):
+        bdg.update(
+            user=self.get_user(),
+            event_origin=changes.get("event_origin"),
+            status=None,
+            addresses_id=changes.get("addresses_id"),
+            ext_ids=changes.get("ext_ids"),
+            shape=changes.get("shape"),
+        )
+
     def calc_bdg_update(self, bdg: Building) -> dict:
         changes = {}
 
@@ -266,6 +393,366 @@ class Inspector:
         return changes
 
 
+class BatchInspector(Inspector):
+    """
+    Inspect candidates by batches instead of one at a time.
+
+    A batch of candidates is claimed in one query, all their neighbouring buildings
+    are fetched with one spatial join and the decisions are taken in Python.
+    Building creations and candidates inspection results are written back in bulk.
+
+    The decisions are the same as the ones taken by the one-by-one Inspector:
+    when a candidate depends on a write made earlier in the same batch
+    (it is close to a candidate which created or updated a building,
+    or one of its neighbours has already been updated), pending writes are flushed
+    and its neighbours are fetched again from the database, as the Inspector would do.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, batch_size: int = BATCH_SIZE, partition: Optional[str] = None):
+        super().__init__(partition)
+        self.batch_size = batch_size
+        self.user = None
+        self.reset_batch()
+
+    def inspect(self) -> int:
+        total_count = 0
+        while True:
+            inspected_count = self.inspect_batch()
+
+            if inspected_count == 0:
+                return total_count
+            total_count += inspected_count
+
+    def inspect_batch(self) -> int:
+        while True:
+            self.reset_batch()
+            candidate_ids = self.peek_candidates()
+
+            if not candidate_ids:
+                return 0
+
+            inspected_count = self.inspect_peeked_batch(candidate_ids)
+            if inspected_count > 0:
+                return inspected_count
+            # The candidates were claimed by another worker in the meantime
+
+    def inspect_peeked_batch(self, candidate_ids: list[int]) -> int:
+        self.batch_candidate_ids = candidate_ids
+
+        try:
+            with transaction.atomic():
+                candidates = self.get_candidates()
+                candidate_ids = [c.id for c in candidates]
+
+                if not candidates:
+                    return 0
+
+                self.get_batch_matching_bdgs(candidates)
+                self.get_close_candidates(candidates)
+                self.get_batch_overlaps(candidates)
+
+                for candidate in candidates:
+                    self.inspect_batch_candidate(candidate)
+
+                self.flush()
+
+                return len(candidates)
+        except Exception as e:
+            # The batch is rolled back. Its candidates are inspected one by one
+            # so the candidate raising the topology exception is refused as the Inspector would do.
+            if "TopologyException: side location conflict" in str(e):
+                return self.inspect_one_by_one(candidate_ids)
+            else:
+                raise e
+
+    def inspect_one_by_one(self, candidate_ids: list[int]) -> int:
+        # the candidates claimed by another worker in the meantime are skipped
+        inspector = Inspector(candidate_ids=candidate_ids)
+        inspected_count = 0
+        while True:
+            inspector.inspect_one()
+            if inspector.candidate is None:
+                return inspected_count
+            inspected_count += 1
+
+    def reset_batch(self):
+        self.batch_candidate_ids = []
+        self.batch_bdgs = {}
+        self.batch_matching_bdgs = {}
+        self.batch_match_results = {}
+        self.uses_batch_matching_bdgs = False
+        self.close_candidates = {}
+        self.batch_overlaps = {}
+        self.writing_candidates_ids = set()
+        self.touched_bdgs_ids = set()
+        self.candidates_to_save = []
+        self.bdgs_to_create = []
+        self.bdgs_to_update = []
+
+    def peek_candidates(self) -> list[int]:
+        """
+        Look up the next batch before its transaction is opened, and fetch
+        the missing addresses of its candidates from the BAN API:
+        no HTTP call is made while the candidates rows are locked.
+        """
+        q = sql.SQL(
+            "SELECT id, address_keys FROM {candidate} WHERE inspected_at IS NULL {partition_filter} ORDER BY inspected_at asc, random asc LIMIT %(batch_size)s FOR UPDATE SKIP LOCKED"
+        ).format(
+            candidate=sql.Identifier(Candidate._meta.db_table),
+            partition_filter=self.partition_filter(),
+        )
+        params = {"batch_size": self.batch_size, "partition": self.partition}
+
+        with connection.cursor() as cursor:
+            cursor.execute(q, params)
+            rows = cursor.fetchall()
+
+        prefetch_addresses([key for _, keys in rows for key in keys or []])
+
+        return [c_id for c_id, _ in rows]
+
+    def get_candidates(self) -> list:
+        # Only the peeked candidates: their addresses have been fetched
+        q = sql.SQL(
+            "SELECT id, ST_AsEWKB(shape) as shape, source, source_version, source_id, address_keys, is_light, inspected_at, created_at, created_by FROM {candidate} WHERE inspected_at IS NULL AND id = ANY(%(candidate_ids)s) ORDER BY inspected_at asc, random asc FOR UPDATE SKIP LOCKED"
+        ).format(
+            candidate=sql.Identifier(Candidate._meta.db_table),
+        )
+        params = {"candidate_ids": self.batch_candidate_ids}
+        return list(Candidate.objects.raw(q, params))
+
+    def get_batch_matching_bdgs(self, candidates: list):
+
+        q = sql.SQL(
+            "SELECT b.id, ST_AsEWKB(b.shape) as shape, c.id as candidate_id "
+            "FROM {candidate} c "
+            "JOIN {building} b ON {bbox_filter}"
+            "ST_DWithin(b.shape::geography, c.shape::geography, %(radius)s) "
+            "WHERE c.id = ANY(%(candidates_ids)s) "
+            "AND b.status IN %(status)s "
+            "AND b.is_active = true "
+            "ORDER BY c.id, b.id"
+        ).format(
+            candidate=sql.Identifier(Candidate._meta.db_table),
+            building=sql.Identifier(Building._meta.db_table),
+            bbox_filter=self.batch_bbox_filter("b.shape", "c.shape"),
+        )
+        params = {
+            "candidates_ids": [c.id for c in candidates],
+            "status": tuple(BuildingStatusService.REAL_BUILDINGS_STATUS),
+            "radius": self.MATCHING_RADIUS,
+        }
+
+        for bdg in Building.objects.raw(q, params):
+            self.batch_matching_bdgs.setdefault(bdg.candidate_id, []).append(bdg)
+
+        # All the candidate/building pairs of the batch are compared at once
+        shapes_by_id = {c.id: c.shape for c in candidates}
+        pairs = [
+            (c_id, bdg)
+            for c_id, bdgs in self.batch_matching_bdgs.items()
+            for bdg in bdgs
+        ]
+        results = match_shapes_pairs(
+            [shapes_by_id[c_id] for c_id, _ in pairs], [bdg.shape for _, bdg in pairs]
+        )
+        for (c_id, _), result in zip(pairs, results):
+            self.batch_match_results.setdefault(c_id, []).append(result)
+
+        # The full rows of the neighbouring buildings, in case one of them is updated
+        bdgs_ids = {
+            bdg.id for bdgs in self.batch_matching_bdgs.values() for bdg in bdgs
+        }
+        self.batch_bdgs = Building.objects.in_bulk(bdgs_ids)
+
+    def get_close_candidates(self, candidates: list):
+
+        q = sql.SQL(
+            "SELECT a.id, b.id "
+            "FROM {candidate} a "
+            "JOIN {candidate} b ON a.id <> b.id AND {bbox_filter}"
+            "ST_DWithin(a.shape::geography, b.shape::geography, %(radius)s) "
+            "WHERE a.id = ANY(%(candidates_ids)s) "
+            "AND b.id = ANY(%(candidates_ids)s)"
+        ).format(
+            candidate=sql.Identifier(Candidate._meta.db_table),
+            bbox_filter=self.batch_bbox_filter("a.shape", "b.shape"),
+        )
+        params = {
+            "candidates_ids": [c.id for c in candidates],
+            "radius": self.MATCHING_RADIUS,
+        }
+
+        with connection.cursor() as cursor:
+            cursor.execute(q, params)
+            for a_id, b_id in cursor.fetchall():
+                self.close_candidates.setdefault(a_id, set()).add(b_id)
+
+    def get_batch_overlaps(self, candidates: list):
+        # The overlaps of the candidates which may be created are checked at once.
+        # Those matching a building will be updates, the invalid ones will be refused.
+        to_check = [
+            c
+            for c in candidates
+            if c.is_light != True
+            and c.shape is not None
+            and c.shape.valid
+            and not any(
+                result in ("match", "conflict")
+                for result in self.batch_match_results.get(c.id, [])
+            )
+        ]
+
+        overlaps = find_overlapping_buildings_many([(c.shape, None) for c in to_check])
+        self.batch_overlaps = {c.id: o for c, o in zip(to_check, overlaps)}
+
+    def batch_bbox_filter(self, shape_col: str, other_shape_col: str) -> sql.SQL:
+        if not self.BBOX_PREFILTER:
+            return sql.SQL("")
+
+        expanded = dwithin_bbox_sql(other_shape_col, self.MATCHING_RADIUS)
+        return sql.SQL(f"{shape_col} && {expanded} AND ")
+
+    def inspect_batch_candidate(self, candidate: Candidate):
+        self.reset()
+        self.candidate = candidate
+
+        if self.depends_on_batch_writes():
+            # Same path as the one-by-one Inspector, with an up-to-date database
+            self.flush()
+            self.get_matching_bdgs()
+            self.matching_bdgs = list(self.matching_bdgs)
+            self.uses_batch_matching_bdgs = False
+        else:
+            self.matching_bdgs = self.batch_matching_bdgs.get(candidate.id, [])
+            self.uses_batch_matching_bdgs = True
+
+        self.inspect_candidate()
+
+        decision = (self.candidate.inspection_details or {}).get("decision")
+        if decision in ("creation", "update"):
+            self.writing_candidates_ids.add(self.candidate.id)
+
+    def match_results(self) -> list:
+        if self.uses_batch_matching_bdgs:
+            return self.batch_match_results.get(self.candidate.id, [])
+
+        return super().match_results()
+
+    def depends_on_batch_writes(self) -> bool:
+
+        if (
+            self.close_candidates.get(self.candidate.id, set())
+            & self.writing_candidates_ids
+        ):
+            return True
+
+        neighbours_ids = {
+            bdg.id for bdg in self.batch_matching_bdgs.get(self.candidate.id, [])
+        }
+        if neighbours_ids & self.touched_bdgs_ids:
+            return True
+
+        return False
+
+    def save_candidate(self):
+        self.candidates_to_save.append(self.candidate)
+
+    def get_bdg_to_update(self, bdg_id: int) -> Building:
+        self.touched_bdgs_ids.add(bdg_id)
+
+        if bdg_id in self.batch_bdgs:
+            # We won't use this prefetched row again: this building is now "touched"
+            return self.batch_bdgs.pop(bdg_id)
+
+        return super().get_bdg_to_update(bdg_id)
+
+    def get_user(self):
+        if self.user is None:
+            self.user = get_RNB_team_user()
+        return self.user
+
+    def update_bdg(self, bdg: Building, changes: dict):
+        # The update is written in flush(), with the other updates of the batch
+        self.bdgs_to_update.append((bdg, changes))
+
+    def decide_creation(self):
+        # Same checks as Building.create_new(). The writes are made in flush()
+        if self.uses_batch_matching_bdgs and self.candidate.id in self.batch_overlaps:
+            overlapping = self.batch_overlaps[self.candidate.id]
+            if overlapping:
+                raise BuildingOverlapError(overlapping)
+        else:
+            check_building_overlap(self.candidate.shape)
+
+        bdg = building_from_candidate(self.candidate, self.get_user())
+        self.bdgs_to_create.append(bdg)
+
+        self.candidate.inspection_details = {
+            "decision": "creation",
+            "rnb_id": bdg.rnb_id,
+        }
+
+        self.save_candidate()
+
+    def flush(self):
+
+        if self.bdgs_to_create:
+            # automated creations do not count in the Summer Challenge
+            check_and_increment_contribution_count(
+                self.get_user(), len(self.bdgs_to_create)
+            )
+
+            # The addresses have been fetched in peek_candidates(): only the ones
+            # the BAN API failed to return are looked up again, and raise as in the Inspector
+            addresses_id = {
+                add_id for bdg in self.bdgs_to_create for add_id in bdg.addresses_id
+            }
+            Address.add_addresses_to_db_if_needed(sorted(addresses_id))
+
+            Building.objects.bulk_create(self.bdgs_to_create)
+            # bulk_create does not call save(), which invalidates the vector tiles
+            invalidate_building_tiles(
+                [g for bdg in self.bdgs_to_create for g in (bdg.shape, bdg.point)]
+            )
+            self.bdgs_to_create = []
+
+        if self.bdgs_to_update:
+            # automated updates do not count in the Summer Challenge
+            Building.bulk_update_events(
+                self.bdgs_to_update, self.get_user(), score=False
+            )
+            self.bdgs_to_update = []
+
+        if self.candidates_to_save:
+            now = datetime.now(timezone.utc)
+            for candidate in self.candidates_to_save:
+                candidate.updated_at = now
+
+            Candidate.objects.bulk_update(
+                self.candidates_to_save,
+                ["inspected_at", "inspection_details", "updated_at"],
+            )
+            self.candidates_to_save = []
+
+
+def prefetch_addresses(addresses_id: list[str]):
+    """
+    Add to the database the addresses the BAN API returns. Unlike Address.add_addresses_to_db_if_needed(),
+    the lookup errors are not raised: the candidates using those addresses may be refused.
+    """
+    missing = Address.missing_addresses(addresses_id)
+    if not missing:
+        return
+
+    addresses = [
+        a for a in Address.fetch_from_ban_api(missing) if not isinstance(a, Exception)
+    ]
+    Address.objects.bulk_create(addresses, ignore_conflicts=True)
+
+
 def add_addresses_to_building(bdg: Building, add_keys):
     bdg.addresses_id = add_keys
     bdg.save()
@@ -288,6 +775,107 @@ def match_shapes(
     raise Exception(f"Unknown matching shape families case: {families}")
 
 
+def match_shapes_many(
+    a: GEOSGeometry, others: list[GEOSGeometry]
+) -> list[Optional[Literal["match", "no_match", "conflict"]]]:
+    """
+    Vectorized match_shapes() of one shape (eg: a candidate) against all its neighbours
+    """
+    return match_shapes_pairs([a] * len(others), others)
+
+
+def match_shapes_pairs(
+    a_shapes: list[GEOSGeometry], b_shapes: list[GEOSGeometry]
+) -> list[Optional[Literal["match", "no_match", "conflict"]]]:
+    """
+    Vectorized version of match_shapes(): compare a_shapes[i] with b_shapes[i].
+
+    Intersections, areas and cover ratios are computed with shapely 2 array operations
+    (one GEOS call per operation for all the pairs) instead of one GEOSGeometry pair at a time.
+    It returns the same labels as match_shapes().
+
+    The label is None for the pairs match_shapes() would raise on
+    (unknown shape families, empty areas or a GEOS error): the caller must compare them with match_shapes().
+    """
+    if len(a_shapes) != len(b_shapes):
+        raise ValueError("a_shapes and b_shapes must have the same length")
+
+    labels = np.full(len(a_shapes), None, dtype=object)
+
+    if len(a_shapes) == 0:
+        return labels.tolist()
+
+    a_geoms = shapely.from_wkb([bytes(s.wkb) for s in a_shapes])
+    b_geoms = shapely.from_wkb([bytes(s.wkb) for s in b_shapes])
+
+    a_families = _shapely_families(a_geoms)
+    b_families = _shapely_families(b_geoms)
+
+    # Polygons
+    poly_poly = (a_families == "poly") & (b_families == "poly")
+    if poly_poly.any():
+        a_polys = a_geoms[poly_poly]
+        b_polys = b_geoms[poly_poly]
+
+        a_areas = shapely.area(a_polys)
+        b_areas = shapely.area(b_polys)
+        computable = (a_areas > 0) & (b_areas > 0)
+
+        try:
+            inter_areas = shapely.area(shapely.intersection(a_polys, b_polys))
+        except shapely.errors.GEOSException:
+            computable[:] = False
+            inter_areas = np.zeros(len(a_polys))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            a_cover_ratios = inter_areas / a_areas
+            b_cover_ratios = inter_areas / b_areas
+
+        poly_labels = np.where(
+            (a_cover_ratios < Inspector.MATCH_SMALL_COVER_RATIO)
+            & (b_cover_ratios < Inspector.MATCH_SMALL_COVER_RATIO),
+            "no_match",
+            np.where(
+                (a_cover_ratios < Inspector.MATCH_BIG_COVER_RATIO)
+                | (b_cover_ratios < Inspector.MATCH_BIG_COVER_RATIO),
+                "conflict",
+                "match",
+            ),
+        ).astype(object)
+        poly_labels[~computable] = None
+        labels[poly_poly] = poly_labels
+
+    # Points
+    point_point = (a_families == "point") & (b_families == "point")
+    if point_point.any():
+        equals = shapely.equals_exact(
+            a_geoms[point_point], b_geoms[point_point], tolerance=0.0000001
+        )
+        labels[point_point] = np.where(equals, "match", "no_match")
+
+    # Point and polygon
+    point_poly = ((a_families == "point") & (b_families == "poly")) | (
+        (a_families == "poly") & (b_families == "point")
+    )
+    labels[point_poly] = "match"
+
+    return labels.tolist()
+
+
+def _shapely_families(geoms: np.ndarray) -> np.ndarray:
+    # Same families as shape_family(), "unknown" for other geometry types
+    type_ids = shapely.get_type_id(geoms)
+
+    families = np.full(len(geoms), "unknown", dtype=object)
+    families[
+        (type_ids == shapely.GeometryType.POLYGON)
+        | (type_ids == shapely.GeometryType.MULTIPOLYGON)
+    ] = "poly"
+    families[type_ids == shapely.GeometryType.POINT] = "point"
+
+    return families
+
+
 def match_polygons(
     a: GEOSGeometry, b: GEOSGeometry
 ) -> Literal["match", "no_match", "conflict"]:
@@ -344,6 +932,35 @@ def shape_family(shape: GEOSGeometry):
     raise Exception(f"We do not know the family this shape type: {shape.geom_type}")
 
 
+def building_from_candidate(c: Candidate, user) -> Building:
+    """
+    Build (without saving) the building Building.create_new() would create from this candidate.
+    """
+    shape = c.shape
+
+    return Building(
+        rnb_id=generate_rnb_id(),
+        point=shape if shape.geom_type == "Point" else shape.point_on_surface,
+        shape=shape,
+        ext_ids=[
+            {
+                "source": c.source,
+                "source_version": c.source_version,
+                "id": c.source_id,
+                "created_at": c.created_at.isoformat(),
+            }
+        ],
+        event_origin=c.created_by,
+        status="constructed",
+        event_id=uuid.uuid4(),
+        event_type=EventType.CREATION.value,
+        event_user=user,
+        is_active=True,
+        addresses_id=c.address_keys or [],
+        validated_by=[],
+    )
+
+
 def create_building_from_candidate(c: Candidate) -> Building:
     b = Building.create_new(
         user=get_RNB_team_user(),
@@ -364,15 +981,140 @@ def create_building_from_candidate(c: Candidate) -> Building:
     return b
 
 
-def create_inspection_tasks() -> list:
+def create_inspection_tasks(
+    batch_size: Optional[int] = None, workers: Optional[int] = None
+) -> list:
+    """
+    One inspection task per worker. The geohash cells of the candidates queue
+    are split between the workers: two workers never inspect neighbouring candidates
+    at the same time and each worker only hits a few areas of the building index.
+    """
+
+    workers = workers or os.cpu_count() or 1
 
     tasks = []  # type: ignore[var-annotated]
-    for _ in range(os.cpu_count()):  # type: ignore[arg-type]
-        tasks.append(Signature("batid.tasks.inspect_candidates", immutable=True))
+    for worker in range(workers):
+        tasks.append(
+            Signature(
+                "batid.tasks.inspect_candidates",
+                kwargs={"batch_size": batch_size, "worker": worker, "workers": workers},
+                immutable=True,
+            )
+        )
 
     return tasks
 
 
+def inspect_worker_partitions(
+    worker: int, workers: int, batch_size: Optional[int] = None
+) -> int:
+    """
+    Drain the partitions of a worker. The partitions are listed again once drained:
+    the candidates inserted in the meantime, in new cells too, are inspected as well.
+    A partition is only drained while no other worker drains one of its neighbours
+    (see partition_lock). The worker stops when a pass inspects nothing,
+    or after PARTITION_MAX_IDLE_PASSES passes waiting for the neighbours locks.
+    Return the number of candidates inspected.
+    """
+
+    inspected_count = 0
+    idle_passes = 0
+    while idle_passes < PARTITION_MAX_IDLE_PASSES:
+        partitions = [
+            p for p in list_partition_keys() if partition_worker(p, workers) == worker
+        ]
+
+        if not partitions:
+            break
+
+        pass_count = 0
+        waiting = False
+        for partition in partitions:
+            with partition_lock(partition) as locked:
+                if not locked:
+                    waiting = True
+                    continue
+
+                i = (
+                    BatchInspector(batch_size, partition=partition)
+                    if batch_size
+                    else Inspector(partition)
+                )
+                pass_count += i.inspect()
+
+        inspected_count += pass_count
+
+        if pass_count > 0:
+            idle_passes = 0
+            continue
+
+        # what is left is claimed by other inspections (SKIP LOCKED)
+        if not waiting:
+            break
+
+        idle_passes += 1
+        time.sleep(PARTITION_LOCK_WAIT)
+
+    return inspected_count
+
+
+@contextmanager
+def partition_lock(partition: str):
+    """
+    Try to lock a partition for inspection: an exclusive lock on the cell and shared locks
+    on its 8 neighbours. Two neighbouring cells are never inspected at the same time,
+    so candidates on both sides of a cell border cannot match or create the same building
+    concurrently. Yield whether the locks were taken.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(PARTITION_NEIGHBOURS_SQL, {"partition": partition})
+        neighbours = sorted(row[0] for row in cursor.fetchall())
+
+        locks = [("pg_try_advisory_lock", partition)] + [
+            ("pg_try_advisory_lock_shared", neighbour) for neighbour in neighbours
+        ]
+
+        taken = []
+        try:
+            for function, key in locks:
+                cursor.execute(
+                    f"SELECT {function}(hashtext('batid_candidate_partition'), hashtext(%s))",
+                    [key],
+                )
+                if not cursor.fetchone()[0]:
+                    break
+                taken.append((function, key))
+
+            yield len(taken) == len(locks)
+        finally:
+            for function, key in taken:
+                cursor.execute(
+                    f"SELECT {PARTITION_UNLOCKS[function]}(hashtext('batid_candidate_partition'), hashtext(%s))",
+                    [key],
+                )
+
+
+def partition_worker(partition: str, workers: int) -> int:
+    # a stable hash: all the workers must agree on it
+    return zlib.crc32(partition.encode()) % workers
+
+
+def list_partition_keys() -> list[str]:
+
+    q = sql.SQL(
+        "SELECT DISTINCT partition_key FROM {candidate} "
+        "WHERE inspected_at IS NULL AND partition_key IS NOT NULL "
+        "ORDER BY partition_key"
+    ).format(
+        candidate=sql.Identifier(Candidate._meta.db_table),
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(q)
+        return [row[0] for row in cursor.fetchall()]
+
+
 def display_report(since: datetime, requested_hecks: str = "all"):
 
     if not isinstance(since, datetime):
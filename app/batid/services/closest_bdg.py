@@ -1,7 +1,9 @@
 from typing import Optional
 
+from batid.list_bdg import with_projection
 from batid.models import Building
 from batid.services.bdg_status import BuildingStatus
+from batid.utils.geo import dwithin_bbox_deltas
 from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.geos import Point, Polygon
 from django.db.models import BooleanField, ExpressionWrapper, QuerySet
@@ -14,12 +16,16 @@ def get_closest_from_poly(poly: Polygon, radius) -> Optional[QuerySet]:
 
     qs = __get_real_bdg_qs()
 
+    # index friendly bbox prefilter, the exact distance is only computed on the remaining buildings
+    dx, dy = dwithin_bbox_deltas(poly, radius)
+
     qs = (
         qs.filter(
             ExpressionWrapper(
                 RawSQL(
-                    "ST_DWithin(shape::geography, ST_GeomFromWKB(%s, 4326), %s)",
-                    (poly.wkb, radius),
+                    "shape && ST_Expand(ST_GeomFromWKB(%s, 4326), %s, %s) "
+                    "AND ST_DWithin(shape::geography, ST_GeomFromWKB(%s, 4326), %s)",
+                    (poly.wkb, dx, dy, poly.wkb, radius),
                 ),
                 output_field=BooleanField(),
             )
@@ -42,19 +48,23 @@ def __get_qs(lat, lng, radius):
 
     point_geom = Point(lng, lat, srid=4326)
 
-    where_sql = "ST_DWithin(shape::geography, ST_MakePoint(%s, %s)::geography, %s)"
+    # index friendly bbox prefilter, the exact distance is only computed on the remaining buildings
+    dx, dy = dwithin_bbox_deltas(point_geom, radius)
+
+    where_sql = (
+        "shape && ST_Expand(ST_SetSRID(ST_MakePoint(%s, %s), 4326), %s, %s) "
+        "AND ST_DWithin(shape::geography, ST_MakePoint(%s, %s)::geography, %s)"
+    )
 
     qs = (
         qs.extra(  # nosec B610: params are properly escaped. Better yet: use filter
-            where=[where_sql], params=[lng, lat, radius]
+            where=[where_sql], params=[lng, lat, dx, dy, lng, lat, radius]
         )
         .annotate(distance=Distance("shape", point_geom))
         .order_by("distance")
     )
 
-    qs = qs.prefetch_related("addresses_read_only")
-    qs = qs.prefetch_related("validated_by_read_only")
-    return qs
+    return with_projection(qs, None)
 
 
 def __get_real_bdg_qs():
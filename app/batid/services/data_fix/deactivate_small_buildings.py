@@ -39,9 +39,15 @@ def deactivate_small_buildings(fix_id: int, batch_size: int = 1000) -> int:
 
             ids = [row[0] for row in rows]
 
-            for id in ids:
-                building = Building.objects.get(id=id)
-                building.deactivate(data_fix.user, {"source": "data_fix", "id": fix_id})
-                deactivated_count += 1
+            event_origin = {"source": "data_fix", "id": fix_id}
+            deactivated = Building.bulk_update_events(
+                [
+                    (building, {"is_active": False, "event_origin": event_origin})
+                    for building in Building.objects.filter(id__in=ids)
+                ],
+                data_fix.user,
+                score=False,
+            )
+            deactivated_count += len(deactivated)
 
     return deactivated_count
@@ -11,6 +11,9 @@ from batid.services.source import Source
 from django.contrib.auth.models import User
 from django.db import connection, transaction
 
+# number of buildings deactivated by a single bulk update
+DEACTIVATION_BATCH_SIZE = 1000
+
 
 def list_light_buildings_france(start_dpt=None, end_dpt=None):
     dpts = dpts_list(start_dpt, end_dpt)
@@ -159,9 +162,20 @@ def remove_light_buildings(folder_name, username, fix_id):
         user = User.objects.get(username=username)
         DataFix.objects.get(id=fix_id)
 
-        for rnb_id in df["rnb_id"]:
-            building = Building.objects.get(rnb_id=rnb_id)
-            building.deactivate(user, {"source": "data_fix", "id": fix_id})
+        event_origin = {"source": "data_fix", "id": fix_id}
+        rnb_ids = list(df["rnb_id"])
+
+        for start in range(0, len(rnb_ids), DEACTIVATION_BATCH_SIZE):
+            chunk = rnb_ids[start : start + DEACTIVATION_BATCH_SIZE]
+            buildings = Building.objects.filter(rnb_id__in=chunk)
+            Building.bulk_update_events(
+                [
+                    (building, {"is_active": False, "event_origin": event_origin})
+                    for building in buildings
+                ],
+                user,
+                score=False,
+            )
 
         # if transaction is successful, remove the folder
         transaction.on_commit(lambda: shutil.rmtree(folder_name))
@@ -2,18 +2,37 @@ import hashlib
 import logging
 import os
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from zipfile import ZIP_DEFLATED, ZipFile
 
 import boto3
 import requests
 from batid.services.administrative_areas import dpts_list
+from batid.utils.misc import map_in_threads
 from celery import Signature
 from django.conf import settings
 from django.db import connection, transaction
 
 from app.settings import WRITABLE_DATA_DIR
 
+# concurrent COPY queries of the single pass export
+EXPORT_PARTITIONS = 4
+# archives created and uploaded at the same time
+PUBLISH_WORKERS = 4
+
+EXPORT_COLUMNS = [
+    "rnb_id",
+    "point",
+    "shape",
+    "status",
+    "ext_ids",
+    "addresses",
+    "plots",
+    "validated_by",
+]
+
 
 def publish(area: str):
     print(f"Processing area: {area}")
@@ -21,11 +40,7 @@ def publish(area: str):
     try:
         directory_name = create_directory(area)
         create_csv(directory_name, area)
-        archive_path, archive_size, archive_sha1 = create_archive(directory_name, area)
-
-        if os.environ.get("ENABLE_DATAGOUV_PUBLICATION") == "true":
-            public_url = upload_to_s3(archive_path)
-            publish_on_data_gouv(area, public_url, archive_size, archive_sha1)
+        publish_csv(directory_name, area)
     except Exception as e:
         logging.error(
             f"Error while publishing the RNB for area {area} on data.gouv.fr: {e}"
@@ -37,6 +52,58 @@ def publish(area: str):
     return True
 
 
+def publish_all(partitions=EXPORT_PARTITIONS, workers=PUBLISH_WORKERS):
+    """
+    Publish the national file and all the department files from a single scan of the
+    buildings. The archives are then created and uploaded concurrently.
+    """
+
+    areas = dpts_list() + ["nat"]
+
+    directory_name = create_directory("all")
+
+    try:
+        create_all_csv(directory_name, areas, partitions)
+
+        failed_areas = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(publish_csv, directory_name, area, True): area
+                for area in areas
+            }
+            for future in as_completed(futures):
+                area = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logging.error(
+                        f"Error while publishing the RNB for area {area} on data.gouv.fr: {e}"
+                    )
+                    failed_areas.append(area)
+
+        if failed_areas:
+            raise Exception(
+                f"The publication on data.gouv.fr failed for areas: {', '.join(sorted(failed_areas))}"
+            )
+    finally:
+        cleanup_directory(directory_name)
+
+    return True
+
+
+def publish_csv(directory_name, area, remove_files=False):
+    archive_path, archive_size, archive_sha1 = create_archive(directory_name, area)
+
+    if os.environ.get("ENABLE_DATAGOUV_PUBLICATION") == "true":
+        public_url = upload_to_s3(archive_path)
+        publish_on_data_gouv(area, public_url, archive_size, archive_sha1)
+
+    if remove_files:
+        # free the disk space as soon as possible
+        os.remove(f"{file_path(directory_name, area)}.csv")
+        os.remove(archive_path)
+
+
 def create_directory(area):
     directory_name = (
         f'datagouvfr_publication_{area}_{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}'
@@ -61,7 +128,16 @@ def sql_query(code_area):
 
     sql = f"""
     COPY (
-        select bdg.rnb_id as rnb_id,
+        {select_query(dpt_join=dpt_join, where=dpt_where)}
+    )  TO STDOUT WITH CSV HEADER DELIMITER ';'
+    """
+
+    return sql
+
+
+def select_query(first_column="", dpt_join="", where=""):
+    return f"""
+        select {first_column}bdg.rnb_id as rnb_id,
         ST_AsEWKT(bdg.point) as point,
         ST_AsEWKT(bdg.shape) as shape,
         bdg.status as status,
@@ -78,20 +154,9 @@ def sql_query(code_area):
 
         ) FILTER (WHERE addr.id IS NOT NULL), '[]'::json) AS addresses,
         (
-           SELECT json_agg(json_build_object('id', p.id, 'bdg_cover_ratio',
-               CASE
-                   WHEN ST_GeometryType(bdg.shape) = 'ST_Point' THEN 1.0
-                   WHEN ST_GeometryType(bdg.shape) IN ('ST_Polygon', 'ST_MultiPolygon') THEN
-                       CASE
-                           WHEN ST_Area(bdg.shape) > 0 THEN
-                               ST_Area(ST_Intersection(bdg.shape, p.shape)) / ST_Area(bdg.shape)
-                           ELSE 0.0
-                       END
-                   ELSE 0.0
-               END
-           ))
-           FROM batid_plot p
-           WHERE ST_Intersects(p.shape, bdg.shape)
+           SELECT json_agg(json_build_object('id', l.plot_id, 'bdg_cover_ratio', l.bdg_cover_ratio) ORDER BY l.plot_id)
+           FROM batid_buildingplotreadonly l
+           WHERE l.building_id = bdg.id
        ) AS plots,
         (
            SELECT coalesce(json_agg(
@@ -113,13 +178,10 @@ def sql_query(code_area):
         LEFT JOIN batid_address addr ON addr.id = bdg_addr.address_id
         {dpt_join}
         WHERE is_active
-        {dpt_where}
+        {where}
         GROUP BY bdg.rnb_id, bdg.point, bdg.shape, bdg.status, bdg.ext_ids, bdg.id
-    )  TO STDOUT WITH CSV HEADER DELIMITER ';'
     """
 
-    return sql
-
 
 def create_csv(directory_name, code_area):
     sql = sql_query(code_area)
@@ -134,6 +196,138 @@ def create_csv(directory_name, code_area):
                 cursor.copy_expert(sql, fp)
 
 
+def create_all_csv(directory_name, areas, partitions=EXPORT_PARTITIONS):
+    """
+    Create the CSV files of all the areas with a single pass on the buildings.
+    The buildings table is split in id ranges, each one exported by its own COPY query
+    and routed line by line to the national file and to the files of its departments.
+    """
+
+    files = {
+        area: open(f"{file_path(directory_name, area)}.csv", "wb") for area in areas
+    }
+
+    try:
+        header = (";".join(EXPORT_COLUMNS) + "\n").encode("utf-8")
+        for f in files.values():
+            f.write(header)
+
+        lock = threading.Lock()
+        close_connection = partitions > 1
+
+        for _ in map_in_threads(
+            lambda id_range: _copy_partition(
+                id_range, _AreaRouter(files, lock), close_connection
+            ),
+            iter(_id_ranges(partitions)),
+            partitions,
+        ):
+            pass
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def _id_ranges(partitions):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT min(id), max(id) FROM batid_building")
+        min_id, max_id = cursor.fetchone()
+
+    if min_id is None:
+        return []
+
+    step = (max_id - min_id) // partitions + 1
+    return [(start, start + step - 1) for start in range(min_id, max_id + 1, step)]
+
+
+def _copy_partition(id_range, router, close_connection=False):
+
+    # the departments of the building are listed in the first column
+    dpt_codes = """array_to_string(ARRAY(
+            SELECT DISTINCT dpt.code
+            FROM batid_department_subdivided AS dpt
+            WHERE ST_Intersects(dpt.shape, bdg.point)
+        ), ',') as dpt_codes, """
+
+    sql = f"""
+    COPY (
+        {select_query(first_column=dpt_codes, where="AND bdg.id BETWEEN %(start)s AND %(end)s")}
+    ) TO STDOUT WITH CSV DELIMITER ';'
+    """
+
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET statement_timeout = %(statement_timeout)s;",
+                    {
+                        "statement_timeout": settings.DATA_GOUV_POSTGRES_STATEMENT_TIMEOUT
+                    },
+                )
+                sql = cursor.mogrify(
+                    sql, {"start": id_range[0], "end": id_range[1]}
+                ).decode("utf-8")
+                cursor.copy_expert(sql, router)
+        router.flush()
+    finally:
+        if close_connection:
+            # Django connections are per thread
+            connection.close()
+
+
+class _AreaRouter:
+    """
+    File-like object given to copy_expert. Each CSV record is written to the national
+    file and to the files of the departments listed in its first column.
+    """
+
+    def __init__(self, files: dict, lock: threading.Lock):
+        self.files = files
+        self.lock = lock
+
+        self.pending = bytearray()
+        # position and number of quotes of the pending data already scanned
+        self.scanned = 0
+        self.quotes = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.pending += data
+
+        records = []
+        start = 0
+        while (end := self.pending.find(b"\n", self.scanned)) != -1:
+            self.quotes += self.pending.count(b'"', self.scanned, end)
+            self.scanned = end + 1
+            # a new line inside a quoted value does not end the record
+            if self.quotes % 2 == 0:
+                records.append(bytes(self.pending[start : end + 1]))
+                start = end + 1
+                self.quotes = 0
+
+        del self.pending[:start]
+        self.scanned -= start
+
+        self._route(records)
+
+    def flush(self):
+        if self.pending:
+            self._route([bytes(self.pending)])
+            self.pending.clear()
+            self.scanned = 0
+            self.quotes = 0
+
+    def _route(self, records):
+        with self.lock:
+            for record in records:
+                dpt_codes, _, line = record.partition(b";")
+                self.files["nat"].write(line)
+                for code in dpt_codes.decode("utf-8").split(","):
+                    if code in self.files and code != "nat":
+                        self.files[code].write(line)
+
+
 def sha1sum(filename):
     h = hashlib.sha1()
     b = bytearray(128 * 1024)
@@ -1,27 +1,27 @@
 import csv
+import io
 import logging
 import os
 import uuid
-from typing import Optional
-
-from batid.exceptions import (
-    BANAPIDown,
-    BANBadRequest,
-    BANBadResultType,
-    BANUnknownCleInterop,
-)
-from batid.models import Building, BuildingImport
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+from batid.models import Address, Building, BuildingImport
 from batid.services.bdg_status import BuildingStatus
 from batid.services.imports import building_import_history
 from batid.services.RNB_team_user import get_RNB_team_user
 from batid.services.source import Source
-from batid.utils.db import dictfetchall
 from celery import Signature
 from django.contrib.gis.geos import Point
 from django.db import connection, transaction
 
 logger = logging.getLogger(__name__)
 
+# number of links created in a transaction
+BATCH_SIZE = 1000
+# number of addresses sent to the database at once
+COPY_CHUNK_SIZE = 10_000
+
 
 def create_all_bal_links_tasks(dpts: list):
 
@@ -62,30 +62,12 @@ def _create_bal_links_dpt_tasks(dpt: str, bulk_launch_uuid=None):
     return tasks
 
 
-def filter_by_position(rows: list) -> list:
-    """
-    For each cle_interop, keep only rows whose position is "bâtiment" if any such
-    row exists. Otherwise keep all rows for that cle_interop.
-    """
-    batiment_rows: dict[str, list] = {}
-    other_rows: dict[str, list] = {}
-
-    for row in rows:
-        key = row["cle_interop"]
-        if row["position"] == "bâtiment":
-            batiment_rows.setdefault(key, []).append(row)
-        else:
-            other_rows.setdefault(key, []).append(row)
-
-    result = []
-    all_keys = set(batiment_rows) | set(other_rows)
-    for key in all_keys:
-        if key in batiment_rows:
-            result.extend(batiment_rows[key])
-        else:
-            result.extend(other_rows[key])
-
-    return result
+def certified_rows(path: str) -> Iterator[dict]:
+    with open(path, "r") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        for row in reader:
+            if row["certification_commune"] != "0":
+                yield row
 
 
 def create_dpt_bal_rnb_links(src_params: dict, bulk_launch_uuid=None):
@@ -104,38 +86,30 @@ def create_dpt_bal_rnb_links(src_params: dict, bulk_launch_uuid=None):
     total_refused = 0
     batch_num = 0
 
-    with open(src.find(src.filename), "r") as f:
-        reader = csv.DictReader(f, delimiter=";")
-        certified_rows = [row for row in reader if row["certification_commune"] != "0"]
+    path = src.find(src.filename)
 
-    filtered_rows = filter_by_position(certified_rows)
-
-    batch = []
-
-    for row in filtered_rows:
-
-        address_point = Point(
-            float(row["long"]),
-            float(row["lat"]),
-            srid=4326,
+    # the addresses are streamed to the database
+    addresses = (
+        (
+            Point(float(row["long"]), float(row["lat"]), srid=4326),
+            row["cle_interop"],
+            row["position"],
         )
+        for row in certified_rows(path)
+    )
 
-        batch.append((address_point, row["cle_interop"]))
-        if len(batch) >= 1000:
-            batch_num += 1
-            updated, refused = process_batch(batch, building_import)
-            total_updated += updated
-            total_refused += refused
-            batch = []
+    # All the addresses of the department are matched at once,
+    # the links are read from the database batch by batch
+    links = find_bdg_address_links(addresses)
 
-    if len(batch) > 0:
+    while batch := list(islice(links, BATCH_SIZE)):
         batch_num += 1
         updated, refused = process_batch(batch, building_import)
         total_updated += updated
         total_refused += refused
 
     # We remove the source file
-    os.remove(src.find(src.filename))
+    os.remove(path)
 
     logger.info(
         "BAL import dpt %s done: %d batches, %d links created, %d refused",
@@ -154,61 +128,114 @@ def create_dpt_bal_rnb_links(src_params: dict, bulk_launch_uuid=None):
 
 def find_bdg_to_link(address_point: Point, cle_interop: str) -> Optional[Building]:
 
-    with connection.cursor() as cursor:
-
-        # Simple Intersects approach first
-        matching_rnb_id = _match_bdg_intersecting(cursor, address_point)
-
-        if matching_rnb_id is None:
-
-            # There was no match
-            # We try the more complex plot-based approach
-
-            matching_rnb_id = _match_bdg_on_plot(cursor, address_point)
-
-    if matching_rnb_id is None:
+    links = list(find_bdg_address_links([(address_point, cle_interop, None)]))
 
-        # Still no match
-        # We give up
-
-        return None
-
-    # We do NOT want to create the bdg <> address link if the same link exists or has existed in the past
-    if _known_building_address_link(cle_interop, matching_rnb_id):
+    if not links:
         return None
 
-    return Building.objects.get(rnb_id=matching_rnb_id)
-
-
-def _match_bdg_intersecting(cursor, address_point: Point) -> Optional[str]:
-
-    on_bdg_sql = """
-        SELECT bdg.rnb_id
-        FROM batid_building as bdg
-        WHERE ST_Intersects(bdg.shape, %(address_point)s)
-        AND bdg.status IN %(status)s
-        AND bdg.is_active = TRUE
-    """
-
-    params = {
-        "address_point": f"{address_point}",
-        "status": tuple(BuildingStatus.REAL_BUILDINGS_STATUS),
-    }
-
-    rows = dictfetchall(cursor, on_bdg_sql, params)
-
-    if len(rows) != 1:
-        return None
-
-    return rows[0]["rnb_id"]
+    return Building.objects.get(rnb_id=links[0][1])
+
+
+LINKS_SQL = """
+    WITH intersecting AS (
+        SELECT a.idx, count(bdg.rnb_id) AS bdg_count, min(bdg.rnb_id) AS rnb_id
+        FROM bal_link_address AS a
+        LEFT JOIN batid_building AS bdg ON ST_Intersects(bdg.shape, a.point)
+            AND bdg.status IN %(status)s
+            AND bdg.is_active = TRUE
+        GROUP BY a.idx
+    ),
+    -- There was no single match, we try the plot-based approach
+    close_plots AS (
+        SELECT a.idx, plot.id AS plot_id
+        FROM intersecting AS i
+        JOIN bal_link_address AS a ON a.idx = i.idx
+        -- the first condition is a (much wider) index-friendly version of the second one
+        JOIN batid_plot AS plot ON ST_DWithin(plot.shape, a.point, 0.001)
+            AND ST_DWithin(a.point::geography, plot.shape::geography, 5)
+        WHERE i.bdg_count != 1
+    ),
+    single_plots AS (
+        SELECT idx, min(plot_id) AS plot_id
+        FROM close_plots
+        GROUP BY idx
+        HAVING count(*) = 1
+    ),
+    -- We avoid plot bigger than 50_000m2
+    -- This value is somewhat arbitrary, we met one edge case which can be avoided by ignoring very big plots.
+    candidate_plots AS (
+        SELECT plot.id, plot.shape
+        FROM batid_plot AS plot
+        WHERE plot.id IN (SELECT plot_id FROM single_plots)
+        AND ST_Area(plot.shape::geography) <= 50000
+    ),
+    bdgs_on_plot AS (
+        SELECT plot.id AS plot_id, bdg.rnb_id,
+        CASE WHEN ST_Area(bdg.shape) = 0 THEN 1 ELSE ST_Area(ST_Intersection(bdg.shape, plot.shape)) / ST_Area(bdg.shape) END AS bdg_cover_ratio
+        FROM candidate_plots AS plot
+        JOIN batid_building AS bdg ON ST_Intersects(bdg.shape, plot.shape)
+            AND bdg.status IN %(status)s
+            AND bdg.is_active = TRUE
+    ),
+    -- One and only one building with more than half of its area on the plot, and it is (nearly) all on it
+    plot_matches AS (
+        SELECT plot_id, min(rnb_id) AS rnb_id
+        FROM bdgs_on_plot
+        WHERE bdg_cover_ratio >= 0.5
+        GROUP BY plot_id
+        HAVING count(*) = 1 AND min(bdg_cover_ratio) >= 0.9
+    ),
+    matches AS (
+        SELECT idx, rnb_id FROM intersecting WHERE bdg_count = 1
+        UNION ALL
+        SELECT s.idx, m.rnb_id
+        FROM single_plots AS s
+        JOIN plot_matches AS m ON m.plot_id = s.plot_id
+    )
+    -- The same address can be found in several rows of the BAL
+    links AS (
+        SELECT DISTINCT ON (a.cle_interop, m.rnb_id) a.idx, a.cle_interop, m.rnb_id
+        FROM matches AS m
+        JOIN bal_link_address AS a ON a.idx = m.idx
+        ORDER BY a.cle_interop, m.rnb_id, a.idx
+    )
+    SELECT l.cle_interop, l.rnb_id
+    FROM links AS l
+    -- We do NOT want to create the bdg <> address link if the same link exists or has existed in the past
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM batid_building_with_history AS bdg
+        WHERE bdg.rnb_id = l.rnb_id
+        AND l.cle_interop = ANY(bdg.addresses_id)
+    )
+    ORDER BY l.idx
+"""
+
+# For each cle_interop, keep only the rows whose position is "bâtiment" if any such row exists.
+# Otherwise keep all the rows of that cle_interop.
+FILTER_BY_POSITION_SQL = """
+    DELETE FROM bal_link_address
+    WHERE position IS DISTINCT FROM 'bâtiment'
+    AND cle_interop IN (
+        SELECT cle_interop FROM bal_link_address WHERE position = 'bâtiment'
+    )
+"""
 
 
-def _match_bdg_on_plot(cursor, address_point: Point) -> Optional[str]:
+def find_bdg_address_links(
+    addresses: Iterable[tuple[Point, str, Optional[str]]],
+) -> Iterator[tuple[str, str]]:
     """
+    Yield the (cle_interop, rnb_id) links to create between the addresses
+    (point, cle_interop and BAL position) and the buildings.
 
-    This function tries to create a link between a BAL address and a BDG via the plot.
+    The addresses are loaded into a temporary table and matched with set-based queries:
+    - for each cle_interop, only the rows positioned on a "bâtiment" are kept, if any
+    - an address point intersecting one and only one building is linked to it
+    - otherwise, we try the plot-based approach (see below)
+    - a link which exists or has existed in the past is never created
 
-    We want to be SUPER conservative with this approach.
+    We want to be SUPER conservative with the plot-based approach.
     There are many many edge cases where this can go wrong.
     So we add the following constraints:
     - The address point must be within 5 meters of one and only one plot
@@ -216,105 +243,62 @@ def _match_bdg_on_plot(cursor, address_point: Point) -> Optional[str]:
     - The plot must have one and only one building matching the above condition
     - The matching building should have 90+% of its area on that plot
     - The building must be active and with a "real" status
-    """
 
-    # First, we check how many plots are nearby (within 5 meters) of the address point. If there is not exactly one, we give up immediately
-    close_plots_sql = """
-        select shape, st_area(shape::geography) as area
-        from batid_plot
-        where st_dwithin(%(address_point)s, shape::geography, 5)
+    The links are read through a server-side cursor, declared WITH HOLD:
+    they are never all in memory and the caller can commit between two reads.
     """
 
-    plots = dictfetchall(cursor, close_plots_sql, {"address_point": f"{address_point}"})
-
-    if len(plots) != 1:
-        return None
-
-    # We avoid plot bigger than 50_000m2
-    # This value is somewhat arbitrary, we met one edge case which can be avoided by ignoring very big plots.
-    if plots[0]["area"] > 50_000:
-        return None
-
-    # Second, we get all buildings intersecting the plot, and check how much of their area is on the plot.
-    # If there is not exactly one building with more than 50% of its area on the plot, we give up
-
-    plot_shape = plots[0]["shape"]
-
-    bdgs_on_plot_sql = """
-        select bdg.rnb_id,
-        CASE WHEN ST_Area(bdg.shape) = 0 THEN 1 ELSE St_Area(ST_Intersection(bdg.shape, %(plot_shape)s)) / St_Area(bdg.shape) END AS bdg_cover_ratio
-        from batid_building as bdg
-        where st_intersects(bdg.shape, %(plot_shape)s)
-        AND bdg.status IN %(status)s
-        AND bdg.is_active = true
-    """
-
-    bdgs_on_plot = dictfetchall(
-        cursor,
-        bdgs_on_plot_sql,
-        {
-            "plot_shape": f"{plot_shape}",
-            "status": tuple(BuildingStatus.REAL_BUILDINGS_STATUS),
-        },
-    )
-
-    # We check how many buidldings have more than 50% of their area on the plot
-    candidate_bdgs = [bdg for bdg in bdgs_on_plot if bdg["bdg_cover_ratio"] >= 0.5]
-
-    if len(candidate_bdgs) != 1:
-        return None
-
-    # We check that the matching building has 90+% of its area on the plot, otherwise we consider the match too weak
-    if candidate_bdgs[0]["bdg_cover_ratio"] < 0.9:
-        return None
-
-    return candidate_bdgs[0]["rnb_id"]
-
-
-def find_and_update_bdg(  # type: ignore[return]
-    address_point: Point, cle_interop: str, bdg_import_id: int
-) -> Optional[Building]:
-
-    bdg_to_link = find_bdg_to_link(address_point, cle_interop)
-
-    if isinstance(bdg_to_link, Building):
-
-        bdg_addresses = list(bdg_to_link.addresses_id or [])  # make a shallow copy
-        bdg_addresses.append(cle_interop)
+    with connection.cursor() as cursor:
+        try:
+            # the temporary table creation is rolled back on error
+            with transaction.atomic():
+                cursor.execute(
+                    "CREATE TEMP TABLE bal_link_address (idx integer, cle_interop text, position text, point geometry(Point, 4326))"
+                )
 
-        bdg_to_link.update(
-            user=get_RNB_team_user(),
-            event_origin={"source": "import", "id": bdg_import_id},
-            addresses_id=bdg_addresses,
-            status=None,
-        )
+                # the addresses are copied by chunks, they are never all in memory
+                addresses_iter = enumerate(addresses)
+                while chunk := list(islice(addresses_iter, COPY_CHUNK_SIZE)):
+                    buffer = io.StringIO()
+                    for idx, (address_point, cle_interop, position) in chunk:
+                        # \N is NULL in the COPY text format
+                        position = position or "\\N"
+                        buffer.write(
+                            f"{idx}\t{cle_interop}\t{position}\t{address_point.hexewkb.decode()}\n"
+                        )
+                    buffer.seek(0)
+
+                    cursor.copy_expert(
+                        "COPY bal_link_address (idx, cle_interop, position, point) FROM STDIN",
+                        buffer,
+                    )
+                cursor.execute(FILTER_BY_POSITION_SQL)
+                cursor.execute("CREATE INDEX ON bal_link_address USING gist (point)")
+                cursor.execute("ANALYZE bal_link_address")
+
+            with connection.connection.cursor(
+                name="bal_links", withhold=True
+            ) as links_cursor:
+                links_cursor.itersize = BATCH_SIZE
+                links_cursor.execute(
+                    LINKS_SQL, {"status": tuple(BuildingStatus.REAL_BUILDINGS_STATUS)}
+                )
+                for cle_interop, rnb_id in links_cursor:
+                    yield cle_interop, rnb_id
+        finally:
+            cursor.execute("DROP TABLE IF EXISTS bal_link_address")
 
-        return bdg_to_link
 
+def process_batch(
+    links: list[tuple[str, str]], bdg_import: BuildingImport
+) -> tuple[int, int]:
 
-def process_batch(batch: list, bdg_import: BuildingImport) -> tuple[int, int]:
+    # the BAN API is called before the transaction is opened
+    links, refused_count = _filter_unknown_addresses(links)
 
     with transaction.atomic():
 
-        updated_count = 0
-        refused_count = 0
-        for address_point, cle_interop in batch:
-
-            try:
-                updated_bdg = find_and_update_bdg(
-                    address_point, cle_interop, bdg_import.id
-                )
-
-                if isinstance(updated_bdg, Building):
-                    updated_count += 1
-            except (
-                BANUnknownCleInterop,
-                BANAPIDown,
-                BANBadRequest,
-                BANBadResultType,
-            ) as _:
-                refused_count += 1
-                continue
+        updated_count = link_addresses_to_bdgs(links, bdg_import.id)
 
         bdg_import.building_refused_count += refused_count  # type: ignore
         bdg_import.building_updated_count += updated_count  # type: ignore
@@ -322,7 +306,7 @@ def process_batch(batch: list, bdg_import: BuildingImport) -> tuple[int, int]:
 
     logger.info(
         "Batch done: size=%d, links_created=%d, refused=%d",
-        len(batch),
+        len(links) + refused_count,
         updated_count,
         refused_count,
     )
@@ -330,21 +314,69 @@ def process_batch(batch: list, bdg_import: BuildingImport) -> tuple[int, int]:
     return updated_count, refused_count
 
 
-def _known_building_address_link(cle_interop: str, rnb_id: str) -> bool:
+def _filter_unknown_addresses(
+    links: list[tuple[str, str]],
+) -> tuple[list[tuple[str, str]], int]:
+    """
+    The addresses missing from our Address table are fetched from the BAN API.
+    The links of the addresses unknown to the BAN are refused.
+    """
+    missing = Address.missing_addresses(
+        sorted({cle_interop for cle_interop, _ in links})
+    )
+
+    unknown = set()
+    addresses = []
+    for cle_interop, result in zip(missing, Address.fetch_from_ban_api(missing)):
+        if isinstance(result, Exception):
+            unknown.add(cle_interop)
+        else:
+            addresses.append(result)
+    Address.objects.bulk_create(addresses, ignore_conflicts=True)
+
+    accepted = [link for link in links if link[0] not in unknown]
+
+    return accepted, len(links) - len(accepted)
+
 
-    q = """
-        select 1
-        from batid_building_with_history as bdg
-        where bdg.rnb_id = %(rnb_id)s
-        and %(cle_interop)s = any(bdg.addresses_id)
+def link_addresses_to_bdgs(links: list[tuple[str, str]], bdg_import_id: int) -> int:
+    """
+    Add the addresses to the buildings, with one update event per building.
+    Return the number of links created.
     """
 
-    params = {
-        "rnb_id": rnb_id,
-        "cle_interop": cle_interop,
-    }
+    addresses_by_rnb_id: dict[str, list[str]] = {}
+    for cle_interop, rnb_id in links:
+        addresses_by_rnb_id.setdefault(rnb_id, []).append(cle_interop)
 
-    with connection.cursor() as cursor:
-        rows = dictfetchall(cursor, q, params)
+    bdgs = list(
+        Building.objects.select_for_update().filter(
+            rnb_id__in=addresses_by_rnb_id.keys(), is_active=True
+        )
+    )
+
+    event_origin = {"source": "import", "id": bdg_import_id}
+    updates = []
+    linked_count = 0
+
+    for bdg in bdgs:
+        bdg_addresses = list(bdg.addresses_id or [])  # make a shallow copy
+        new_addresses = [
+            a for a in addresses_by_rnb_id[bdg.rnb_id] if a not in bdg_addresses
+        ]
+        linked_count += len(new_addresses)
+
+        updates.append(
+            (
+                bdg,
+                {
+                    "event_origin": event_origin,
+                    "addresses_id": bdg_addresses + new_addresses,
+                },
+            )
+        )
+
+    # automated updates do not count in the Summer Challenge
+    Building.bulk_update_events(updates, get_RNB_team_user(), score=False)
 
-    return len(rows) > 0
+    return linked_count
@@ -1,20 +1,31 @@
+import csv
+import io
 import json
-import os
 import random
 import uuid
 from datetime import date, datetime, timezone
-from typing import Optional
+from itertools import islice
+from typing import Iterable, Iterator, Optional
 
 import fiona
-import psycopg2
-from batid.models import Building, BuildingImport, Candidate
+import numpy as np
+import shapely
+import shapely.geometry
+from batid.models import BuildingImport, Candidate
 from batid.services.administrative_areas import dpts_list
 from batid.services.imports import building_import_history
-from batid.services.source import BufferToCopy, Source
-from batid.utils.geo import drop_z, fix_nested_shells
+from batid.services.source import Source
+from batid.utils.geo import fix_nested_shells
+from batid.utils.misc import map_in_threads
 from celery import Signature, chain
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import connection, transaction
+from pyproj import Transformer
+
+# number of features read, checked against the known ids, converted and copied together
+CHUNK_SIZE = 10_000
+# threads converting the features geometries
+CONVERT_WORKERS = 4
 
 
 def create_bdtopo_full_import_tasks(dpt_list: list, release_date: str) -> list:
@@ -52,7 +63,9 @@ def create_bdtopo_dpt_import_tasks(dpt: str, release_date: str, bulk_launch_id=N
     return chain(dl_task, convert_task)
 
 
-def create_candidate_from_bdtopo(src_params, bulk_launch_uuid=None):
+def create_candidate_from_bdtopo(
+    src_params, bulk_launch_uuid=None, workers: int = CONVERT_WORKERS
+):
 
     src = Source("bdtopo")
     src.set_params(src_params)
@@ -63,86 +76,164 @@ def create_candidate_from_bdtopo(src_params, bulk_launch_uuid=None):
 
     path = src.find(src.filename)
 
+    created_count = 0
+
     with fiona.open(path, layer="batiment") as layer:
 
         srid = int(layer.crs["init"].split(":")[1])
 
-        candidates = []
+        # The features are read, converted and copied by chunks:
+        # the memory used does not depend on the size of the department
+        chunks = _iter_new_features_chunks(layer)
 
-        iterator = iter(layer)
+        with transaction.atomic():
+            print("-- transfer candidates to db --")
+            with connection.cursor() as cursor:
 
-        while True:
-            try:
-                feature = next(iterator)
-
-                # Skip light constructions
-                if feature["properties"]["construction_legere"] == True:
-                    continue
-
-                # Skip already known buildings
-                if _known_bdtopo_id(feature["properties"]["cleabs"]):
-                    continue
-
-                candidate = _transform_bdtopo_feature(feature, srid)
-                candidate = _add_import_info(candidate, building_import)
-                candidate["source_version"] = src_params["date"]
-                candidates.append(candidate)
-
-            except StopIteration:
-                break
-            except ValueError as e:
-                # This catches the "second must be in 0..59" error
-                print(f"SKIPPING BAD FEATURE due to invalid date: {e}")
-            except Exception as e:
-                print(f"An unexpected error occurred: {e}")
+                # Allow for a long COPY operation
+                timeout = 5 * 3600 * 1000  # 5 hours in milliseconds
+                cursor.execute(f"SET statement_timeout = {timeout};")
 
-    buffer = BufferToCopy()
-    buffer.write_data(candidates)
+                for candidates in map_in_threads(
+                    lambda chunk: _features_to_candidates(chunk, srid), chunks, workers
+                ):
+                    for candidate in candidates:
+                        candidate = _add_import_info(candidate, building_import)
+                        candidate["source_version"] = src_params["date"]
 
-    cols = candidates[0].keys()
+                    _copy_candidates(cursor, candidates)
+                    created_count += len(candidates)
 
-    with open(buffer.path, "r") as f:
-        with transaction.atomic():
-            print("-- transfer buffer to db --")
-            try:
-                with connection.cursor() as cursor:
+            building_import_history.increment_created_candidates(
+                building_import, created_count
+            )
 
-                    # Allow for a long COPY operation
-                    timeout = 5 * 3600 * 1000  # 5 hours in milliseconds
-                    cursor.execute(f"SET statement_timeout = {timeout};")
+    print(f"- remove {src.uncompress_folder} folder")
+    src.remove_uncompressed_folder()
 
-                    cursor.copy_from(f, Candidate._meta.db_table, sep=";", columns=cols)
 
-                building_import_history.increment_created_candidates(
-                    building_import, len(candidates)
-                )
+def _iter_new_features_chunks(layer) -> Iterator[list[dict]]:
 
-            except (Exception, psycopg2.DatabaseError) as error:
-                raise error
+    features = _iter_features(layer)
 
-    print("- remove buffer")
-    os.remove(buffer.path)
-    print(f"- remove {src.uncompress_folder} folder")
-    src.remove_uncompressed_folder()
+    while chunk := list(islice(features, CHUNK_SIZE)):
+
+        # Skip light constructions
+        chunk = [f for f in chunk if f["properties"]["construction_legere"] != True]
+
+        # Skip already known buildings
+        known_ids = _known_bdtopo_ids(f["properties"]["cleabs"] for f in chunk)
+
+        # fiona features are read in this thread only,
+        # the converting threads get plain dicts
+        yield [
+            {
+                "cleabs": f["properties"]["cleabs"],
+                "is_light": f["properties"]["construction_legere"],
+                "geometry": {
+                    "type": f["geometry"]["type"],
+                    "coordinates": f["geometry"]["coordinates"],
+                },
+            }
+            for f in chunk
+            if f["properties"]["cleabs"] not in known_ids
+        ]
+
+
+def _copy_candidates(cursor, candidates: list[dict]):
+
+    if not candidates:
+        return
+
+    # same format as BufferToCopy
+    buffer = io.StringIO()
+    writer = csv.DictWriter(
+        buffer,
+        fieldnames=candidates[0].keys(),
+        delimiter=";",
+        doublequote=False,
+        escapechar="\\",
+    )
+    writer.writerows(candidates)
+    buffer.seek(0)
+
+    cursor.copy_from(
+        buffer, Candidate._meta.db_table, sep=";", columns=candidates[0].keys()
+    )
+
+
+def _iter_features(layer):
+
+    iterator = iter(layer)
+
+    while True:
+        try:
+            yield next(iterator)
+        except StopIteration:
+            break
+        except ValueError as e:
+            # This catches the "second must be in 0..59" error
+            print(f"SKIPPING BAD FEATURE due to invalid date: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
 
 
 def _known_bdtopo_id(bdtopo_id: str) -> bool:
 
-    return Building.objects.filter(
-        ext_ids__contains=[{"source": "bdtopo", "id": bdtopo_id}]
-    ).exists()
+    return bdtopo_id in _known_bdtopo_ids([bdtopo_id])
+
+
+def _known_bdtopo_ids(bdtopo_ids: Iterable[str]) -> set[str]:
+    """
+    Return the BD TOPO ids already present in the buildings ext_ids, in one query.
+    Each id is looked up with the same containment as
+    Building.objects.filter(ext_ids__contains=[...]), using the ext_ids GIN index.
+    """
+
+    q = """
+        SELECT bdtopo_id
+        FROM unnest(%(ids)s::text[]) AS bdtopo_id
+        WHERE EXISTS (
+            SELECT 1
+            FROM batid_building
+            WHERE ext_ids @> jsonb_build_array(
+                jsonb_build_object('source', 'bdtopo', 'id', bdtopo_id)
+            )
+        )
+    """
+
+    ids = list(set(bdtopo_ids))
+    if not ids:
+        return set()
 
+    with connection.cursor() as cursor:
+        cursor.execute(q, {"ids": ids})
+        return {row[0] for row in cursor.fetchall()}
 
-def _transform_bdtopo_feature(feature, from_srid) -> dict:
-    geom_wkt = feature_to_wkt(feature, from_srid)
+
+def _features_to_candidates(features: list[dict], from_srid: int) -> list[dict]:
+
+    if not features:
+        return []
+
+    wkts = features_to_wkt([f["geometry"] for f in features], from_srid)
+
+    return [
+        _transform_bdtopo_feature(feature, geom_wkt)
+        for feature, geom_wkt in zip(features, wkts)
+        if geom_wkt is not None
+    ]
+
+
+def _transform_bdtopo_feature(feature: dict, geom_wkt: str) -> dict:
 
     address_keys = []  # type: ignore[var-annotated]
 
     candidate_dict = {
         "shape": geom_wkt,
-        "is_light": feature["properties"]["construction_legere"],
+        "is_light": feature["is_light"],
         "source": "bdtopo",
-        "source_id": feature["properties"]["cleabs"],
+        "source_id": feature["cleabs"],
         "address_keys": f"{{{','.join(address_keys)}}}",
         "created_at": datetime.now(timezone.utc),
         "updated_at": datetime.now(timezone.utc),
@@ -158,25 +249,45 @@ def _add_import_info(candidate, building_import: BuildingImport):
     return candidate
 
 
-def feature_to_wkt(feature, from_srid):
-
-    geojson = {
-        "type": feature["geometry"]["type"],
-        "coordinates": drop_z(feature["geometry"]["coordinates"]),
-    }
+def features_to_wkt(geometries: list[dict], from_srid: int) -> list[Optional[str]]:
+    """
+    Convert the GeoJSON-like geometries to WGS84 WKT, all at once with shapely and pyproj.
+    The geometries which cannot be converted are None.
+    """
 
-    # From shapely geom to GEOS geometry
-    geom = GEOSGeometry(json.dumps(geojson))
-    geom.srid = from_srid
+    geoms = np.array([_to_shapely(g) for g in geometries], dtype=object)
+    geoms = shapely.force_2d(geoms)
 
     # From local SRID to WGS84
-    geom.transform(4326)
+    transformer = Transformer.from_crs(from_srid, 4326, always_xy=True)
+    geoms = shapely.transform(
+        geoms,
+        lambda coords: np.column_stack(
+            transformer.transform(coords[:, 0], coords[:, 1])
+        ),
+    )
+
+    wkts = list(shapely.to_wkt(geoms, rounding_precision=-1, trim=True))
 
     # Eventually, fix nested shells
-    if not geom.valid and "Nested shells" in geom.valid_reason:
-        geom = fix_nested_shells(geom)
+    reasons = shapely.is_valid_reason(geoms)
+    for idx, reason in enumerate(reasons):
+        if reason is not None and "Nested shells" in reason:
+            try:
+                wkts[idx] = fix_nested_shells(GEOSGeometry(wkts[idx], srid=4326)).wkt
+            except Exception as e:
+                print(f"An unexpected error occurred: {e}")
+                wkts[idx] = None
+
+    return wkts
+
 
-    return geom.wkt
+def _to_shapely(geometry: dict):
+    try:
+        return shapely.geometry.shape(geometry)
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return None
 
 
 def bdtopo_src_params(dpt: str, date: str) -> dict:
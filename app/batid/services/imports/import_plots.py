@@ -1,21 +1,41 @@
 import csv
-import json
 import os
 from datetime import date, datetime, timezone
 from io import StringIO
+from itertools import islice
 from typing import Optional
 
 import ijson  # type: ignore[import-untyped]
-from batid.models import Plot
+import numpy as np
+import shapely
+import shapely.geometry
 from batid.services.administrative_areas import dpt_list_metropole, drom_list
 from batid.services.source import Source
+from batid.services.vector_tiles.cache import invalidate_plot_tiles
+from batid.utils.misc import map_in_threads
 from celery import Signature
-from django.contrib.gis.geos import GEOSGeometry, MultiPolygon
+from django.contrib.gis.geos import Polygon
 from django.db import connection, transaction
 
-
-def import_etalab_plots(dpt: str, release_date: str, batch_size: int = 100_000):
-    """Import plots from Etalab"""
+# threads converting the features geometries
+CONVERT_WORKERS = 4
+
+
+def import_etalab_plots(
+    dpt: str,
+    release_date: str,
+    batch_size: int = 100_000,
+    incremental: bool = True,
+    workers: int = CONVERT_WORKERS,
+) -> dict:
+    """
+    Import plots from Etalab
+
+    The plots are loaded into a staging table, then the department plots are updated:
+    - incremental mode: only the new, modified and removed plots are written.
+      Unchanged plots keep the source_version of the release they were last written by.
+    - otherwise: all the plots of the department are deleted and inserted again.
+    """
     print(
         f"---- Importing Etalab plots for departement {dpt} - release date {release_date} ----"
     )
@@ -26,31 +46,109 @@ def import_etalab_plots(dpt: str, release_date: str, batch_size: int = 100_000):
 
     with open(src.path) as f, transaction.atomic():
 
-        # Deleting all plots in the dpt
-        Plot.objects.filter(id__startswith=dpt).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE plot_import (id varchar(40) PRIMARY KEY, shape geometry)"
+            )
 
-        # Then, importing the new plots
         features = ijson.items(f, "features.item", use_float=True)
+        batches = iter(lambda: list(islice(features, batch_size)), [])
 
-        batch = []
-
-        for feature in features:
+        # the features are converted by a pool of threads while the file is read
+        for rows in map_in_threads(_features_to_rows, batches, workers):
+            _save_plots(rows)
 
-            plot = _feature_to_row(feature)
-            plot.append(release_date)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE plot_import")
+            extent = _plots_extent(cursor, dpt)
+            counts = _apply_plots(cursor, dpt, release_date, incremental)
+            cursor.execute("DROP TABLE plot_import")
 
-            batch.append(plot)
-            if len(batch) == batch_size:
-                _save_plots(batch)
-                batch = []
+        print(
+            f"- {counts['created']} plots created, {counts['updated']} updated, {counts['deleted']} deleted"
+        )
 
-        # some plots might remain in the batch at the end of the loop, we save them
-        if batch:
-            _save_plots(batch)
+        # the plots tiles cached before the import are not served anymore
+        if extent and any(counts.values()):
+            invalidate_plot_tiles([Polygon.from_bbox(extent)])
 
         # remove the file
         os.remove(src.path)
 
+    return counts
+
+
+def _plots_extent(cursor, dpt: str) -> Optional[tuple]:
+    """Extent of the department plots, before and after the import"""
+    cursor.execute(
+        """
+        SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e)
+        FROM (
+            SELECT ST_Extent(shape) AS e FROM (
+                SELECT shape FROM batid_plot WHERE id LIKE %(dpt_prefix)s
+                UNION ALL
+                SELECT shape FROM plot_import
+            ) AS plots
+        ) AS extent
+        """,
+        {"dpt_prefix": f"{dpt}%"},
+    )
+    row = cursor.fetchone()
+    return None if row[0] is None else row
+
+
+def _apply_plots(cursor, dpt: str, release_date: str, incremental: bool) -> dict:
+
+    params = {
+        "dpt_prefix": f"{dpt}%",
+        "release_date": release_date,
+        "now": datetime.now(timezone.utc),
+    }
+
+    if incremental:
+        cursor.execute(
+            """
+            DELETE FROM batid_plot AS p
+            WHERE p.id LIKE %(dpt_prefix)s
+            AND NOT EXISTS (SELECT 1 FROM plot_import AS s WHERE s.id = p.id)
+            """,
+            params,
+        )
+        deleted = cursor.rowcount
+
+        # the geometries are compared with their binary representation
+        cursor.execute(
+            """
+            UPDATE batid_plot AS p
+            SET shape = s.shape, source_version = %(release_date)s, updated_at = %(now)s
+            FROM plot_import AS s
+            WHERE s.id = p.id
+            AND ST_AsEWKB(p.shape) IS DISTINCT FROM ST_AsEWKB(s.shape)
+            """,
+            params,
+        )
+        updated = cursor.rowcount
+    else:
+        cursor.execute(
+            "DELETE FROM batid_plot WHERE id LIKE %(dpt_prefix)s",
+            params,
+        )
+        deleted = cursor.rowcount
+        updated = 0
+
+    cursor.execute(
+        """
+        INSERT INTO batid_plot (id, shape, created_at, updated_at, source_version)
+        SELECT s.id, s.shape, %(now)s, %(now)s, %(release_date)s
+        FROM plot_import AS s
+        WHERE NOT EXISTS (SELECT 1 FROM batid_plot AS p WHERE p.id = s.id)
+        """,
+        params,
+    )
+    created = cursor.rowcount
+
+    return {"created": created, "updated": updated, "deleted": deleted}
+
 
 def _save_plots(rows):
 
@@ -62,36 +160,39 @@ def _save_plots(rows):
     with connection.cursor() as cursor:
         cursor.copy_from(
             f,
-            Plot._meta.db_table,
-            columns=("id", "shape", "created_at", "updated_at", "source_version"),
+            "plot_import",
+            columns=("id", "shape"),
             sep=",",
         )
 
 
-def polygon_to_multipolygon(polygon):
-    return MultiPolygon(polygon)
-
-
-def _feature_to_row(feature: dict):
-    if feature["geometry"]["type"] not in ["Polygon", "MultiPolygon"]:
-        raise ValueError(f"Unexpected geometry type: {feature['geometry']['type']}")
+def _features_to_rows(features: list[dict]) -> list[list]:
+    """
+    Convert the features to (id, hex EWKB MultiPolygon) rows.
+    The geometries are processed all at once with shapely, which releases the GIL.
+    """
+    for feature in features:
+        if feature["geometry"]["type"] not in ["Polygon", "MultiPolygon"]:
+            raise ValueError(f"Unexpected geometry type: {feature['geometry']['type']}")
 
-    multi_poly = GEOSGeometry(json.dumps(feature["geometry"]))
+    geoms = np.array(
+        [shapely.geometry.shape(feature["geometry"]) for feature in features],
+        dtype=object,
+    )
 
-    if not multi_poly.valid:
-        multi_poly = multi_poly.buffer(0)
+    invalid = ~shapely.is_valid(geoms)
+    geoms[invalid] = shapely.buffer(geoms[invalid], 0)
 
-    if multi_poly.geom_type == "Polygon":
-        multi_poly = polygon_to_multipolygon(multi_poly)
+    polygons = shapely.get_type_id(geoms) == shapely.GeometryType.POLYGON
+    if polygons.any():
+        geoms[polygons] = shapely.multipolygons(
+            geoms[polygons], indices=np.arange(polygons.sum())
+        )
 
-    now = datetime.now(timezone.utc)
+    geoms = shapely.set_srid(geoms, 4326)
+    hexewkbs = shapely.to_wkb(geoms, hex=True, include_srid=True)
 
-    return [
-        feature["id"],
-        multi_poly.hexewkb.decode("ascii"),
-        f"{now}",
-        f"{now}",
-    ]
+    return [[feature["id"], hexewkb] for feature, hexewkb in zip(features, hexewkbs)]
 
 
 def etalab_dpt_list() -> list:
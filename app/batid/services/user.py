@@ -19,11 +19,11 @@ def get_staff_emails() -> list[str]:
     )
 
 
-def check_and_increment_contribution_count(user: User | None) -> None:
+def check_and_increment_contribution_count(user: User | None, count: int = 1) -> None:
     if user is None:
         return
 
-    user.profile.check_and_increment_contribution_count()  # type: ignore[attr-defined]
+    user.profile.check_and_increment_contribution_count(count)  # type: ignore[attr-defined]
 
 
 def _int_to_b64(i: int) -> str:
@@ -0,0 +1,267 @@
+import gzip
+import os
+import sqlite3
+import time
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional
+
+from batid.models import Department
+from batid.services.vector_tiles.building import bdgs_tiles_sql
+from batid.services.vector_tiles.common import TileParams, extent_to_tile_range
+from batid.services.vector_tiles.plots import plots_tiles_sql
+from batid.utils.misc import map_in_threads
+from django.conf import settings
+from django.db import connection
+
+# Pre-rendered tiles, stored in one MBTiles archive per layer (https://github.com/mapbox/mbtiles-spec).
+#
+# On top of the spec tables, the archive has a "rendered_ranges" table listing the tile ranges
+# rendered and when. It makes the difference between an empty tile (rendered but not stored)
+# and a tile which has never been rendered (to be built from the database).
+
+ARCHIVE_LAYERS: dict[str, Callable[[TileParams], str]] = {
+    "buildings": lambda tile: bdgs_tiles_sql(tile, "point", True),
+    "shapes": lambda tile: bdgs_tiles_sql(tile, "shape", True),
+    "plots": plots_tiles_sql,
+}
+
+# number of tiles rendered by a worker before they are written to the archive
+RENDER_CHUNK_SIZE = 256
+
+
+def archive_path(layer: str) -> Optional[str]:
+    if not settings.TILES_ARCHIVE_DIR:
+        return None
+    return os.path.join(settings.TILES_ARCHIVE_DIR, f"{layer}.mbtiles")
+
+
+class MBTilesArchive:
+    def __init__(self, path: str, readonly: bool = True):
+        self.path = path
+
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        else:
+            self.conn = sqlite3.connect(path, timeout=60)
+            # the archive can be read by the tile views while it is rendered
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self._create_schema()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _create_schema(self):
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+                CREATE TABLE IF NOT EXISTS tiles (
+                    zoom_level INTEGER,
+                    tile_column INTEGER,
+                    tile_row INTEGER,
+                    tile_data BLOB
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+                    ON tiles (zoom_level, tile_column, tile_row);
+                CREATE TABLE IF NOT EXISTS rendered_ranges (
+                    zoom INTEGER,
+                    x_min INTEGER,
+                    x_max INTEGER,
+                    y_min INTEGER,
+                    y_max INTEGER,
+                    rendered_at INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS rendered_ranges_zoom_idx ON rendered_ranges (zoom);
+                """)
+
+    def set_metadata(self, metadata: dict):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+                [(name, str(value)) for name, value in metadata.items()],
+            )
+
+    def write_tiles(self, tiles: Iterable[tuple[TileParams, bytes]]):
+        rows = []
+        empty = []
+        for tile, data in tiles:
+            if data:
+                rows.append(
+                    (tile["zoom"], tile["x"], _tms_row(tile), gzip.compress(data))
+                )
+            else:
+                # empty tiles are not stored, rendered_ranges tells they exist
+                empty.append((tile["zoom"], tile["x"], _tms_row(tile)))
+
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            # the tile may have been stored by a former rendering
+            self.conn.executemany(
+                "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                empty,
+            )
+
+    def add_rendered_range(
+        self, zoom: int, tile_range: tuple[int, int, int, int], rendered_at: int
+    ):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO rendered_ranges (zoom, x_min, x_max, y_min, y_max, rendered_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (zoom, *tile_range, rendered_at),
+            )
+
+    def get_tile(self, tile: TileParams) -> Optional[tuple[bytes, int]]:
+        """
+        Return the tile and the time (in ns) it was rendered,
+        or None if the tile has not been rendered.
+        """
+        row = self.conn.execute(
+            """
+            SELECT max(rendered_at) FROM rendered_ranges
+            WHERE zoom = ? AND ? BETWEEN x_min AND x_max AND ? BETWEEN y_min AND y_max
+            """,
+            (tile["zoom"], tile["x"], tile["y"]),
+        ).fetchone()
+        rendered_at = row[0] if row else None
+        if rendered_at is None:
+            return None
+
+        row = self.conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (tile["zoom"], tile["x"], _tms_row(tile)),
+        ).fetchone()
+        data = gzip.decompress(row[0]) if row else b""
+
+        return data, rendered_at
+
+
+def get_archived_zooms(layer: str) -> Optional[tuple[int, int]]:
+    """Lowest and highest zoom levels rendered in the archive of the layer, if any"""
+    path = archive_path(layer)
+    if path is None or not os.path.exists(path):
+        return None
+
+    with MBTilesArchive(path) as archive:
+        row = archive.conn.execute(
+            "SELECT min(zoom), max(zoom) FROM rendered_ranges"
+        ).fetchone()
+
+    return None if row[0] is None else (row[0], row[1])
+
+
+def get_archived_tile(layer: str, tile: TileParams) -> Optional[tuple[bytes, int]]:
+    path = archive_path(layer)
+    if path is None or not os.path.exists(path):
+        return None
+
+    try:
+        with MBTilesArchive(path) as archive:
+            return archive.get_tile(tile)
+    except sqlite3.Error:
+        # the tile is built from the database
+        return None
+
+
+def render_archive(
+    layer: str,
+    min_zoom: int,
+    max_zoom: int,
+    dpt: Optional[str] = None,
+    workers: int = 4,
+):
+    """
+    Pre-render the tiles of a layer from min_zoom to max_zoom covering a department
+    (or all of France) into the layer archive.
+
+    Tiles are rendered by Postgres, the workers are threads each with their own
+    database connection.
+    """
+    if layer not in ARCHIVE_LAYERS:
+        raise ValueError(f"Unknown tiles layer: {layer}")
+
+    path = archive_path(layer)
+    if path is None:
+        raise ValueError("settings.TILES_ARCHIVE_DIR is not set")
+
+    departments = Department.objects.filter(shape__isnull=False)
+    if dpt:
+        departments = departments.filter(code=dpt)
+
+    with MBTilesArchive(path, readonly=False) as archive:
+        archive.set_metadata(
+            {
+                "name": layer,
+                "format": "pbf",
+                "type": "overlay",
+                "minzoom": min_zoom,
+                "maxzoom": max_zoom,
+            }
+        )
+
+        for department in departments:
+            # set before rendering: the edits made during the rendering are not in the archive
+            rendered_at = time.time_ns()
+
+            for zoom in range(min_zoom, max_zoom + 1):
+                tile_range = extent_to_tile_range(department.shape.extent, zoom)
+                tiles = _iter_tiles(zoom, tile_range)
+
+                for rendered in _render_in_parallel(layer, tiles, workers):
+                    archive.write_tiles(rendered)
+
+                archive.add_rendered_range(zoom, tile_range, rendered_at)
+
+
+def render_tiles(
+    layer: str, tiles: list[TileParams], close_connection: bool = False
+) -> list[tuple[TileParams, bytes]]:
+    build_sql = ARCHIVE_LAYERS[layer]
+    rendered = []
+
+    try:
+        with connection.cursor() as cursor:
+            for tile in tiles:
+                cursor.execute(build_sql(tile))
+                data = cursor.fetchone()[0]
+                rendered.append((tile, bytes(data or b"")))
+    finally:
+        # Django connections are per thread, we don't leave them open in the pool threads
+        if close_connection:
+            connection.close()
+
+    return rendered
+
+
+def _render_in_parallel(
+    layer: str, tiles: Iterator[TileParams], workers: int
+) -> Iterator[list[tuple[TileParams, bytes]]]:
+    # a whole zoom level of France is never held in memory
+    chunks = iter(lambda: list(islice(tiles, RENDER_CHUNK_SIZE)), [])
+    close_connection = workers > 1
+
+    return map_in_threads(
+        lambda chunk: render_tiles(layer, chunk, close_connection=close_connection),
+        chunks,
+        workers,
+    )
+
+
+def _iter_tiles(zoom: int, tile_range: tuple[int, int, int, int]):
+    x_min, x_max, y_min, y_max = tile_range
+    for x in range(x_min, x_max + 1):
+        for y in range(y_min, y_max + 1):
+            tile: TileParams = {"x": x, "y": y, "zoom": zoom}
+            yield tile
+
+
+def _tms_row(tile: TileParams) -> int:
+    # MBTiles rows follow the TMS scheme: y axis pointing north
+    return (2 ** tile["zoom"]) - 1 - tile["y"]
@@ -1,4 +1,4 @@
-from batid.models import Building
+from batid.models import Building, BuildingGeneralized, BuildingGridCell
 from batid.services.bdg_status import BuildingStatus
 from batid.services.vector_tiles.common import (
     Envelope,
@@ -6,6 +6,18 @@ from batid.services.vector_tiles.common import (
     envelope_to_bounds_sql,
     tile_to_envelope,
 )
+from django.db import connection, transaction
+
+# Below zoom 16, the tiles are drawn from the generalization of the active and real buildings,
+# maintained by a trigger on batid_building (see BuildingGridCell and BuildingGeneralized)
+GENERALIZED_MIN_ZOOM = 8
+# up to this zoom: clusters of buildings, then simplified footprints
+CLUSTERS_MAX_ZOOM = 12
+GENERALIZED_MAX_ZOOM = 15
+# zoom of the BuildingGridCell grid
+GRID_ZOOM = 16
+# each tile is divided in 16 x 16 clusters
+CLUSTERS_PER_TILE_ZOOM = 4
 
 
 def get_real_buildings_status():
@@ -57,12 +69,126 @@ def envelope_to_buildings_sql(
     return sql_tmpl.format(**tbl)
 
 
+def tile_to_clusters_sql(tile: TileParams) -> str:
+    env = tile_to_envelope(tile)
+
+    # the grid cells covered by the tile, grouped by cluster
+    zoom_diff = GRID_ZOOM - tile["zoom"]
+    params = {
+        "table": BuildingGridCell._meta.db_table,
+        "env": envelope_to_bounds_sql(env),
+        "shift": zoom_diff - CLUSTERS_PER_TILE_ZOOM,
+        "x_min": tile["x"] << zoom_diff,
+        "x_max": ((tile["x"] + 1) << zoom_diff) - 1,
+        "y_min": tile["y"] << zoom_diff,
+        "y_max": ((tile["y"] + 1) << zoom_diff) - 1,
+    }
+
+    # clusters are drawn at the barycenter of their buildings
+    sql_tmpl = """
+        WITH
+        bounds AS (
+            SELECT {env}::box2d AS b2d
+        ),
+        clusters AS (
+            SELECT sum(c.count) AS count,
+                   sum(c.sum_x) / sum(c.count) AS x,
+                   sum(c.sum_y) / sum(c.count) AS y
+            FROM {table} c
+            WHERE c.x BETWEEN {x_min} AND {x_max}
+            AND c.y BETWEEN {y_min} AND {y_max}
+            AND c.count > 0
+            GROUP BY c.x >> {shift}, c.y >> {shift}
+        ),
+        mvtgeom AS (
+            SELECT ST_AsMVTGeom(ST_SetSRID(ST_MakePoint(clusters.x, clusters.y), 3857), bounds.b2d) AS geom,
+                   clusters.count AS count
+            FROM clusters, bounds
+        )
+        SELECT ST_AsMVT(mvtgeom.*) FROM mvtgeom
+    """
+    return sql_tmpl.format(**params)
+
+
+def envelope_to_generalized_buildings_sql(env: Envelope, geometry_column: str) -> str:
+    params = {
+        "table": BuildingGeneralized._meta.db_table,
+        "env": envelope_to_bounds_sql(env),
+        "geomColumn": geometry_column,
+    }
+
+    # same attributes as the full buildings tiles, the generalization only has active buildings
+    # the geometries are already in EPSG:3857
+    sql_tmpl = """
+        WITH
+        bounds AS (
+            SELECT {env} AS geom,
+                   {env}::box2d AS b2d
+        ),
+        mvtgeom AS (
+            SELECT ST_AsMVTGeom(t.{geomColumn}, bounds.b2d) AS geom,
+                   t.rnb_id,
+                   true AS is_active,
+                   t.status AS status,
+                   t.is_validated AS is_validated
+            FROM {table} t, bounds
+            WHERE ST_Intersects(t.{geomColumn}, bounds.geom)
+        )
+        SELECT ST_AsMVT(mvtgeom.*) FROM mvtgeom
+    """
+    return sql_tmpl.format(**params)
+
+
 def bdgs_tiles_sql(tile: TileParams, data_type: str, only_active_and_real: bool) -> str:
     env = tile_to_envelope(tile)
     if data_type == "shape":
         geometry_column = "shape"
     elif data_type == "point":
         geometry_column = "point"
+
+    # the generalization only has the active and real buildings, from GENERALIZED_MIN_ZOOM
+    if only_active_and_real and GENERALIZED_MIN_ZOOM <= tile["zoom"]:
+        if tile["zoom"] <= CLUSTERS_MAX_ZOOM:
+            return tile_to_clusters_sql(tile)
+
+        if tile["zoom"] <= GENERALIZED_MAX_ZOOM:
+            return envelope_to_generalized_buildings_sql(env, geometry_column)
+
     sql = envelope_to_buildings_sql(env, geometry_column, only_active_and_real)
 
     return sql
+
+
+@transaction.atomic
+def rebuild_buildings_generalization():
+    """
+    Rebuild BuildingGridCell and BuildingGeneralized from scratch.
+    The trigger keeps them updated afterwards, this is only needed once
+    (or to fix a drift). The buildings edits are blocked during the rebuild.
+    """
+    real_status = get_real_buildings_status()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"TRUNCATE {BuildingGridCell._meta.db_table}, {BuildingGeneralized._meta.db_table}"
+        )
+        cursor.execute(f"""
+            INSERT INTO {BuildingGeneralized._meta.db_table} (building_id, rnb_id, status, is_validated, point, shape)
+            SELECT id,
+                   rnb_id,
+                   status,
+                   COALESCE(array_length(validated_by, 1), 0) > 0,
+                   ST_Transform(point, 3857),
+                   ST_SimplifyPreserveTopology(ST_Transform(shape, 3857), 1)
+            FROM {Building._meta.db_table}
+            WHERE is_active AND status IN ({real_status}) AND point IS NOT NULL
+            """)  # nosec B608: no user input
+        cursor.execute(f"""
+            INSERT INTO {BuildingGridCell._meta.db_table} (x, y, count, sum_x, sum_y)
+            SELECT (building_grid_cell(point)).x AS cell_x,
+                   (building_grid_cell(point)).y AS cell_y,
+                   count(*),
+                   sum(ST_X(point)),
+                   sum(ST_Y(point))
+            FROM {BuildingGeneralized._meta.db_table}
+            GROUP BY cell_x, cell_y
+            """)  # nosec B608: no user input
@@ -0,0 +1,242 @@
+import hashlib
+import math
+import time
+from typing import Callable, Iterable, Optional, TypedDict
+
+from batid.models import TileAreaEdit
+from batid.services.vector_tiles.common import TileParams, extent_to_tile_range
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Max
+
+# Server side cache of the vector tiles.
+#
+# Cached tiles are never deleted: each tile key contains the "version" of the area it covers.
+# Editing some data bumps the version of the areas covering its old and new geometries,
+# the tiles cached under the former versions are not reachable anymore
+# and are evicted by the cache backend (see CACHES["tiles"] in settings).
+#
+# The edits are also marked in the database (TileAreaEdit), by zoom 14 area:
+# the archived tiles rendered before an edit of their area are not served anymore.
+# The last edit of each area, at every zoom level, is kept in the tiles cache as well:
+# the database is only queried when it is missing (evicted, or never edited since the cache was emptied).
+
+TILES_CACHE_ALIAS = "tiles"
+
+# Tiles with a zoom level above this one share the version of their ancestor at this zoom
+INVALIDATION_ZOOM = 14
+
+# ST_AsMVTGeom default buffer: features up to 256/4096 of a tile outside of it are still drawn on it
+TILE_BUFFER_RATIO = 256 / 4096
+
+BUILDING_LAYERS = ("buildings", "shapes")
+# The buildings clusters tiles (zoom < 13) are not invalidated on each edit, they expire
+BUILDING_TILES_MIN_ZOOM = 13
+
+PLOT_LAYERS = ("plots",)
+PLOT_TILES_MIN_ZOOM = 16
+
+
+class CachedTile(TypedDict):
+    tile: bytes
+    etag: str
+    last_modified: float
+
+
+def tiles_cache():
+    return caches[TILES_CACHE_ALIAS]
+
+
+def get_or_build_tile(
+    layer: str,
+    tile: TileParams,
+    variant: str,
+    build: Callable[[], Optional[bytes]],
+    timeout: Optional[int],
+) -> CachedTile:
+    """
+    Return the cached tile or build it with the `build` callable and cache it.
+    `variant` distinguishes the tiles of a layer built with different query parameters.
+    """
+    cache = tiles_cache()
+
+    version = get_area_version(layer, tile)
+    key = _tile_key(layer, tile, variant, version)
+
+    cached = cache.get(key)
+    if cached is None:
+        content = bytes(build() or b"")
+        cached = {
+            "tile": content,
+            "etag": f'"{hashlib.md5(content, usedforsecurity=False).hexdigest()}"',
+            "last_modified": time.time(),
+        }
+        cache.set(key, cached, timeout=timeout)
+
+    return cached
+
+
+def get_area_version(layer: str, tile: TileParams) -> str:
+    cache = tiles_cache()
+    key = _version_key(layer, *_version_area(tile))
+
+    version = cache.get(key)
+    if version is None:
+        # Unknown (or evicted) version: we start a new one so the tiles cached
+        # under a former version of the area cannot be served anymore
+        version = str(time.time_ns())
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+
+    return version
+
+
+def invalidate_tiles(
+    layers: Iterable[str], geometries: Iterable[Optional[GEOSGeometry]], min_zoom: int
+):
+    """
+    Invalidate the cached tiles of the layers which are covering the geometries (WGS84),
+    from `min_zoom` to the maximum zoom level.
+    """
+    areas = set()
+    for geom in geometries:
+        if geom is None or geom.empty:
+            continue
+        for zoom in range(min(min_zoom, INVALIDATION_ZOOM), INVALIDATION_ZOOM + 1):
+            areas.update(_covering_tiles(geom.extent, zoom))
+
+    if not areas:
+        return
+
+    version = str(time.time_ns())
+    values = {_version_key(layer, *area): version for layer in layers for area in areas}
+    tiles_cache().set_many(values, timeout=None)
+
+
+def mark_areas_edited(
+    layers: Iterable[str], geometries: Iterable[Optional[GEOSGeometry]]
+):
+    """
+    Mark the areas covering the geometries (WGS84) as edited now:
+    in the database by zoom 14 area, in the tiles cache at every zoom level.
+    To be called once the edit is committed: an archive rendered in between
+    would otherwise be served without the edit.
+    """
+    areas = set()
+    for geom in geometries:
+        if geom is None or geom.empty:
+            continue
+        for zoom in range(0, INVALIDATION_ZOOM + 1):
+            areas.update(_covering_tiles(geom.extent, zoom))
+
+    edited_at = time.time_ns()
+    # always in the same order, concurrent marks of the same areas cannot deadlock
+    marks = [
+        TileAreaEdit(layer=layer, x=x, y=y, edited_at=edited_at)
+        for layer in sorted(layers)
+        for zoom, x, y in sorted(areas)
+        if zoom == INVALIDATION_ZOOM
+    ]
+    TileAreaEdit.objects.bulk_create(
+        marks,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["layer", "x", "y"],
+        update_fields=["edited_at"],
+    )
+
+    # once in the database: a miss in the cache in between reads the mark from there
+    values = {_edit_key(layer, *area): edited_at for layer in layers for area in areas}
+    tiles_cache().set_many(values, timeout=None)
+
+
+def area_edited_since(layer: str, tile: TileParams, since_ns: int) -> bool:
+    """Has the data of the area covered by the tile been edited since the given time (in ns)"""
+    cache = tiles_cache()
+    area = _version_area(tile)
+    key = _edit_key(layer, *area)
+
+    edited_at = cache.get(key)
+    if edited_at is None:
+        edited_at = _last_area_edit(layer, *area)
+        # a mark set in the meantime is not overwritten
+        cache.add(key, edited_at, timeout=None)
+
+    return edited_at > since_ns
+
+
+def _last_area_edit(layer: str, zoom: int, x: int, y: int) -> int:
+    # The last edit (in ns) of the area, 0 if never edited
+    if zoom == INVALIDATION_ZOOM:
+        x_range, y_range = (x, x), (y, y)
+    else:
+        # all the zoom 14 areas in the tile, and in its buffer
+        shift = INVALIDATION_ZOOM - zoom
+        margin = math.ceil((1 << shift) * TILE_BUFFER_RATIO)
+        x_range = ((x << shift) - margin, ((x + 1) << shift) - 1 + margin)
+        y_range = ((y << shift) - margin, ((y + 1) << shift) - 1 + margin)
+
+    last_edit = TileAreaEdit.objects.filter(
+        layer=layer, x__range=x_range, y__range=y_range
+    ).aggregate(last_edit=Max("edited_at"))["last_edit"]
+
+    return last_edit or 0
+
+
+def invalidate_building_tiles(geometries: Iterable[Optional[GEOSGeometry]]):
+    _invalidate_tiles_on_commit(BUILDING_LAYERS, geometries, BUILDING_TILES_MIN_ZOOM)
+
+
+def invalidate_plot_tiles(geometries: Iterable[Optional[GEOSGeometry]]):
+    _invalidate_tiles_on_commit(PLOT_LAYERS, geometries, PLOT_TILES_MIN_ZOOM)
+
+
+def _invalidate_tiles_on_commit(
+    layers: Iterable[str], geometries: Iterable[Optional[GEOSGeometry]], min_zoom: int
+):
+    geometries = [g for g in geometries if g is not None]
+    if not geometries:
+        return
+
+    invalidate_tiles(layers, geometries, min_zoom)
+
+    # The former tiles can be cached again by concurrent requests until the transaction is committed
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: invalidate_tiles(layers, geometries, min_zoom))
+
+    # run right away outside of a transaction
+    transaction.on_commit(lambda: mark_areas_edited(layers, geometries))
+
+
+def _tile_key(layer: str, tile: TileParams, variant: str, version: str) -> str:
+    return (
+        f"tiles:tile:{layer}:{variant}:{tile['zoom']}:{tile['x']}:{tile['y']}:{version}"
+    )
+
+
+def _version_key(layer: str, zoom: int, x: int, y: int) -> str:
+    return f"tiles:version:{layer}:{zoom}:{x}:{y}"
+
+
+def _edit_key(layer: str, zoom: int, x: int, y: int) -> str:
+    return f"tiles:edit:{layer}:{zoom}:{x}:{y}"
+
+
+def _version_area(tile: TileParams) -> tuple[int, int, int]:
+    zoom = tile["zoom"]
+    if zoom <= INVALIDATION_ZOOM:
+        return zoom, tile["x"], tile["y"]
+
+    shift = zoom - INVALIDATION_ZOOM
+    return INVALIDATION_ZOOM, tile["x"] >> shift, tile["y"] >> shift
+
+
+def _covering_tiles(extent, zoom: int) -> set[tuple[int, int, int]]:
+    x_min, x_max, y_min, y_max = extent_to_tile_range(
+        extent, zoom, buffer=TILE_BUFFER_RATIO
+    )
+
+    return {
+        (zoom, x, y) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)
+    }
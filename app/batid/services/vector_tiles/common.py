@@ -1,3 +1,4 @@
+import math
 from typing import TypedDict
 
 
@@ -50,3 +51,38 @@ def envelope_to_bounds_sql(env: Envelope) -> str:
         "ST_Segmentize(ST_MakeEnvelope({xmin}, {ymin}, {xmax}, {ymax}, 3857),{segSize})"
     )
     return sql_tmpl.format(**env, segSize=segSize)
+
+
+def lnglat_to_tile_coords(lng: float, lat: float, zoom: int) -> tuple[float, float]:
+    """Fractional XYZ tile coordinates of a WGS84 position"""
+    # Web Mercator is undefined at the poles
+    lat = max(min(lat, 85.0511), -85.0511)
+    size = 2**zoom
+
+    x = (lng + 180.0) / 360.0 * size
+    lat_rad = math.radians(lat)
+    y = (1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * size
+
+    return x, y
+
+
+def extent_to_tile_range(
+    extent: tuple[float, float, float, float], zoom: int, buffer: float = 0.0
+) -> tuple[int, int, int, int]:
+    """
+    (x_min, x_max, y_min, y_max) of the tiles covering a WGS84 extent.
+    `buffer` is a fraction of a tile added around the extent.
+    """
+    xmin, ymin, xmax, ymax = extent
+
+    # tile y coordinates grow southward
+    left, top = lnglat_to_tile_coords(xmin, ymax, zoom)
+    right, bottom = lnglat_to_tile_coords(xmax, ymin, zoom)
+
+    size = 2**zoom
+    return (
+        max(math.floor(left - buffer), 0),
+        min(math.floor(right + buffer), size - 1),
+        max(math.floor(top - buffer), 0),
+        min(math.floor(bottom + buffer), size - 1),
+    )
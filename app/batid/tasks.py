@@ -6,9 +6,18 @@ from typing import Optional
 logger = logging.getLogger(__name__)
 
 from api_alpha.utils.sandbox_client import SandboxClient
+from batid.models import Trophy
 from batid.services.administrative_areas import dpts_list, slice_dpts
+from batid.services.bdg_diff import build_diff_segments as build_diff_segments_job
+from batid.services.bdg_on_plot import (
+    refresh_building_plots as refresh_building_plots_job,
+)
 from batid.services.building import export_city as export_city_job
-from batid.services.candidate import Inspector
+from batid.services.candidate import (
+    BatchInspector,
+    Inspector,
+    inspect_worker_partitions,
+)
 from batid.services.data_fix.fill_empty_event_origin import (
     fix as fix_fill_empty_event_origin,
 )
@@ -19,6 +28,7 @@ from batid.services.data_fix.remove_light_buildings import (
     remove_light_buildings as remove_light_buildings_job,
 )
 from batid.services.data_gouv_publication import get_area_publish_task, publish
+from batid.services.data_gouv_publication import publish_all as publish_all_job
 from batid.services.imports.import_bal import (
     create_all_bal_links_tasks,
 )
@@ -59,8 +69,13 @@ from batid.services.reports.arcep import (
 )
 from batid.services.s3_backup.backup_task import backup_to_s3 as backup_to_s3_job
 from batid.services.source import Source
+from batid.services.vector_tiles.archive import get_archived_zooms, render_archive
+from batid.services.vector_tiles.building import (
+    rebuild_buildings_generalization as rebuild_buildings_generalization_job,
+)
 from batid.utils.auth import make_random_password
 from celery import Signature, chain, shared_task
+from django.contrib.auth.models import User
 
 
 @shared_task
@@ -140,7 +155,13 @@ def queue_full_bdtopo_import(
 @notify_if_error
 @shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
 def import_plots(dpt: str, release_date: str):
-    import_etalab_plots_job(dpt, release_date)
+    counts = import_etalab_plots_job(dpt, release_date)
+
+    # the edited areas are not served from the plots archive anymore, until it is rendered again
+    zooms = get_archived_zooms("plots")
+    if zooms and any(counts.values()):
+        render_tiles_archive.delay("plots", *zooms, dpt=dpt)
+
     return "done"
 
 
@@ -172,6 +193,33 @@ def queue_full_plots_import(
     return f"Queued {len(tasks)} tasks"
 
 
+@shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
+def refresh_building_plots(dpt: str):
+    refresh_building_plots_job(dpt)
+    return "done"
+
+
+@notify_if_error
+@shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
+def queue_full_building_plots_refresh(
+    dpt_start: Optional[str] = None, dpt_end: Optional[str] = None
+):
+
+    dpts = slice_dpts(etalab_dpt_list(), dpt_start, dpt_end)
+
+    notify_tech(
+        f"Calcul des liens bâtiments/parcelles. Départements: {dpts[0]} à {dpts[-1]}"
+    )
+
+    tasks = [
+        Signature("batid.tasks.refresh_building_plots", args=[dpt], immutable=True)  # type: ignore[arg-type]
+        for dpt in dpts
+    ]
+
+    chain(*tasks)()
+    return f"Queued {len(tasks)} tasks"
+
+
 @shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
 def import_cities(dpt):
     import_etalab_cities(dpt)
@@ -200,13 +248,53 @@ def import_dpts():
 
 
 @shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
-def inspect_candidates():
-    i = Inspector()
+def inspect_candidates(
+    batch_size: Optional[int] = None,
+    partition: Optional[str] = None,
+    worker: Optional[int] = None,
+    workers: Optional[int] = None,
+):
+    if workers:
+        inspect_worker_partitions(worker or 0, workers, batch_size)
+        return "done"
+
+    i = (
+        BatchInspector(batch_size, partition=partition)
+        if batch_size
+        else Inspector(partition)
+    )
     i.inspect()
 
     return "done"
 
 
+@notify_if_error
+@shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
+def render_tiles_archive(
+    layer: str,
+    min_zoom: int,
+    max_zoom: int,
+    dpt: Optional[str] = None,
+    workers: int = 4,
+):
+    render_archive(layer, min_zoom, max_zoom, dpt=dpt, workers=workers)
+    return "done"
+
+
+@notify_if_error
+@shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
+def rebuild_buildings_generalization():
+    rebuild_buildings_generalization_job()
+    return "done"
+
+
+@notify_if_error
+@shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
+def build_diff_segments():
+    count = build_diff_segments_job()
+    return f"Built {count} days of diff segments"
+
+
 @shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
 def export_city(insee_code):
     return export_city_job(insee_code)
@@ -260,6 +348,19 @@ def publish_datagouv_all():
     return f"Queued {len(tasks)} tasks"
 
 
+@notify_if_error
+@shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 1})
+def publish_datagouv_single_pass():
+    notify_tech(
+        "Starting single pass data.gouv.fr publication for all departments and national data."
+    )
+
+    # all the files are created from one scan of the buildings
+    publish_all_job()
+
+    return "done"
+
+
 # two tasks to remove light buildings
 # first, list the light buildings and save the results in a folder
 @shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 0})
@@ -381,6 +482,13 @@ def create_sandbox_user(user_data: dict) -> None:
     return None
 
 
+@shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
+def award_trophies(user_id: int) -> list:
+    # queued by the contribution endpoints after a validation
+    user = User.objects.get(id=user_id)
+    return Trophy.check_and_award_all(user)
+
+
 @shared_task(autoretry_for=(Exception,), retry_kwargs={"max_retries": 3})
 def fill_empty_event_id(batch_size) -> int:
     from batid.services.data_fix.fill_empty_event_id import fill_empty_event_id
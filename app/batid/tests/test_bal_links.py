@@ -4,11 +4,18 @@ from unittest.mock import patch
 
 import batid.tests.helpers as helpers
 from batid.exceptions import BANUnknownCleInterop
-from batid.models import Address, Building, BuildingImport, Plot
+from batid.models import (
+    Address,
+    Building,
+    BuildingImport,
+    BuildingWithHistory,
+    Plot,
+)
 from batid.services.imports.import_bal import (
     create_dpt_bal_rnb_links,
-    filter_by_position,
+    find_bdg_address_links,
     find_bdg_to_link,
+    link_addresses_to_bdgs,
 )
 from batid.services.rnb_id import generate_rnb_id
 from batid.tests.factories.users import UserFactory
@@ -207,12 +214,47 @@ class BALImport(TransactionTestCase):
         bdg_four = Building.objects.get(rnb_id="FOUR")
         self.assertFalse(bdg_four.addresses_id)
 
+    def test_addresses_linked_in_one_event(self):
+
+        Address.objects.create(
+            id="OTHER_ON_ONE", source="Import BAN", point=Point(0, 0)
+        )
+
+        links = list(
+            find_bdg_address_links(
+                [
+                    (Point(-0.52025, 44.83158, srid=4326), "GO_ON_ONE", "bâtiment"),
+                    # the same address can be found several times in the BAL
+                    (Point(-0.52026, 44.83158, srid=4326), "GO_ON_ONE", "bâtiment"),
+                    (Point(-0.52027, 44.83158, srid=4326), "OTHER_ON_ONE", None),
+                    # the link already exists
+                    (Point(-0.52028, 44.83158, srid=4326), "OLD_ON_ONE", None),
+                    # the entrée is on ONE, but the bâtiment position is preferred
+                    (Point(-0.52025, 44.83158, srid=4326), "ELSEWHERE", "entrée"),
+                    (Point(0, 0, srid=4326), "ELSEWHERE", "bâtiment"),
+                ]
+            )
+        )
+        self.assertListEqual(links, [("GO_ON_ONE", "ONE"), ("OTHER_ON_ONE", "ONE")])
+
+        linked_count = link_addresses_to_bdgs(links, bdg_import_id=1)
+
+        self.assertEqual(linked_count, 2)
+        bdg = Building.objects.get(rnb_id="ONE")
+        self.assertListEqual(
+            bdg.addresses_id, ["OLD_ON_ONE", "GO_ON_ONE", "OTHER_ON_ONE"]
+        )
+        self.assertEqual(bdg.event_type, "update")
+        self.assertDictEqual(bdg.event_origin, {"source": "import", "id": 1})
+        # one history row for the former version
+        self.assertEqual(BuildingWithHistory.objects.filter(rnb_id="ONE").count(), 2)
+
 
 class BALImportWithUnknownCleInterop(TestCase):
     def setUp(self):
         UserFactory(username="RNB")
 
-    @patch("batid.models.Address.add_new_address_from_ban_api")
+    @patch("batid.models.Address.address_from_ban_api")
     @patch("batid.services.imports.import_bal.Source.find")
     def test_bal_import(self, source_mock, new_address_mock):
 
@@ -1289,32 +1331,3 @@ class LinkSearch(TestCase):
         # ###
         # 2. We search for the building to link to the address point
         return find_bdg_to_link(address_point, "ANY_ADDRESS_ID")
-
-
-class FilterByPositionTest(TestCase):
-    def test_filter_by_position(self):
-        """
-        When a cle_interop has at least one row with position="bâtiment", only
-        those rows are kept. For cle_interop values without any "bâtiment" row,
-        all rows are kept.
-        """
-        rows = [
-            # cle_interop A has one "bâtiment" row and two others → keep only the "bâtiment" one
-            {"cle_interop": "A", "position": "entrée"},
-            {"cle_interop": "A", "position": "bâtiment"},
-            {"cle_interop": "A", "position": "délivrance postale"},
-            # cle_interop B has no "bâtiment" row → keep all rows
-            {"cle_interop": "B", "position": "entrée"},
-            {"cle_interop": "B", "position": "délivrance postale"},
-        ]
-
-        result = filter_by_position(rows)
-
-        self.assertEqual(len(result), 3)
-
-        a_rows = [r for r in result if r["cle_interop"] == "A"]
-        self.assertEqual(len(a_rows), 1)
-        self.assertEqual(a_rows[0]["position"], "bâtiment")
-
-        b_rows = [r for r in result if r["cle_interop"] == "B"]
-        self.assertEqual(len(b_rows), 2)
@@ -3,6 +3,7 @@ from datetime import date
 from batid.models import Building
 from batid.services.imports.import_bdtopo import (
     _known_bdtopo_id,
+    _known_bdtopo_ids,
     bdtopo_recente_release_date,
 )
 from batid.tests.helpers import create_default_bdg
@@ -55,3 +56,11 @@ class KnownId(TransactionTestCase):
 
         # There is a bdg with a bdtopo ID but it is not the same ID
         self.assertFalse(_known_bdtopo_id("ID4"))
+
+    def test_many_ids(self):
+
+        # all the ids are checked in one query
+        with self.assertNumQueries(1):
+            known = _known_bdtopo_ids(["ID", "ID2", "ID3", "ID4", "ID5", "ID"])
+
+        self.assertSetEqual(known, {"ID", "ID5"})
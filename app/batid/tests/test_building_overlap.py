@@ -1,6 +1,9 @@
 from batid.exceptions import BuildingOverlapError
 from batid.models import Building
-from batid.services.building_overlap import check_building_overlap
+from batid.services.building_overlap import (
+    check_building_overlap,
+    find_overlapping_buildings_many,
+)
 from batid.tests.factories.users import ContributorUserFactory
 from django.contrib.gis.geos import GEOSGeometry
 from django.test import TestCase, override_settings
@@ -588,3 +591,41 @@ class TestBuildingOverlapIntegration(TestCase):
                 user=self.user,
                 event_origin={"source": "test"},
             )
+
+    def test_many_shapes_in_one_query(self):
+        """The overlaps of many geometries are found with one query, item by item."""
+        Building.objects.create(
+            rnb_id="EXISTING001",
+            shape=make_small_building_shape(),
+            is_active=True,
+            status="constructed",
+        )
+        Building.objects.create(
+            rnb_id="EXISTING002",
+            shape=make_small_building_shape(offset_lon=0.01),
+            is_active=True,
+            status="constructed",
+        )
+
+        items = [
+            # overlaps the first building
+            (make_small_building_shape(), None),
+            # far from both
+            (make_small_building_shape(offset_lat=0.01), None),
+            # the first building is updated with its own shape
+            (make_small_building_shape(), "EXISTING001"),
+            (None, None),
+            # overlaps the second building
+            (make_small_building_shape(offset_lon=0.01), "EXISTING001"),
+        ]
+
+        with self.assertNumQueries(1):
+            overlaps = find_overlapping_buildings_many(items)
+
+        self.assertEqual(len(overlaps), 5)
+        self.assertEqual([b["rnb_id"] for b in overlaps[0]], ["EXISTING001"])
+        self.assertAlmostEqual(overlaps[0][0]["overlap_ratio"], 1.0)
+        self.assertListEqual(overlaps[1], [])
+        self.assertListEqual(overlaps[2], [])
+        self.assertListEqual(overlaps[3], [])
+        self.assertEqual([b["rnb_id"] for b in overlaps[4]], ["EXISTING002"])
@@ -0,0 +1,92 @@
+from batid.models import Building, BuildingPlotReadOnly, Plot
+from batid.services.bdg_on_plot import refresh_building_plots
+from django.db import connection
+from django.test import TransactionTestCase
+
+
+class BuildingPlotLinkCase(TransactionTestCase):
+    def setUp(self):
+        Plot.objects.create(
+            id="380010000A0001", shape="MULTIPOLYGON(((0 0, 0 1, 1 1, 1 0, 0 0)))"
+        )
+        Plot.objects.create(
+            id="380010000A0002", shape="MULTIPOLYGON(((1 0, 1 1, 2 1, 2 0, 1 0)))"
+        )
+
+    def links(self):
+        return list(
+            BuildingPlotReadOnly.objects.order_by(
+                "plot_id", "building__rnb_id"
+            ).values_list("building__rnb_id", "plot_id", "bdg_cover_ratio")
+        )
+
+    def test_create_building(self):
+        Building.objects.create(
+            rnb_id="1", shape="POLYGON((0.5 0, 0.5 1, 1.5 1, 1.5 0, 0.5 0))"
+        )
+        Building.objects.create(rnb_id="2", shape="POINT(0.5 0.5)")
+        # like the points, the shapes without area are fully on their plots
+        Building.objects.create(rnb_id="3", shape="LINESTRING(1.2 0.2, 1.4 0.4)")
+
+        self.assertListEqual(
+            self.links(),
+            [
+                ("1", "380010000A0001", 0.5),
+                ("2", "380010000A0001", 1.0),
+                ("1", "380010000A0002", 0.5),
+                ("3", "380010000A0002", 1.0),
+            ],
+        )
+
+    def test_update_building_shape(self):
+        b = Building.objects.create(
+            rnb_id="1", shape="POLYGON((0.5 0, 0.5 1, 1.5 1, 1.5 0, 0.5 0))"
+        )
+
+        b.shape = "POLYGON((1 0, 1 1, 1.5 1, 1.5 0, 1 0))"
+        b.save()
+
+        self.assertListEqual(self.links(), [("1", "380010000A0002", 1.0)])
+
+        # the links are kept when the shape does not change
+        b.status = "demolished"
+        b.save()
+
+        self.assertListEqual(self.links(), [("1", "380010000A0002", 1.0)])
+
+    def test_plots_changes(self):
+        Building.objects.create(
+            rnb_id="1", shape="POLYGON((0.5 0, 0.5 1, 1.5 1, 1.5 0, 0.5 0))"
+        )
+
+        # a new plot
+        Plot.objects.create(
+            id="380010000A0003", shape="MULTIPOLYGON(((0 0.5, 0 2, 2 2, 2 0.5, 0 0.5)))"
+        )
+        # a new plot shape
+        Plot.objects.filter(id="380010000A0001").update(
+            shape="MULTIPOLYGON(((0 0, 0 0.5, 1 0.5, 1 0, 0 0)))"
+        )
+        # a plot deleted without the ORM, like in the plots import
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM batid_plot WHERE id = '380010000A0002'")
+
+        self.assertListEqual(
+            self.links(),
+            [("1", "380010000A0001", 0.25), ("1", "380010000A0003", 0.5)],
+        )
+
+    def test_refresh_building_plots(self):
+        Building.objects.create(
+            rnb_id="1", shape="POLYGON((0.5 0, 0.5 1, 1.5 1, 1.5 0, 0.5 0))"
+        )
+        expected_links = self.links()
+
+        BuildingPlotReadOnly.objects.all().delete()
+
+        refresh_building_plots("38")
+        self.assertListEqual(self.links(), expected_links)
+
+        # other departments are untouched
+        refresh_building_plots("75")
+        self.assertListEqual(self.links(), expected_links)
@@ -0,0 +1,61 @@
+from batid.models import City, City_subdivided
+from django.contrib.gis.geos import GEOSGeometry
+from django.test import TransactionTestCase
+
+TWO_SQUARES = "MULTIPOLYGON(((0 0, 0 1, 1 1, 1 0, 0 0)), ((2 0, 2 1, 3 1, 3 0, 2 0)))"
+ONE_SQUARE = "MULTIPOLYGON(((5 5, 5 6, 6 6, 6 5, 5 5)))"
+
+
+class CitySubdividedCase(TransactionTestCase):
+    def subdivided(self, code_insee):
+        return City_subdivided.objects.filter(code_insee=code_insee)
+
+    def assertCovers(self, code_insee, shape):
+        parts = self.subdivided(code_insee)
+        union = parts[0].shape
+        for part in parts[1:]:
+            union = union.union(part.shape)
+        self.assertTrue(union.equals(GEOSGeometry(shape, srid=4326)))
+
+    def test_create_city(self):
+        City.objects.create(code_insee="38185", name="Grenoble", shape=TWO_SQUARES)
+        City.objects.create(code_insee="99999", name="Sans géométrie", shape=None)
+
+        self.assertEqual(self.subdivided("38185").count(), 2)
+        self.assertCovers("38185", TWO_SQUARES)
+        self.assertEqual(self.subdivided("99999").count(), 0)
+
+    def test_update_city(self):
+        city = City.objects.create(
+            code_insee="38185", name="Grenoble", shape=TWO_SQUARES
+        )
+
+        city.shape = ONE_SQUARE
+        city.save()
+
+        self.assertEqual(self.subdivided("38185").count(), 1)
+        self.assertCovers("38185", ONE_SQUARE)
+
+        # the shape is not subdivided again when it does not change
+        ids = list(self.subdivided("38185").values_list("id", flat=True))
+        city.name = "Grenoble nouveau nom"
+        city.save()
+
+        self.assertListEqual(
+            list(self.subdivided("38185").values_list("id", flat=True)), ids
+        )
+
+        city.code_insee = "38186"
+        city.save()
+
+        self.assertEqual(self.subdivided("38185").count(), 0)
+        self.assertCovers("38186", ONE_SQUARE)
+
+    def test_delete_city(self):
+        city = City.objects.create(
+            code_insee="38185", name="Grenoble", shape=TWO_SQUARES
+        )
+
+        city.delete()
+
+        self.assertEqual(City_subdivided.objects.count(), 0)
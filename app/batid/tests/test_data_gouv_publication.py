@@ -15,6 +15,7 @@ from batid.models import (
 )
 from batid.services.data_gouv_publication import (
     cleanup_directory,
+    create_all_csv,
     create_archive,
     create_csv,
     create_directory,
@@ -399,6 +400,82 @@ class TestDataGouvPublication(TestCase):
         # check the directory has been removed
         self.assertFalse(os.path.exists(directory_name))
 
+    def test_single_pass_csv(self):
+        """
+        Entrée : des bâtiments à Paris, à Montreuil et hors de tout département ;
+        on génère en une seule passe les exports des aires "75", "93" et "nat".
+
+        Attendu : chaque fichier est identique (à l'ordre des lignes près) à
+        l'export de l'aire correspondante.
+        """
+
+        Department_subdivided.objects.create(
+            code="75", name="Paris", shape=get_department_75_geom()
+        )
+        Department_subdivided.objects.create(
+            code="93", name="Est", shape=get_department_93_geom()
+        )
+
+        geom_paris = get_geom_paris()
+        geom_montreuil = get_geom_montreuil()
+        address = Address.objects.create(
+            id="75105_8884_00004",
+            source="BAN",
+            point=geom_paris.point_on_surface,
+            street_number="4",
+            street="rue scipion",
+            city_name="Paris",
+            city_zipcode="75005",
+        )
+
+        for idx in range(5):
+            Building.objects.create(
+                rnb_id=f"BDG-PARIS-{idx}",
+                shape=geom_paris,
+                point=geom_paris.point_on_surface,
+                status="constructed",
+                ext_ids={"some_source": str(idx)},
+                addresses_id=[address.id],
+                validated_by=[self.user_1.id],
+            )
+        Building.objects.create(
+            rnb_id="BDG-MONTREUIL",
+            shape=geom_montreuil,
+            point=geom_montreuil.point_on_surface,
+            status="constructed",
+        )
+        Building.objects.create(
+            rnb_id="BDG-NOWHERE",
+            shape=GEOSGeometry("POINT(0 0)", srid=4326),
+            point=GEOSGeometry("POINT(0 0)", srid=4326),
+            status="constructed",
+        )
+
+        areas = ["75", "93", "nat"]
+
+        single_pass_dir = create_directory("all")
+        create_all_csv(single_pass_dir, areas, partitions=1)
+
+        for area in areas:
+            area_dir = create_directory(area)
+            create_csv(area_dir, area)
+
+            with open(f"{area_dir}/RNB_{area}.csv") as f:
+                expected_lines = f.read().splitlines()
+            with open(f"{single_pass_dir}/RNB_{area}.csv") as f:
+                lines = f.read().splitlines()
+
+            # same header
+            self.assertEqual(lines[0], expected_lines[0])
+            self.assertListEqual(sorted(lines[1:]), sorted(expected_lines[1:]))
+
+            cleanup_directory(area_dir)
+
+        with open(f"{single_pass_dir}/RNB_nat.csv") as f:
+            self.assertEqual(len(f.read().splitlines()), 8)
+
+        cleanup_directory(single_pass_dir)
+
     @mock_aws
     # we mock the environnement variables to use the moto library
     # with the default AWS s3 values (could not make it work with custom values)
@@ -12,11 +12,13 @@ from batid.utils.geo import (
     compute_shape_area,
     convert_geometry_collection,
     drop_z,
+    dwithin_bbox_deltas,
     fix_nested_shells,
     merge_contiguous_shapes,
 )
 from django.contrib.gis.geos import GeometryCollection, GEOSGeometry
 from django.test import TestCase, override_settings
+from pyproj import Geod
 
 
 class TestGeo(TestCase):
@@ -263,6 +265,37 @@ class TestShapeVerification(TestCase):
         self.assertEqual(rounded_area, 3.7724)
 
 
+class TestDWithinBboxDeltas(TestCase):
+    def test_deltas_contain_radius(self):
+        geod = Geod(ellps="WGS84")
+
+        for lat in [-21.1, 0.0, 16.2, 43.3, 48.8, 51.0]:
+            point = GEOSGeometry(f"POINT(2.0 {lat})", srid=4326)
+            dx, dy = dwithin_bbox_deltas(point, 3)
+
+            # 3 meters to the east and to the north
+            east_lng, _, _ = geod.fwd(2.0, lat, 90, 3)
+            _, north_lat, _ = geod.fwd(2.0, lat, 0, 3)
+
+            self.assertGreater(dx, east_lng - 2.0)
+            self.assertGreater(dy, north_lat - lat)
+
+            # the prefilter stays tight
+            self.assertLess(dx, (east_lng - 2.0) * 1.2)
+            self.assertLess(dy, (north_lat - lat) * 1.2)
+
+    def test_polygon_uses_max_latitude(self):
+        low = GEOSGeometry("POINT(2.0 40.0)", srid=4326)
+        poly = GEOSGeometry(
+            "POLYGON((2.0 40.0, 2.1 40.0, 2.1 50.0, 2.0 50.0, 2.0 40.0))", srid=4326
+        )
+
+        low_dx, _ = dwithin_bbox_deltas(low, 3)
+        poly_dx, _ = dwithin_bbox_deltas(poly, 3)
+
+        self.assertGreater(poly_dx, low_dx)
+
+
 class TestDropZ(TestCase):
     def test_polygon_2d(self):
         wkt = "POLYGON ((0 0, 0 1, 1 1, 1 0, 0 0))"
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from unittest.mock import patch
 
@@ -8,6 +9,7 @@ from batid.services.imports.import_bdtopo import (
     bdtopo_src_params,
     create_bdtopo_full_import_tasks,
     create_candidate_from_bdtopo,
+    features_to_wkt,
 )
 from batid.tests import helpers
 from batid.tests.factories.users import UserFactory
@@ -93,6 +95,53 @@ class ImportBDTopoGeopackage(TransactionTestCase):
         # Expect 4 buildings: one from setUp and 3 from the import (candidate BATIMENT0000000312141318 should be rejected since it is too small)
         self.assertEqual(Building.objects.count(), 4)
 
+    @patch("batid.services.imports.import_bdtopo.Source.find")
+    @patch("batid.services.imports.import_bdtopo.Source.remove_uncompressed_folder")
+    def test_convert_without_workers(self, sourceRemoveFolderMock, sourceFindMock):
+
+        sourceFindMock.return_value = helpers.fixture_path("bdtopo_for_test.gpkg")
+        sourceRemoveFolderMock.return_value = None
+
+        src_params = bdtopo_src_params("02", "2025-09-15")
+
+        create_candidate_from_bdtopo(src_params, workers=1)
+
+        self.assertEqual(Candidate.objects.count(), 3)
+
+
+class TestFeaturesToWkt(TestCase):
+    def test_features_to_wkt(self):
+
+        geometries = [
+            {
+                "type": "MultiPolygon",
+                "coordinates": [
+                    [
+                        [
+                            (765634.2, 6971001.1, 181.6),
+                            (765620.3, 6970997.2, 181.6),
+                            (765620.6, 6970988.5, 181.6),
+                            (765634.2, 6971001.1, 181.6),
+                        ]
+                    ]
+                ],
+            },
+            # cannot be converted
+            {"type": "Unknown", "coordinates": []},
+        ]
+
+        wkts = features_to_wkt(geometries, 2154)
+
+        self.assertIsNone(wkts[1])
+
+        # same result as a GEOS transformation
+        expected = GEOSGeometry(json.dumps(geometries[0]), srid=2154)
+        expected.transform(4326)
+
+        shape = GEOSGeometry(wkts[0], srid=4326)
+        self.assertEqual(shape.dims, 2)
+        self.assertTrue(shape.equals_exact(expected, tolerance=1e-7))
+
 
 class TestImportTasks(TestCase):
     def test_tasks_count(self):
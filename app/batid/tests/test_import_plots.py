@@ -3,7 +3,7 @@ from unittest.mock import patch
 import batid.services.imports.import_plots as import_plots
 import batid.tests.helpers as helpers
 from batid.models import Plot
-from django.contrib.gis.geos import Point
+from django.contrib.gis.geos import MultiPolygon, Point, Polygon
 from django.contrib.gis.measure import D
 from django.test import TestCase
 
@@ -24,7 +24,9 @@ class ImportPlotsTestCase(TestCase):
         source_instance.path = fixture_path
 
         # launch the import
-        import_plots.import_etalab_plots("75", "2024-12-13", 1)
+        counts = import_plots.import_etalab_plots("75", "2024-12-13", 1)
+
+        self.assertDictEqual(counts, {"created": 3, "updated": 0, "deleted": 0})
 
         self.assertEqual(Plot.objects.count(), 3)
 
@@ -61,3 +63,84 @@ class ImportPlotsTestCase(TestCase):
         plot_3 = Plot.objects.get(id="010080000A0382")
         self.assertEqual(plot_3.shape.geom_type, "MultiPolygon")
         self.assertEqual(plot_3.source_version, "2024-12-13")
+
+    @patch("batid.services.imports.import_plots.Source")
+    def test_incremental_import(self, sourceMock):
+
+        bu_fixture_path = helpers.fixture_path("cadastre_extract_data.json")
+        fixture_path = helpers.fixture_path("cadastre_extract_copy.json")
+        sourceMock.return_value.path = fixture_path
+
+        def copy_fixture():
+            with open(bu_fixture_path, "r") as f, open(fixture_path, "w") as f_copy:
+                f_copy.write(f.read())
+
+        copy_fixture()
+        import_plots.import_etalab_plots("38", "2024-12-13")
+
+        unchanged = Plot.objects.get(id="010080000A0382")
+
+        # a plot modified since the first import
+        Plot.objects.filter(id="380010000A0507").update(
+            shape=MultiPolygon(
+                Polygon(((0, 0), (0, 1), (1, 1), (0, 0)), srid=4326), srid=4326
+            )
+        )
+        # a plot of the department which has disappeared
+        Plot.objects.create(
+            id="380010000A9999",
+            shape=MultiPolygon(
+                Polygon(((0, 0), (0, 1), (1, 1), (0, 0)), srid=4326), srid=4326
+            ),
+        )
+
+        copy_fixture()
+        counts = import_plots.import_etalab_plots("38", "2025-01-01")
+
+        self.assertDictEqual(counts, {"created": 0, "updated": 1, "deleted": 1})
+        self.assertFalse(Plot.objects.filter(id="380010000A9999").exists())
+
+        modified = Plot.objects.get(id="380010000A0507")
+        self.assertEqual(modified.source_version, "2025-01-01")
+        self.assertEqual(
+            Plot.objects.filter(
+                shape__distance_lt=(
+                    Point(5.606245994567871, 45.54235183402324, srid=4326),
+                    D(m=20),
+                )
+            ).count(),
+            1,
+        )
+
+        # the unchanged plots are not written
+        plot = Plot.objects.get(id="010080000A0382")
+        self.assertEqual(plot.source_version, "2024-12-13")
+        self.assertEqual(plot.updated_at, unchanged.updated_at)
+
+    @patch("batid.services.imports.import_plots.invalidate_plot_tiles")
+    @patch("batid.services.imports.import_plots.Source")
+    def test_plot_tiles_invalidation(self, sourceMock, invalidateMock):
+
+        bu_fixture_path = helpers.fixture_path("cadastre_extract_data.json")
+        fixture_path = helpers.fixture_path("cadastre_extract_copy.json")
+        sourceMock.return_value.path = fixture_path
+
+        def copy_fixture():
+            with open(bu_fixture_path, "r") as f, open(fixture_path, "w") as f_copy:
+                f_copy.write(f.read())
+
+        copy_fixture()
+        import_plots.import_etalab_plots("38", "2024-12-13")
+
+        # the tiles covering the imported plots are invalidated
+        invalidateMock.assert_called_once()
+        [area] = invalidateMock.call_args.args[0]
+        for plot in Plot.objects.all():
+            self.assertTrue(area.covers(plot.shape))
+
+        # nothing changed, nothing to invalidate
+        invalidateMock.reset_mock()
+        copy_fixture()
+        import_plots.import_etalab_plots("38", "2025-01-01")
+
+        invalidateMock.assert_not_called()
@@ -1,4 +1,5 @@
 import json
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from unittest import mock
 
@@ -9,12 +10,23 @@ from batid.models import (
     BuildingImport,
     BuildingWithHistory,
     Candidate,
+    SummerChallenge,
 )
 from batid.services.candidate import (
+    PARTITION_GEOHASH_PRECISION,
+    PARTITION_MAX_IDLE_PASSES,
+    PARTITION_NEIGHBOURS_SQL,
+    BatchInspector,
     Inspector,
     _report_count_decisions,
     _report_count_refusals,
     _report_list_fake_updates,
+    create_inspection_tasks,
+    inspect_worker_partitions,
+    list_partition_keys,
+    match_shapes,
+    match_shapes_many,
+    match_shapes_pairs,
 )
 from batid.services.rnb_id import generate_rnb_id
 from batid.tests.factories.users import UserFactory
@@ -1461,6 +1473,307 @@ class TestCandidateCLoseToAmbiguousPointsBdgs(InspectTest):
             self.assertEqual(history_rows, 1)
 
 
+class TestBatchInspector(InspectTest):
+    """
+    The batch inspector must take the same decisions as the one-by-one inspector.
+    We mix several cases in one batch:
+    - a candidate close to a point building (update)
+    - a candidate partially covering a polygon building (ambiguous_overlap)
+    - two identical candidates on an empty area: the first creates a building,
+    the second one depends on this creation and must update it.
+    """
+
+    new_square = {
+        "coordinates": [
+            [
+                [5.721148095508113, 45.18447830212273],
+                [5.721199626357475, 45.18443878926573],
+                [5.721232796912972, 45.18446583051127],
+                [5.72117683962378, 45.18450291605984],
+                [5.721148095508113, 45.18447830212273],
+            ]
+        ],
+        "type": "Polygon",
+    }
+
+    bdgs_data = TestCandidateCLoseToPointBdg.bdgs_data + TestHalvishCover.bdgs_data
+
+    candidates_data = (
+        TestCandidateCLoseToPointBdg.candidates_data
+        + TestHalvishCover.candidates_data
+        + [
+            {"id": "NEW_1", "source": "bdtopo", "geometry": new_square},
+            {"id": "NEW_2", "source": "bdnb", "geometry": new_square},
+        ]
+    )
+
+    def test_result(self):
+
+        since = datetime.now()
+
+        i = BatchInspector(batch_size=10)
+        i.inspect()
+
+        self.assertEqual(Candidate.objects.filter(inspected_at__isnull=True).count(), 0)
+
+        decisions = {c.source_id: c.inspection_details for c in Candidate.objects.all()}
+
+        self.assertEqual(decisions["CDT_POLY"]["decision"], "update")
+        bdg = Building.objects.get(rnb_id=decisions["CDT_POLY"]["rnb_id"])
+        self.assertEqual(bdg.shape.geom_type, "Polygon")
+        self.assertEqual(bdg.ext_ids[1]["id"], "CDT_POLY")
+
+        self.assertEqual(decisions["SECOND_SQUARE"]["reason"], "ambiguous_overlap")
+
+        # One of the twin candidates created the building, the other one updated it
+        twins = sorted([decisions["NEW_1"]["decision"], decisions["NEW_2"]["decision"]])
+        self.assertListEqual(twins, ["creation", "update"])
+        self.assertEqual(decisions["NEW_1"]["rnb_id"], decisions["NEW_2"]["rnb_id"])
+
+        new_bdg = Building.objects.get(rnb_id=decisions["NEW_1"]["rnb_id"])
+        self.assertEqual(len(new_bdg.ext_ids), 2)
+        self.assertEqual(new_bdg.event_type, "update")
+        self.assertEqual(
+            BuildingWithHistory.objects.filter(rnb_id=new_bdg.rnb_id).count(), 2
+        )
+
+        # 4 existing buildings + 1 created
+        self.assertEqual(Building.objects.all().count(), 5)
+
+        decision_counts = _report_count_decisions(since)
+        self.assertDictEqual(
+            decision_counts, {"creation": 1, "update": 2, "refusal": 1}
+        )
+
+    def test_same_decisions_one_by_one(self):
+
+        since = datetime.now()
+
+        i = Inspector()
+        i.inspect()
+
+        self.assertEqual(Candidate.objects.filter(inspected_at__isnull=True).count(), 0)
+
+        decisions = {c.source_id: c.inspection_details for c in Candidate.objects.all()}
+        self.assertEqual(decisions["CDT_POLY"]["decision"], "update")
+        self.assertEqual(decisions["SECOND_SQUARE"]["reason"], "ambiguous_overlap")
+        twins = sorted([decisions["NEW_1"]["decision"], decisions["NEW_2"]["decision"]])
+        self.assertListEqual(twins, ["creation", "update"])
+
+        self.assertEqual(Building.objects.all().count(), 5)
+        self.assertDictEqual(
+            _report_count_decisions(since), {"creation": 1, "update": 2, "refusal": 1}
+        )
+
+    def test_batch_size_one(self):
+
+        i = BatchInspector(batch_size=1)
+        i.inspect()
+
+        self.assertEqual(Candidate.objects.filter(inspected_at__isnull=True).count(), 0)
+        self.assertEqual(Building.objects.all().count(), 5)
+
+    def test_rolled_back_batch_is_inspected_one_by_one(self):
+        class FailingBatchInspector(BatchInspector):
+            def get_candidates(self):
+                self.claimed = super().get_candidates()
+                return self.claimed
+
+            def flush(self):
+                raise Exception("TopologyException: side location conflict")
+
+        i = FailingBatchInspector(batch_size=2)
+        self.assertEqual(i.inspect_batch(), 2)
+
+        # the candidates of the batch, not any others
+        inspected = Candidate.objects.filter(inspected_at__isnull=False)
+        self.assertSetEqual(
+            set(inspected.values_list("id", flat=True)), {c.id for c in i.claimed}
+        )
+
+
+class TestPartitionedInspection(InspectTest):
+    """
+    Candidates far from each other are in different partitions.
+    An inspector bound to a partition only inspects the candidates of its partition.
+    """
+
+    bdgs_data = TestCandidateCLoseToPointBdg.bdgs_data + TestHalvishCover.bdgs_data
+    candidates_data = (
+        TestCandidateCLoseToPointBdg.candidates_data + TestHalvishCover.candidates_data
+    )
+
+    def test_result(self):
+
+        pyrenees = Candidate.objects.get(source_id="CDT_POLY")
+        bordeaux = Candidate.objects.get(source_id="SECOND_SQUARE")
+
+        # the keys are set at insert: Bordeaux and the Pyrenees candidates are in different cells
+        self.assertEqual(len(pyrenees.partition_key), PARTITION_GEOHASH_PRECISION)
+        self.assertEqual(len(bordeaux.partition_key), PARTITION_GEOHASH_PRECISION)
+        self.assertNotEqual(pyrenees.partition_key, bordeaux.partition_key)
+        self.assertListEqual(
+            list_partition_keys(),
+            sorted([pyrenees.partition_key, bordeaux.partition_key]),
+        )
+
+        # one task per worker, whatever the number of cells
+        tasks = create_inspection_tasks(batch_size=100, workers=4)
+        self.assertEqual(len(tasks), 4)
+        self.assertListEqual([t.kwargs["worker"] for t in tasks], [0, 1, 2, 3])
+
+        i = Inspector(pyrenees.partition_key)
+        i.inspect()
+
+        pyrenees.refresh_from_db()
+        bordeaux.refresh_from_db()
+        self.assertEqual(pyrenees.inspection_details["decision"], "update")
+        self.assertIsNone(bordeaux.inspected_at)
+
+        i = BatchInspector(batch_size=10, partition=bordeaux.partition_key)
+        i.inspect()
+
+        bordeaux.refresh_from_db()
+        self.assertEqual(bordeaux.inspection_details["reason"], "ambiguous_overlap")
+
+    def test_workers_drain_all_partitions(self):
+
+        workers = 3
+        inspected = 0
+        for worker in range(workers):
+            inspected += inspect_worker_partitions(worker, workers, batch_size=10)
+
+        self.assertEqual(inspected, len(self.candidates_data))
+        self.assertFalse(Candidate.objects.filter(inspected_at__isnull=True).exists())
+
+    def test_partition_neighbours(self):
+        # a cell in the corner of its parent cells
+        with connection.cursor() as cursor:
+            cursor.execute(PARTITION_NEIGHBOURS_SQL, {"partition": "ezzzz"})
+            neighbours = {row[0] for row in cursor.fetchall()}
+
+        self.assertEqual(len(neighbours), 8)
+        # across the borders of the parent cells
+        self.assertIn("spbpb", neighbours)
+        self.assertIn("gbpbp", neighbours)
+        self.assertNotIn("ezzzz", neighbours)
+
+        # no neighbours for the candidates without shape
+        with connection.cursor() as cursor:
+            cursor.execute(PARTITION_NEIGHBOURS_SQL, {"partition": ""})
+            self.assertEqual(cursor.fetchall(), [])
+
+    @mock.patch("batid.services.candidate.time.sleep")
+    def test_worker_gives_up_on_locked_neighbours(self, sleep_mock):
+        @contextmanager
+        def locked_by_a_neighbour(partition):
+            yield False
+
+        with mock.patch(
+            "batid.services.candidate.partition_lock", locked_by_a_neighbour
+        ):
+            self.assertEqual(inspect_worker_partitions(0, 1, batch_size=10), 0)
+
+        self.assertEqual(sleep_mock.call_count, PARTITION_MAX_IDLE_PASSES)
+        self.assertEqual(Candidate.objects.filter(inspected_at__isnull=True).count(), 2)
+
+    def test_worker_stops_without_progress(self):
+        # the candidates are claimed by another inspection (SKIP LOCKED)
+        with mock.patch.object(Inspector, "inspect", return_value=0) as inspect:
+            self.assertEqual(inspect_worker_partitions(0, 1), 0)
+
+        self.assertEqual(inspect.call_count, 2)
+
+    def test_late_candidate_has_a_partition(self):
+
+        pyrenees = Candidate.objects.get(source_id="CDT_POLY")
+        pyrenees.pk = None
+        pyrenees.source_id = "LATE"
+        pyrenees.partition_key = None
+        pyrenees.save()
+
+        late = Candidate.objects.get(source_id="LATE")
+        self.assertEqual(late.partition_key, pyrenees.partition_key)
+        self.assertEqual(len(late.partition_key), PARTITION_GEOHASH_PRECISION)
+
+
+class TestMatchingBboxPrefilter(InspectTest):
+    """
+    The bbox prefilter must not change the buildings matched with a candidate
+    """
+
+    bdgs_data = TestCandidateCLoseToPointBdg.bdgs_data
+    candidates_data = TestCandidateCLoseToPointBdg.candidates_data
+
+    def test_same_matches(self):
+
+        candidate = Candidate.objects.all().first()
+
+        i = Inspector()
+        i.candidate = candidate
+
+        i.BBOX_PREFILTER = False
+        i.get_matching_bdgs()
+        geography_ids = {b.id for b in i.matching_bdgs}
+
+        i.BBOX_PREFILTER = True
+        i.get_matching_bdgs()
+        prefilter_ids = {b.id for b in i.matching_bdgs}
+
+        # POINT_BDG and POLY_BDG_NEIGHBOR
+        self.assertEqual(len(geography_ids), 2)
+        self.assertSetEqual(geography_ids, prefilter_ids)
+
+
+class TestVectorizedMatching(TestCase):
+    def test_same_labels_as_match_shapes(self):
+
+        square = GEOSGeometry("POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))", srid=4326)
+
+        a_shapes = [square, square, square, square]
+        b_shapes = [
+            # same square
+            GEOSGeometry("POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))", srid=4326),
+            # half covering
+            GEOSGeometry("POLYGON((0.5 0, 1.5 0, 1.5 1, 0.5 1, 0.5 0))", srid=4326),
+            # barely touching
+            GEOSGeometry(
+                "MULTIPOLYGON(((0.95 0, 2 0, 2 1, 0.95 1, 0.95 0)))", srid=4326
+            ),
+            # point inside
+            GEOSGeometry("POINT(0.5 0.5)", srid=4326),
+        ]
+        # points
+        a_shapes += [Point(1, 1, srid=4326), Point(1, 1, srid=4326)]
+        b_shapes += [Point(1.00000001, 1, srid=4326), Point(1.1, 1, srid=4326)]
+
+        results = match_shapes_pairs(a_shapes, b_shapes)
+
+        self.assertListEqual(
+            results,
+            ["match", "conflict", "no_match", "match", "match", "no_match"],
+        )
+        self.assertListEqual(
+            results, [match_shapes(a, b) for a, b in zip(a_shapes, b_shapes)]
+        )
+
+        self.assertListEqual(
+            match_shapes_many(square, b_shapes[:4]),
+            ["match", "conflict", "no_match", "match"],
+        )
+        self.assertListEqual(match_shapes_many(square, []), [])
+
+    def test_unsupported_pairs(self):
+        # Those pairs are left to match_shapes()
+        square = GEOSGeometry("POLYGON((0 0, 1 0, 1 1, 0 1, 0 0))", srid=4326)
+        line = GEOSGeometry("LINESTRING(0 0, 1 1)", srid=4326)
+        flat = GEOSGeometry("POLYGON((0 0, 1 0, 1 0, 0 0))", srid=4326)
+
+        self.assertListEqual(
+            match_shapes_pairs([square, square], [line, flat]), [None, None]
+        )
+
+
 def data_to_candidate(data):
     b_import = BuildingImport.objects.create(
         departement="33",
@@ -1598,6 +1911,69 @@ class NonExistingAddress(TransactionTestCase):
         self.assertFalse(candidate.inspected_at)
 
 
+class BatchAddressesLookup(TransactionTestCase):
+    def setUp(self):
+        coords = [
+            [2.349804906833981, 48.85789205519228],
+            [2.349701279442314, 48.85786369735885],
+            [2.3496535925009994, 48.85777922711969],
+            [2.349861764341199, 48.85773095834841],
+            [2.3499452164882086, 48.857847406681174],
+            [2.349804906833981, 48.85789205519228],
+        ]
+        self.candidate = Candidate.objects.create(
+            shape=coords_to_mp_geom(coords),
+            source="bdnb",
+            source_version="7.2",
+            source_id="bdnb_1",
+            address_keys=["add_1"],
+            is_light=False,
+            created_by={"id": 1, "source": "import"},
+        )
+
+        UserFactory(username="RNB")
+
+    @mock.patch("batid.models.Address.fetch_from_ban_api")
+    def test_addresses_fetched_before_the_transaction(self, fetch_mock):
+        in_transaction = []
+
+        def fetch(addresses_id):
+            in_transaction.append(connection.in_atomic_block)
+            return [
+                Address(
+                    id=address_id,
+                    source="ban",
+                    point=coords_to_point_geom(lng=2.34988, lat=48.85791),
+                    city_insee_code="75104",
+                )
+                for address_id in addresses_id
+            ]
+
+        fetch_mock.side_effect = fetch
+
+        i = BatchInspector(batch_size=10)
+        self.assertEqual(i.inspect(), 1)
+
+        self.assertListEqual(in_transaction, [False])
+
+        bdg = Building.objects.get()
+        self.assertListEqual(bdg.addresses_id, ["add_1"])
+        # automated creations do not count in the Summer Challenge
+        self.assertFalse(SummerChallenge.objects.exists())
+
+    @mock.patch("batid.models.requests.get")
+    def test_non_existing_address_raises(self, get_mock):
+        get_mock.return_value.status_code = 404
+
+        i = BatchInspector(batch_size=10)
+        with self.assertRaises(BANUnknownCleInterop):
+            i.inspect()
+
+        self.candidate.refresh_from_db()
+        self.assertFalse(self.candidate.inspected_at)
+        self.assertEqual(Building.objects.all().count(), 0)
+
+
 class GeosIntersectsBugInterception(TransactionTestCase):
 
     WKT_1 = "POLYGON ((1.839012980156925 43.169860517728324, 1.838983490127865 43.169860200336274, 1.838898525601717 43.169868281549725, 1.838918565176068 43.1699719478626, 1.838920733577112 43.16998636433192, 1.838978629555589 43.16997979090823, 1.838982586839382 43.169966339940714, 1.838974943184281 43.169918580432174, 1.839020497362873 43.169914572864634, 1.839012980156925 43.169860517728324))"
@@ -1,13 +1,16 @@
 import json
 import uuid
+from unittest import mock
 
 from batid.exceptions import (
     BANBadResultType,
+    BANUnknownCleInterop,
     BuildingCannotMove,
+    BuildingOverlapError,
     NotEnoughBuildings,
     OperationOnInactiveBuilding,
 )
-from batid.models import Address, Building
+from batid.models import Address, Building, BuildingHistoryOnly, SummerChallenge
 from batid.tests.factories.users import ContributorUserFactory
 from batid.tests.helpers import coords_to_mp_geom
 from batid.utils.misc import ext_ids_equal
@@ -505,6 +508,199 @@ class TestUpdateBuilding(TestCase):
             )
 
 
+class TestBulkUpdateEvents(TestCase):
+    def setUp(self):
+        Address.objects.create(id="addr1")
+        self.user = ContributorUserFactory(username="bulk_user")
+
+        self.b1 = Building.objects.create(
+            rnb_id="BDG1",
+            shape=GEOSGeometry(
+                "POLYGON((0 0, 0 0.0001, 0.0001 0.0001, 0.0001 0, 0 0))"
+            ),
+            point=GEOSGeometry("POINT(0.00005 0.00005)"),
+            status="constructed",
+            validated_by=[self.user.id],
+            is_active=True,
+        )
+        self.b2 = Building.objects.create(
+            rnb_id="BDG2",
+            shape=GEOSGeometry("POINT(1 1)"),
+            point=GEOSGeometry("POINT(1 1)"),
+            status="constructed",
+            is_active=True,
+        )
+
+    def test_update_and_deactivate(self):
+        updated = Building.bulk_update_events(
+            [
+                (
+                    self.b1,
+                    {
+                        "event_origin": {"source": "bulk"},
+                        "status": "demolished",
+                        "addresses_id": ["addr1"],
+                    },
+                ),
+                (
+                    self.b2,
+                    {"event_origin": {"source": "bulk"}, "is_active": False},
+                ),
+            ],
+            self.user,
+            score=False,
+        )
+
+        self.assertEqual(len(updated), 2)
+
+        b1 = Building.objects.get(rnb_id="BDG1")
+        self.assertEqual(b1.event_type, "update")
+        self.assertEqual(b1.status, "demolished")
+        self.assertEqual(b1.addresses_id, ["addr1"])
+        self.assertEqual(b1.validated_by, [])
+        self.assertEqual(b1.event_origin, {"source": "bulk"})
+
+        b2 = Building.objects.get(rnb_id="BDG2")
+        self.assertEqual(b2.event_type, "deactivation")
+        self.assertFalse(b2.is_active)
+
+        # each building gets its own event
+        self.assertNotEqual(b1.event_id, b2.event_id)
+        # the previous versions are in the history
+        self.assertEqual(
+            BuildingHistoryOnly.objects.filter(rnb_id__in=["BDG1", "BDG2"]).count(),
+            4,
+        )
+        self.assertEqual(SummerChallenge.objects.count(), 0)
+
+    def test_identical_changes_are_skipped(self):
+        updated = Building.bulk_update_events(
+            [(self.b1, {"event_origin": {"source": "bulk"}, "status": "constructed"})],
+            self.user,
+        )
+
+        self.assertEqual(updated, [])
+        b1 = Building.objects.get(rnb_id="BDG1")
+        self.assertIsNone(b1.event_type)
+        self.assertEqual(b1.validated_by, [self.user.id])
+
+    def test_deactivate_inactive_raises(self):
+        Building.objects.filter(rnb_id="BDG2").update(is_active=False)
+        b2 = Building.objects.get(rnb_id="BDG2")
+
+        with self.assertRaises(OperationOnInactiveBuilding):
+            Building.bulk_update_events(
+                [(b2, {"event_origin": {"source": "bulk"}, "is_active": False})],
+                self.user,
+            )
+
+    def test_overlap_raises_before_any_write(self):
+        # BDG2 is moved on BDG1 (close enough since it is a point)
+        Building.objects.filter(rnb_id="BDG2").update(
+            shape=GEOSGeometry("POINT(0.0002 0.0002)"),
+            point=GEOSGeometry("POINT(0.0002 0.0002)"),
+        )
+        b2 = Building.objects.get(rnb_id="BDG2")
+
+        with self.assertRaises(BuildingOverlapError):
+            Building.bulk_update_events(
+                [
+                    (
+                        self.b1,
+                        {"event_origin": {"source": "bulk"}, "addresses_id": ["addr1"]},
+                    ),
+                    (
+                        b2,
+                        {
+                            "event_origin": {"source": "bulk"},
+                            "shape": GEOSGeometry(
+                                "POLYGON((0 0, 0 0.0001, 0.0001 0.0001, 0.0001 0, 0 0))",
+                                srid=4326,
+                            ),
+                        },
+                    ),
+                ],
+                self.user,
+            )
+
+        self.assertEqual(Building.objects.get(rnb_id="BDG1").addresses_id, None)
+
+    def _square(self, lon):
+        return GEOSGeometry(
+            f"POLYGON(({lon} 0, {lon} 0.0001, {lon + 0.0001} 0.0001, {lon + 0.0001} 0, {lon} 0))",
+            srid=4326,
+        )
+
+    def test_buildings_moved_onto_each_other_raise(self):
+        # each new shape only covers half of the other building as it is before the changes
+        b3 = Building.objects.create(
+            rnb_id="BDG3", shape=self._square(0.001), status="constructed"
+        )
+        b4 = Building.objects.create(
+            rnb_id="BDG4", shape=self._square(0.0011), status="constructed"
+        )
+
+        with self.assertRaises(BuildingOverlapError):
+            Building.bulk_update_events(
+                [
+                    (
+                        bdg,
+                        {
+                            "event_origin": {"source": "bulk"},
+                            "shape": self._square(0.00105),
+                        },
+                    )
+                    for bdg in (b3, b4)
+                ],
+                self.user,
+            )
+
+        self.assertEqual(Building.objects.get(rnb_id="BDG3").shape, b3.shape)
+
+    def test_building_moved_where_another_one_is_deactivated(self):
+        b3 = Building.objects.create(
+            rnb_id="BDG3", shape=self._square(0.0001), status="constructed"
+        )
+
+        updated = Building.bulk_update_events(
+            [
+                (self.b1, {"event_origin": {"source": "bulk"}, "is_active": False}),
+                (
+                    b3,
+                    {"event_origin": {"source": "bulk"}, "shape": self._square(0)},
+                ),
+            ],
+            self.user,
+            score=False,
+        )
+
+        self.assertEqual(len(updated), 2)
+        self.assertTrue(
+            Building.objects.get(rnb_id="BDG3").shape.equals(self._square(0))
+        )
+
+    def test_addresses_are_fetched_before_the_transaction(self):
+        with mock.patch.object(
+            Address, "fetch_from_ban_api", return_value=[Address(id="addr2")]
+        ) as fetch, mock.patch.object(Building, "_bulk_update_events") as bulk_update:
+            # the transaction is opened by _bulk_update_events
+            bulk_update.side_effect = lambda *args: self.assertTrue(fetch.called)
+
+            Building.bulk_update_events(
+                [
+                    (
+                        self.b1,
+                        {"event_origin": {"source": "bulk"}, "addresses_id": ["addr2"]},
+                    )
+                ],
+                self.user,
+            )
+
+        fetch.assert_called_once_with(["addr2"])
+        bulk_update.assert_called_once()
+        self.assertTrue(Address.objects.filter(id="addr2").exists())
+
+
 class TestUpdateBuildingValidatedBy(TestCase):
     """Tests for the validated_by behavior in Building.update()."""
 
@@ -836,6 +1032,59 @@ class TestSaveNewAddress(TestCase):
             Address.save_new_address(data)
 
 
+class TestAddAddressesToDbIfNeeded(TestCase):
+    def ban_data(self, cle_interop):
+        return {
+            "type": "numero",
+            "cleInterop": cle_interop,
+            "lon": 5.123,
+            "lat": 46.456,
+            "numero": "1",
+            "suffixe": None,
+            "voie": {"nomVoie": "Rue de la Paix"},
+            "commune": {"nom": "Bourg-en-Bresse", "code": "01001"},
+            "codePostal": "01000",
+        }
+
+    @mock.patch("batid.models.requests.get")
+    def test_only_missing_addresses_are_fetched(self, get_mock):
+        Address.objects.create(id="01001_0001_00001", source="Import BAN")
+
+        get_mock.return_value.status_code = 200
+        get_mock.return_value.json.return_value = self.ban_data("01001_0001_00002")
+
+        with self.assertNumQueries(2):
+            Address.add_addresses_to_db_if_needed(
+                ["01001_0001_00001", "01001_0001_00002", "01001_0001_00002"]
+            )
+
+        get_mock.assert_called_once_with(
+            "https://plateforme.adresse.data.gouv.fr/lookup/01001_0001_00002"
+        )
+        self.assertEqual(Address.objects.get(id="01001_0001_00002").source, "ban")
+
+        # everything is known now: no call to the BAN
+        Address.add_addresses_to_db_if_needed(["01001_0001_00001", "01001_0001_00002"])
+        self.assertEqual(get_mock.call_count, 1)
+
+    @mock.patch("batid.models.Address.address_from_ban_api")
+    def test_nothing_is_saved_on_ban_error(self, lookup_mock):
+        def lookup(cle_interop):
+            if cle_interop == "01001_0001_00002":
+                raise BANUnknownCleInterop
+            return Address.address_from_ban_data(self.ban_data(cle_interop))
+
+        lookup_mock.side_effect = lookup
+
+        with self.assertRaises(BANUnknownCleInterop):
+            Address.add_addresses_to_db_if_needed(
+                ["01001_0001_00001", "01001_0001_00002", "01001_0001_00003"]
+            )
+
+        self.assertEqual(lookup_mock.call_count, 3)
+        self.assertEqual(Address.objects.count(), 0)
+
+
 class TestExtIdsComparison(TestCase):
     def test_ext_ids_equal(self):
         ext_ids1 = [
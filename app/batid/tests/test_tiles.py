@@ -1,7 +1,19 @@
+import shutil
+import tempfile
+import time
+
 import mapbox_vector_tile
-from batid.models import Building
+from batid.models import Building, Department, Plot
+from batid.services.vector_tiles import bdgs_tiles_sql
+from batid.services.vector_tiles.archive import render_archive
+from batid.services.vector_tiles.building import envelope_to_buildings_sql
+from batid.services.vector_tiles.cache import area_edited_since, mark_areas_edited
+from batid.services.vector_tiles.common import tile_to_envelope
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
 
 
 class TestVectorTiles(TestCase):
@@ -45,9 +57,74 @@ class TestVectorTiles(TestCase):
         self.assertEqual(response.status_code, 204)
 
     def test_tiles_endpoint_zoomout(self):
-        response = self.client.get("/api/alpha/tiles/8166/5902/12.pbf")
+        response = self.client.get("/api/alpha/tiles/127/90/7.pbf")
+        self.assertEqual(response.status_code, 204)
+
+        # the generalization only has active and real buildings
+        response = self.client.get(
+            "/api/alpha/tiles/2077/1409/12.pbf?only_active_and_real=false"
+        )
         self.assertEqual(response.status_code, 204)
 
+    def test_low_zoom_clusters(self):
+        response = self.client.get("/api/alpha/tiles/2077/1409/12.pbf")
+        self.assertEqual(response.status_code, 200)
+
+        decoded = mapbox_vector_tile.decode(response.content)
+        [cluster] = next(iter(decoded.values()))["features"]
+        self.assertEqual(cluster["properties"]["count"], 3)
+
+        # the clusters are kept up to date
+        bdg = Building.objects.get(rnb_id="BDG-EMPTY")
+        bdg.status = "demolished"
+        bdg.save()
+
+        response = self.client.get("/api/alpha/tiles/shapes/2077/1409/12.pbf")
+        decoded = mapbox_vector_tile.decode(response.content)
+        [cluster] = next(iter(decoded.values()))["features"]
+        self.assertEqual(cluster["properties"]["count"], 2)
+
+    def test_medium_zoom_generalized_buildings(self):
+        response = self.client.get("/api/alpha/tiles/8310/5639/14.pbf")
+        self.assertEqual(response.status_code, 200)
+
+        features = self._features_by_rnb_id(response.content)
+        self.assertEqual(set(features.keys()), {"BDG-MARKED", "BDG-EMPTY", "BDG-NULL"})
+        self.assertIs(features["BDG-MARKED"]["properties"]["is_validated"], True)
+        self.assertIs(features["BDG-NULL"]["properties"]["is_validated"], False)
+
+        bdg = Building.objects.get(rnb_id="BDG-NULL")
+        bdg.is_active = False
+        bdg.save()
+
+        response = self.client.get("/api/alpha/tiles/8310/5639/14.pbf")
+        features = self._features_by_rnb_id(response.content)
+        self.assertEqual(set(features.keys()), {"BDG-MARKED", "BDG-EMPTY"})
+
+    def test_generalization_only_for_active_and_real_buildings(self):
+        bdg = Building.objects.get(rnb_id="BDG-NULL")
+        bdg.is_active = False
+        bdg.save()
+
+        tile = {"zoom": 14, "x": 8310, "y": 5639}
+
+        for only_active_and_real, expected in [
+            (True, {"BDG-MARKED", "BDG-EMPTY"}),
+            (False, {"BDG-MARKED", "BDG-EMPTY", "BDG-NULL"}),
+        ]:
+            with connection.cursor() as cursor:
+                cursor.execute(bdgs_tiles_sql(tile, "point", only_active_and_real))
+                tile_bytes = bytes(cursor.fetchone()[0])
+
+            self.assertEqual(set(self._features_by_rnb_id(tile_bytes)), expected)
+
+        # below the generalization zooms, the buildings are drawn in full
+        tile = {"zoom": 7, "x": 64, "y": 44}
+        self.assertEqual(
+            bdgs_tiles_sql(tile, "point", True),
+            envelope_to_buildings_sql(tile_to_envelope(tile), "point", True),
+        )
+
     def test_plot_endpoint(self):
         response = self.client.get("/api/alpha/plots/tiles/8166/5902/16.pbf")
         self.assertEqual(response.status_code, 200)
@@ -80,3 +157,234 @@ class TestVectorTiles(TestCase):
         self.assertIs(features["BDG-MARKED"]["properties"]["is_validated"], True)
         self.assertIs(features["BDG-EMPTY"]["properties"]["is_validated"], False)
         self.assertIs(features["BDG-NULL"]["properties"]["is_validated"], False)
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "tiles": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "test-tiles",
+        },
+    },
+    TILES_CACHE_ENABLED=True,
+)
+class TestVectorTilesCache(TestCase):
+    url = "/api/alpha/tiles/33241/22557/16.pbf"
+
+    def setUp(self):
+        caches["tiles"].clear()
+
+        self.bdg = Building.objects.create(
+            rnb_id="BDG-ONE",
+            status="constructed",
+            point="POINT (2.6000591402070654 48.814763140563656)",
+            is_active=True,
+        )
+
+    def _rnb_ids(self, response):
+        decoded = mapbox_vector_tile.decode(response.content)
+        if not decoded:
+            return set()
+        layer = next(iter(decoded.values()))
+        return {f["properties"]["rnb_id"] for f in layer["features"]}
+
+    def test_revalidation(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+
+        # the same tile comes from the cache
+        cached_response = self.client.get(self.url)
+        self.assertEqual(cached_response["ETag"], response["ETag"])
+        self.assertEqual(cached_response.content, response.content)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+
+    def test_invalidation_on_building_edit(self):
+        response = self.client.get(self.url)
+        self.assertSetEqual(self._rnb_ids(response), {"BDG-ONE"})
+
+        # a new building in the tile
+        Building.objects.create(
+            rnb_id="BDG-TWO",
+            status="constructed",
+            point="POINT (2.6001591402070654 48.814863140563656)",
+            is_active=True,
+        )
+        response = self.client.get(self.url)
+        self.assertSetEqual(self._rnb_ids(response), {"BDG-ONE", "BDG-TWO"})
+
+        # the building is moved away: both the old and the new tiles change
+        bdg = Building.objects.get(rnb_id="BDG-ONE")
+        self.client.get("/api/alpha/tiles/33242/22557/16.pbf")
+        bdg.point = "POINT (2.6080591402070654 48.814763140563656)"
+        bdg.save()
+
+        response = self.client.get(self.url)
+        self.assertSetEqual(self._rnb_ids(response), {"BDG-TWO"})
+        response = self.client.get("/api/alpha/tiles/33242/22557/16.pbf")
+        self.assertSetEqual(self._rnb_ids(response), {"BDG-ONE"})
+
+        # stale ETags are not validated anymore
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_query_flags_are_cached_separately(self):
+        self.bdg.is_active = False
+        self.bdg.save()
+
+        response = self.client.get(self.url)
+        self.assertSetEqual(self._rnb_ids(response), set())
+
+        response = self.client.get(f"{self.url}?only_active_and_real=false")
+        self.assertSetEqual(self._rnb_ids(response), {"BDG-ONE"})
+
+
+class TestVectorTilesArchive(TestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+
+        Department.objects.create(
+            code="94",
+            name="Val-de-Marne",
+            shape="MULTIPOLYGON(((2.59 48.81, 2.61 48.81, 2.61 48.82, 2.59 48.82, 2.59 48.81)))",
+        )
+        # in tile 33241/22557/16
+        Plot.objects.create(
+            id="PLOT-94",
+            shape="MULTIPOLYGON(((2.6000 48.8147, 2.6002 48.8147, 2.6002 48.8149, 2.6000 48.8149, 2.6000 48.8147)))",
+        )
+        # in tile 33808/23528/16, outside of the department
+        Plot.objects.create(
+            id="PLOT-38",
+            shape="MULTIPOLYGON(((5.7180 45.1786, 5.7182 45.1786, 5.7182 45.1788, 5.7180 45.1788, 5.7180 45.1786)))",
+        )
+
+    def _plot_ids(self, response):
+        decoded = mapbox_vector_tile.decode(response.content)
+        if not decoded:
+            return set()
+        layer = next(iter(decoded.values()))
+        return {f["properties"]["id"] for f in layer["features"]}
+
+    def test_tiles_served_from_archive(self):
+        with self.settings(TILES_ARCHIVE_DIR=self.archive_dir):
+            render_archive("plots", 16, 16, dpt="94", workers=1)
+
+            # the archive is used, even if the database changed since the rendering
+            Plot.objects.filter(id="PLOT-94").delete()
+
+            r = self.client.get("/api/alpha/plots/tiles/33241/22557/16.pbf")
+            self.assertEqual(r.status_code, 200)
+            self.assertSetEqual(self._plot_ids(r), {"PLOT-94"})
+
+            # rendered but empty tile
+            r = self.client.get("/api/alpha/plots/tiles/33240/22557/16.pbf")
+            self.assertEqual(r.status_code, 200)
+            self.assertSetEqual(self._plot_ids(r), set())
+
+            # outside of the rendered department, the tile is built from the database
+            r = self.client.get("/api/alpha/plots/tiles/33808/23528/16.pbf")
+            self.assertEqual(r.status_code, 200)
+            self.assertSetEqual(self._plot_ids(r), {"PLOT-38"})
+
+            # zoom levels which have not been rendered as well
+            r = self.client.get("/api/alpha/plots/tiles/66482/45115/17.pbf")
+            self.assertEqual(r.status_code, 200)
+            self.assertSetEqual(self._plot_ids(r), set())
+
+    def test_rendering_again_removes_emptied_tiles(self):
+        with self.settings(TILES_ARCHIVE_DIR=self.archive_dir):
+            render_archive("plots", 16, 16, dpt="94", workers=1)
+
+            Plot.objects.filter(id="PLOT-94").delete()
+            render_archive("plots", 16, 16, dpt="94", workers=1)
+
+            r = self.client.get("/api/alpha/plots/tiles/33241/22557/16.pbf")
+            self.assertSetEqual(self._plot_ids(r), set())
+
+    def _rnb_ids(self, response):
+        decoded = mapbox_vector_tile.decode(response.content)
+        if not decoded:
+            return set()
+        layer = next(iter(decoded.values()))
+        return {f["properties"]["rnb_id"] for f in layer["features"]}
+
+    def test_edited_areas_are_not_served_from_archive(self):
+        url = "/api/alpha/tiles/33241/22557/16.pbf"
+
+        with self.settings(TILES_ARCHIVE_DIR=self.archive_dir):
+            render_archive("buildings", 16, 16, dpt="94", workers=1)
+            self.assertSetEqual(self._rnb_ids(self.client.get(url)), set())
+
+            # the edit is marked once committed
+            with self.captureOnCommitCallbacks(execute=True):
+                Building.objects.create(
+                    rnb_id="BDG-NEW",
+                    status="constructed",
+                    point="POINT (2.6000591402070654 48.814763140563656)",
+                    is_active=True,
+                )
+
+            self.assertSetEqual(self._rnb_ids(self.client.get(url)), {"BDG-NEW"})
+
+            # the tiles rendered after the edit are served from the archive again
+            render_archive("buildings", 16, 16, dpt="94", workers=1)
+            Building.objects.filter(rnb_id="BDG-NEW").update(is_active=False)
+
+            self.assertSetEqual(self._rnb_ids(self.client.get(url)), {"BDG-NEW"})
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "tiles": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "test-tiles-edits",
+        },
+    },
+)
+class TestTileAreaEdits(TestCase):
+    tile = {"x": 33241, "y": 22557, "zoom": 16}
+
+    def setUp(self):
+        caches["tiles"].clear()
+
+    def test_edits_are_read_from_the_cache(self):
+        since = time.time_ns()
+
+        # the database is only read once
+        with self.assertNumQueries(1):
+            self.assertFalse(area_edited_since("buildings", self.tile, since))
+            self.assertFalse(area_edited_since("buildings", self.tile, since))
+
+        mark_areas_edited(
+            ["buildings"],
+            [GEOSGeometry("POINT (2.6000591402070654 48.814763140563656)")],
+        )
+
+        with self.assertNumQueries(0):
+            self.assertTrue(area_edited_since("buildings", self.tile, since))
+            # the parent tiles as well
+            self.assertTrue(
+                area_edited_since("buildings", {"x": 0, "y": 0, "zoom": 0}, since)
+            )
+            self.assertFalse(area_edited_since("plots", self.tile, since))
+
+    def test_edits_are_read_from_the_database_on_a_miss(self):
+        since = time.time_ns()
+        mark_areas_edited(
+            ["plots"], [GEOSGeometry("POINT (2.6000591402070654 48.814763140563656)")]
+        )
+        caches["tiles"].clear()
+
+        self.assertTrue(area_edited_since("plots", self.tile, since))
+        self.assertTrue(
+            area_edited_since("plots", {"x": 4155, "y": 2819, "zoom": 13}, since)
+        )
+        self.assertFalse(area_edited_since("plots", self.tile, time.time_ns()))
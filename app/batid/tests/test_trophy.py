@@ -2,7 +2,7 @@ import datetime
 import uuid
 from unittest import mock
 
-from batid.models import City, SummerChallenge, Trophy
+from batid.models import City, SummerChallenge, Trophy, TrophyProgress
 from batid.tests.factories.users import ContributorUserFactory
 from django.test import TestCase
 
@@ -308,3 +308,63 @@ class TestTrophyCheckAndAwardAll(TestCase):
         _add_validations(other, 5)
         _add_validations(self.user, 1)
         self.assertEqual(Trophy.check_and_award_all(self.user), [])
+
+
+class TestTrophyProgress(TestCase):
+    def setUp(self):
+        self.user = ContributorUserFactory(username="progress")
+        self.city = City.objects.create(code_insee="38185", name="Grenoble")
+
+    def progress(self):
+        return TrophyProgress.objects.get(user=self.user)
+
+    def test_validations_are_counted(self):
+        """Input: 2 validations in a city, 1 without city, 1 creation. Expected: 3
+        validations on a single day, in a single city."""
+        _add_validation_in_city(self.user, self.city)
+        _add_validation_in_city(self.user, self.city)
+        _add_validations(self.user, 1)
+        SummerChallenge.objects.create(
+            user=self.user,
+            action="creation",
+            rnb_id="RNBTESTID000",
+            event_id=uuid.uuid4(),
+        )
+
+        progress = self.progress()
+        self.assertEqual(progress.validations, 3)
+        self.assertEqual(len(progress.validation_days), 1)
+        self.assertListEqual(progress.validation_cities, ["38185"])
+
+    def test_days_are_in_paris_time(self):
+        """Input: validations at 23:30 UTC on June 1st (June 2nd in Paris) and at noon
+        UTC on June 1st. Expected: June 1st and June 2nd, once each."""
+        late = datetime.datetime(2026, 6, 1, 23, 30, tzinfo=datetime.timezone.utc)
+        _add_validation_on(self.user, late)
+        _add_validation_on(self.user, NOON_UTC)
+        _add_validation_on(self.user, NOON_UTC)
+
+        self.assertListEqual(
+            sorted(self.progress().validation_days),
+            [datetime.date(2026, 6, 1), datetime.date(2026, 6, 2)],
+        )
+
+    def test_deleted_validation(self):
+        """Input: 2 validations, one is deleted. Expected: 1 validation left."""
+        _add_validation_in_city(self.user, self.city)
+        _add_validations(self.user, 1)
+
+        SummerChallenge.objects.filter(city=self.city).delete()
+
+        progress = self.progress()
+        self.assertEqual(progress.validations, 1)
+        self.assertListEqual(progress.validation_cities, [])
+
+    def test_leaderboard(self):
+        """Input: the user has 3 validations, another one 2. Expected: the user leads."""
+        other = ContributorUserFactory(username="second")
+        _add_validations(self.user, 3)
+        _add_validations(other, 2)
+
+        top = TrophyProgress.objects.order_by("-validations").first()
+        self.assertEqual(top.user_id, self.user.id)
@@ -0,0 +1,144 @@
+import queue
+import threading
+from typing import IO, Callable, Optional
+
+from django.conf import settings
+from django.db import connection
+
+
+class CopyCancelled(Exception):
+    pass
+
+
+class ConcurrencyLimit:
+    """
+    Count the running jobs of the process against a limit read in the settings.
+    """
+
+    def __init__(self, setting_name: str):
+        self.setting_name = setting_name
+        self.running = 0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self.lock:
+            if self.running >= getattr(settings, self.setting_name):
+                return False
+            self.running += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.running -= 1
+
+
+_END = object()
+
+
+class CopyStream:
+    """
+    Iterator over the output of COPY ... TO STDOUT queries.
+
+    The `copy` function is called with a cursor and a file-like object to give to
+    cursor.copy_expert(). It runs in a dedicated thread, with its own database
+    connection, once the iteration has started.
+    At most `max_chunks` chunks of data are waiting to be read: the queries are paused
+    while the client is slow to download (backpressure).
+
+    `on_close` is called once, when the iteration is over or the stream is closed.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(
+        self,
+        copy: Callable[[object, IO], None],
+        on_close: Optional[Callable[[], None]] = None,
+        max_chunks: int = 16,
+    ):
+        self.copy = copy
+        self.on_close = on_close
+
+        self.queue: queue.Queue = queue.Queue(maxsize=max_chunks)
+        self.cancelled = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+
+        self.buffer = bytearray()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self.closed:
+            raise StopIteration
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._produce, daemon=True)
+            self.thread.start()
+
+        item = self.queue.get()
+
+        if item is _END:
+            self.close()
+            raise StopIteration
+
+        if isinstance(item, BaseException):
+            self.close()
+            raise item
+
+        return item
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.closed = True
+        # stops the producer, if still running
+        self.cancelled.set()
+
+        if self.on_close is not None:
+            self.on_close()
+
+    def __del__(self):
+        self.close()
+
+    # file-like interface given to copy_expert, called in the producer thread
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        self.buffer += data
+        if len(self.buffer) >= self.CHUNK_SIZE:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        if self.buffer:
+            chunk = bytes(self.buffer)
+            self.buffer.clear()
+            if not self._put(chunk):
+                # aborts the COPY
+                raise CopyCancelled()
+
+    def _put(self, item) -> bool:
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            with connection.cursor() as cursor:
+                self.copy(cursor, self)
+            self._flush_buffer()
+            self._put(_END)
+        except CopyCancelled:
+            pass
+        except Exception as e:
+            self._put(e)
+        finally:
+            # Django connections are per thread
+            connection.close()
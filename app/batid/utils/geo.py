@@ -1,3 +1,4 @@
+import math
 from typing import List
 
 from batid.exceptions import (
@@ -219,3 +220,44 @@ def drop_z(coords):
     if isinstance(coords[0], (float, int)):
         return coords[:2]  # (x, y, z) -> (x, y)
     return [drop_z(c) for c in coords]
+
+
+# Lower bound of the length of one degree of latitude on the WGS84 ellipsoid (meters)
+MIN_METERS_PER_LAT_DEGREE = 110_574
+# Length of one degree of longitude at the equator on the WGS84 ellipsoid (meters)
+METERS_PER_LNG_DEGREE_AT_EQUATOR = 111_319
+# The bbox deltas only have to be conservative, we take a margin
+DWITHIN_BBOX_MARGIN = 1.1
+
+
+def dwithin_bbox_deltas(geom: GEOSGeometry, radius: float) -> tuple[float, float]:
+    """
+    Return the (dx, dy) degrees to expand the bbox of a WGS84 geometry with, so the expanded
+    bbox contains every point closer than `radius` meters to the geometry.
+
+    It is used as an index friendly prefilter (shape && ST_Expand(geom, dx, dy)) before
+    computing the exact metric distance with ST_DWithin on geographies.
+    """
+    radius = radius * DWITHIN_BBOX_MARGIN
+
+    dy = radius / MIN_METERS_PER_LAT_DEGREE
+
+    _, ymin, _, ymax = geom.extent
+    max_lat = min(max(abs(ymin), abs(ymax)) + dy, 89.0)
+    dx = radius / (METERS_PER_LNG_DEGREE_AT_EQUATOR * math.cos(math.radians(max_lat)))
+
+    return dx, dy
+
+
+def dwithin_bbox_sql(geom_sql: str, radius: float) -> str:
+    """
+    SQL version of dwithin_bbox_deltas(): the expanded bbox of a geometry column or expression.
+    eg: "b.shape && " + dwithin_bbox_sql("c.shape", 3)
+    """
+    radius = float(radius) * DWITHIN_BBOX_MARGIN
+
+    dy = radius / MIN_METERS_PER_LAT_DEGREE
+    max_lat = f"least(greatest(abs(ST_YMin({geom_sql})), abs(ST_YMax({geom_sql}))) + {dy}, 89.0)"
+    dx = f"{radius} / ({METERS_PER_LNG_DEGREE_AT_EQUATOR} * cos(radians({max_lat})))"
+
+    return f"ST_Expand({geom_sql}, {dx}, {dy})"
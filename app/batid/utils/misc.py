@@ -1,4 +1,6 @@
-from collections.abc import Iterable
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Callable
 
 
@@ -35,3 +37,32 @@ def ext_ids_equal(ext_ids1: list[dict], ext_ids2: list[dict]) -> bool:
     ext_ids2_str = sorted(_ext_id_to_str(ext_id) for ext_id in ext_ids2)
 
     return ext_ids1_str == ext_ids2_str
+
+
+_END = object()
+
+
+def map_in_threads(func: Callable, items: Iterator, workers: int) -> Iterator:
+    """
+    Lazy and ordered map of func over the items, run by a pool of threads.
+    At most 2 items per worker are in flight, so the items are never all in memory.
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight: deque = deque()
+
+        while True:
+            while len(in_flight) < workers * 2:
+                item = next(items, _END)
+                if item is _END:
+                    break
+                in_flight.append(executor.submit(func, item))
+
+            if not in_flight:
+                return
+
+            yield in_flight.popleft().result()